@@ -0,0 +1,108 @@
+"""
+Speech recognition backends behind transcribe_audio_multilingual.
+
+- azure: the Azure OpenAI Whisper deployment (default)
+- local: int8-quantized faster-whisper on the CPU, for offline operation
+
+VOICERX_ASR_BACKEND selects the backend. The local model is loaded once per
+process and shared by every session (clients.get_local_asr_model). It is
+tuned with:
+- VOICERX_LOCAL_ASR_MODEL: model size or path (default small)
+- VOICERX_LOCAL_ASR_COMPUTE: CTranslate2 compute type (default int8)
+- VOICERX_LOCAL_ASR_THREADS: CPU threads per decode (default 4)
+- VOICERX_LOCAL_ASR_WORKERS: decodes that may run concurrently (default 2)
+- VOICERX_LOCAL_ASR_BATCH: segments decoded per batch (default 8)
+"""
+import io
+import os
+from typing import List, Optional, Tuple
+
+import metrics
+from clients import WHISPER_API_VERSION, get_whisper_client, get_local_asr_model, local_asr_config
+from rate_limit import limited_call
+
+
+class AzureWhisperBackend:
+    """Whisper hosted on Azure OpenAI"""
+
+    name = "azure"
+
+    def __init__(self):
+        self.client = get_whisper_client()
+
+    def cache_identity(self) -> List[str]:
+        return ["whisper", WHISPER_API_VERSION]
+
+    def transcribe(self, filename: str, audio_bytes: bytes) -> Tuple[str, str]:
+        """Transcript in the spoken language, plus the detected language"""
+        result = limited_call(
+            "whisper", self.client.audio.transcriptions.create,
+            file=(filename, audio_bytes),
+            model="whisper",
+            response_format="verbose_json",  # Get detailed response with language detection
+            temperature=0.1  # Lower temperature for more consistent results
+        )
+        metrics.record_audio(getattr(result, 'duration', None), len(audio_bytes))
+        return result.text, result.language if hasattr(result, 'language') else 'unknown'
+
+    def translate(self, filename: str, audio_bytes: bytes) -> str:
+        """English translation of the audio"""
+        result = limited_call(
+            "whisper", self.client.audio.translations.create,
+            file=(filename, audio_bytes),
+            model="whisper",
+            response_format="verbose_json",  # Includes the billed duration
+            temperature=0.1
+        )
+        metrics.record_audio(getattr(result, 'duration', None), len(audio_bytes))
+        return result.text
+
+
+class LocalWhisperBackend:
+    """faster-whisper running in-process; no network calls"""
+
+    name = "local"
+
+    def __init__(self):
+        self.config = local_asr_config()
+        self.model = get_local_asr_model()
+
+    def cache_identity(self) -> List[str]:
+        return ["faster-whisper", self.config['model'], self.config['compute_type']]
+
+    def _decode(self, audio_bytes: bytes, task: str) -> Tuple[str, str]:
+        segments, info = self.model.transcribe(
+            io.BytesIO(audio_bytes),
+            task=task,
+            batch_size=self.config['batch_size'],
+            temperature=0.1,
+            without_timestamps=True
+        )
+        # segments is a lazy generator; decoding happens while joining
+        text = " ".join(segment.text.strip() for segment in segments)
+        metrics.record_audio(info.duration, billed=False)
+        return text, info.language
+
+    def transcribe(self, filename: str, audio_bytes: bytes) -> Tuple[str, str]:
+        return self._decode(audio_bytes, "transcribe")
+
+    def translate(self, filename: str, audio_bytes: bytes) -> str:
+        return self._decode(audio_bytes, "translate")[0]
+
+
+BACKENDS = {
+    'azure': AzureWhisperBackend,
+    'local': LocalWhisperBackend,
+}
+
+
+def asr_backend_name() -> str:
+    return os.getenv("VOICERX_ASR_BACKEND", "azure").lower()
+
+
+def get_asr_backend(name: Optional[str] = None):
+    """Backend instance for name (default: VOICERX_ASR_BACKEND)"""
+    name = name or asr_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{name}'; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,100 @@
+"""
+Split long recordings at pauses so they can be transcribed in parallel.
+
+A single Whisper request is limited to 25 MB and transcribes its audio
+serially. Long doctor dictations are instead cut into segments of at most
+VOICERX_CHUNK_SECONDS, each cut placed at the quietest stretch (a pause
+between phrases) in the second half of the window. Neighbouring segments
+overlap slightly so no word is lost at a cut; the duplicated words are
+removed again when the segment transcripts are stitched together.
+
+Settings:
+- VOICERX_CHUNK_SECONDS: maximum segment length; longer recordings are chunked (default 120)
+- VOICERX_CHUNK_OVERLAP: seconds of audio shared by neighbouring segments (default 1.0)
+- VOICERX_CHUNK_MAX_MB: recordings larger than this are chunked regardless of length (default 24)
+- VOICERX_CHUNK_WORKERS: segments transcribed concurrently (default 4)
+"""
+import io
+import os
+import re
+import wave
+from typing import List, Tuple
+
+import numpy as np
+
+from audio_preprocess import _EPS, _moving_average
+
+_WORD = re.compile(r"[^\w']+")
+
+
+def chunk_settings() -> dict:
+    return {
+        'segment_seconds': float(os.getenv("VOICERX_CHUNK_SECONDS", "120")),
+        'overlap_seconds': float(os.getenv("VOICERX_CHUNK_OVERLAP", "1.0")),
+        'max_bytes': int(float(os.getenv("VOICERX_CHUNK_MAX_MB", "24")) * 1024 * 1024),
+        'workers': int(os.getenv("VOICERX_CHUNK_WORKERS", "4")),
+    }
+
+
+def wav_duration(data: bytes) -> float:
+    """Duration from the WAV header without decoding; 0.0 if data is not WAV"""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return 0.0
+
+
+def needs_chunking(data: bytes, settings: dict) -> bool:
+    return len(data) > settings['max_bytes'] or wav_duration(data) > settings['segment_seconds']
+
+
+def find_segments(samples: np.ndarray, rate: int, segment_seconds: float,
+                  overlap_seconds: float, frame_ms: int = 30) -> List[Tuple[int, int]]:
+    """
+    Sample ranges (start, end) covering the recording. Each cut is placed at
+    the lowest-energy frame in the second half of its window, and segments
+    extend overlap_seconds / 2 past the cut on either side.
+    """
+    total = len(samples)
+    window = int(segment_seconds * rate)
+    if total <= window:
+        return [(0, total)]
+
+    frame = int(rate * frame_ms / 1000)
+    n_frames = total // frame
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    level = 10 * np.log10((frames ** 2).mean(axis=1) + _EPS)
+    # Smooth over ~300 ms so cuts land in pauses, not between syllables
+    level = _moving_average(level, max(1, 300 // frame_ms), axis=0)
+
+    half_overlap = int(overlap_seconds * rate / 2)
+    segments = []
+    start = 0
+    while total - start > window:
+        low = (start + window // 2) // frame
+        high = max(low + 1, min((start + window - half_overlap) // frame, n_frames))
+        cut = (low + int(np.argmin(level[low:high]))) * frame + frame // 2
+        segments.append((start, min(total, cut + half_overlap)))
+        start = max(0, cut - half_overlap)
+    segments.append((start, total))
+    return segments
+
+
+def _words_match(left: List[str], right: List[str]) -> bool:
+    return [_WORD.sub("", w.lower()) for w in left] == [_WORD.sub("", w.lower()) for w in right]
+
+
+def stitch_transcripts(texts: List[str], max_overlap_words: int = 12) -> str:
+    """
+    Join segment transcripts in order, dropping words at the start of each
+    segment that repeat the end of the previous one (case and punctuation
+    are ignored when comparing).
+    """
+    words: List[str] = []
+    for text in texts:
+        new = text.split()
+        limit = min(max_overlap_words, len(words), len(new))
+        overlap = next((k for k in range(limit, 0, -1) if _words_match(words[-k:], new[:k])), 0)
+        words.extend(new[overlap:])
+    return " ".join(words)
@@ -0,0 +1,232 @@
+"""
+Local audio preprocessing before upload to Whisper.
+
+Browser recordings arrive as uncompressed WAV with long silences and
+background (fan) noise. Before upload, each recording is:
+
+1. decoded and downmixed to mono
+2. resampled to 16 kHz, the rate Whisper works at internally
+3. denoised with spectral gating (noise profile from the quietest frames)
+4. trimmed of leading, trailing and long internal silences (energy VAD)
+5. optionally compressed to FLAC or Opus
+
+All stages are vectorized NumPy. FLAC/Opus encoding needs the optional
+soundfile package; without it the output stays 16-bit WAV.
+
+Settings:
+- VOICERX_PREPROCESS: 1 to enable (default), 0 to upload the raw recording
+- VOICERX_PREPROCESS_COMPRESS: flac (default), opus or wav
+"""
+import io
+import logging
+import os
+import wave
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # optional: only needed for FLAC/Opus output
+    soundfile = None
+
+logger = logging.getLogger(__name__)
+
+TARGET_RATE = 16000
+_EPS = 1e-10
+
+
+def preprocess_settings() -> dict:
+    return {
+        'enabled': os.getenv("VOICERX_PREPROCESS", "1") != "0",
+        'compress': os.getenv("VOICERX_PREPROCESS_COMPRESS", "flac").lower(),
+        'rate': TARGET_RATE,
+    }
+
+
+def decode_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """Decode PCM WAV bytes to mono float32 samples in [-1, 1]"""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16))
+        samples = ((ints << 8) >> 8).astype(np.float32) / 8388608
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def resample(samples: np.ndarray, rate: int, target_rate: int = TARGET_RATE) -> np.ndarray:
+    """Band-limit in the frequency domain, then interpolate onto the target grid"""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < rate:
+        # Zero-pad to a power of two: FFTs of long prime-ish lengths are slow
+        n_fft = 1 << (len(samples) - 1).bit_length()
+        spectrum = np.fft.rfft(samples, n=n_fft)
+        cutoff = int(len(spectrum) * (target_rate / 2) / (rate / 2) * 0.95)
+        spectrum[cutoff:] = 0
+        samples = np.fft.irfft(spectrum, n=n_fft)[:len(samples)].astype(np.float32)
+    duration = len(samples) / rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    source_times = np.arange(len(samples)) / rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def _moving_average(values: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Centered box filter along one axis, via cumulative sums"""
+    if size <= 1:
+        return values
+    moved = np.moveaxis(values, axis, 0)
+    padded = np.pad(moved, [(size // 2, size - 1 - size // 2)] + [(0, 0)] * (moved.ndim - 1), mode="edge")
+    sums = np.concatenate([np.zeros_like(padded[:1], dtype=np.float64), np.cumsum(padded, axis=0, dtype=np.float64)])
+    averaged = (sums[size:] - sums[:-size]) / size
+    return np.moveaxis(averaged.astype(np.float32), 0, axis)
+
+
+def _stft(samples: np.ndarray, n_fft: int, hop: int) -> np.ndarray:
+    padded = np.pad(samples, (n_fft // 2, n_fft))
+    n_frames = 1 + (len(padded) - n_fft) // hop
+    frames = np.lib.stride_tricks.as_strided(
+        padded, shape=(n_frames, n_fft), strides=(padded.strides[0] * hop, padded.strides[0])
+    )
+    return np.fft.rfft(frames * np.hanning(n_fft).astype(np.float32), axis=1)
+
+
+def _istft(spectrum: np.ndarray, n_fft: int, hop: int, length: int) -> np.ndarray:
+    """Weighted overlap-add; hop must divide n_fft"""
+    window = np.hanning(n_fft).astype(np.float32)
+    frames = np.fft.irfft(spectrum, n=n_fft, axis=1) * window
+    n_frames, overlap = len(frames), n_fft // hop
+    out = np.zeros((n_frames + overlap - 1) * hop, dtype=np.float32)
+    norm = np.zeros_like(out)
+    blocks = frames.reshape(n_frames, overlap, hop)
+    window_blocks = (window ** 2).reshape(overlap, hop)
+    for k in range(overlap):
+        out[k * hop:k * hop + n_frames * hop] += blocks[:, k, :].reshape(-1)
+        norm[k * hop:k * hop + n_frames * hop] += np.tile(window_blocks[k], n_frames)
+    out /= np.maximum(norm, _EPS)
+    start = n_fft // 2
+    return out[start:start + length]
+
+
+def spectral_gate(samples: np.ndarray, rate: int, n_std: float = 1.5, reduction_db: float = 18.0) -> np.ndarray:
+    """
+    Stationary spectral gating: estimate a per-frequency noise threshold
+    from the quietest 10% of frames and attenuate bins below it.
+    """
+    n_fft = 512 if rate <= 16000 else 1024
+    hop = n_fft // 4
+    if len(samples) < n_fft * 4:
+        return samples
+
+    spectrum = _stft(samples, n_fft, hop)
+    db = 20 * np.log10(np.abs(spectrum) + _EPS)
+    frame_level = db.mean(axis=1)
+    noise_frames = db[frame_level <= np.percentile(frame_level, 10)]
+    threshold = noise_frames.mean(axis=0) + n_std * noise_frames.std(axis=0)
+
+    mask = (db > threshold).astype(np.float32)
+    # Smooth over ~50 ms and a few bins so the gate does not "chirp"
+    mask = _moving_average(mask, max(1, int(0.05 * rate / hop)), axis=0)
+    mask = _moving_average(mask, 3, axis=1)
+    floor = 10 ** (-reduction_db / 20)
+    spectrum *= floor + (1 - floor) * mask
+    return _istft(spectrum, n_fft, hop, len(samples))
+
+
+def trim_silence(samples: np.ndarray, rate: int, frame_ms: int = 30,
+                 keep_pause_ms: int = 300, margin_db: float = 12.0) -> np.ndarray:
+    """
+    Energy VAD: drop leading/trailing silence and shorten internal pauses to
+    at most 2 * keep_pause_ms. Returns the input unchanged if no speech is found.
+    """
+    frame = int(rate * frame_ms / 1000)
+    n_frames = len(samples) // frame
+    if n_frames < 3:
+        return samples
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    level = 10 * np.log10((frames ** 2).mean(axis=1) + _EPS)
+    threshold = max(np.percentile(level, 10) + margin_db, level.max() - 50)
+    speech = level > threshold
+    if not speech.any():
+        return samples
+
+    # Keep keep_pause_ms of context either side of each speech frame
+    hangover = max(1, keep_pause_ms // frame_ms)
+    keep = np.convolve(speech.astype(np.int32), np.ones(2 * hangover + 1, dtype=np.int32), mode="same") > 0
+    trimmed = frames[keep].reshape(-1)
+    tail = samples[n_frames * frame:]
+    return np.concatenate([trimmed, tail]) if keep[-1] else trimmed
+
+
+def encode(samples: np.ndarray, rate: int, compress: str) -> Tuple[bytes, str]:
+    """Encode mono float samples; returns (bytes, file extension)"""
+    buffer = io.BytesIO()
+    if compress in ("flac", "opus") and soundfile is not None:
+        if compress == "flac":
+            soundfile.write(buffer, samples, rate, format="FLAC", subtype="PCM_16")
+            return buffer.getvalue(), "flac"
+        soundfile.write(buffer, samples, rate, format="OGG", subtype="OPUS")
+        return buffer.getvalue(), "ogg"
+    if compress in ("flac", "opus"):
+        logger.warning(f"soundfile is not installed; uploading WAV instead of {compress}")
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue(), "wav"
+
+
+def process_samples(samples: np.ndarray, rate: int, compress: str, clean: bool = True) -> Tuple[bytes, str, float]:
+    """
+    Resample, optionally denoise and trim, then encode decoded samples.
+    Returns (encoded bytes, file extension, seconds of audio kept).
+    """
+    samples = resample(samples, rate, TARGET_RATE)
+    if clean:
+        samples = spectral_gate(samples, TARGET_RATE)
+        samples = trim_silence(samples, TARGET_RATE)
+    output, extension = encode(samples, TARGET_RATE, compress)
+    return output, extension, len(samples) / TARGET_RATE
+
+
+def preprocess_audio(data: bytes, compress: str = "flac") -> Tuple[bytes, str, dict]:
+    """
+    Run the full preprocessing chain on WAV bytes.
+    Returns (processed bytes, file extension, report).
+    """
+    samples, rate = decode_wav(data)
+    seconds_in = len(samples) / rate if rate else 0.0
+    output, extension, seconds_out = process_samples(samples, rate, compress)
+    return output, extension, build_report(len(data), len(output), seconds_in, seconds_out, extension)
+
+
+def build_report(bytes_in: int, bytes_out: int, seconds_in: float, seconds_out: float, extension: str) -> dict:
+    return {
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'bytes_saved': bytes_in - bytes_out,
+        'seconds_in': round(seconds_in, 2),
+        'seconds_out': round(seconds_out, 2),
+        'seconds_trimmed': round(max(0.0, seconds_in - seconds_out), 2),
+        'format': extension,
+    }
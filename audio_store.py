@@ -0,0 +1,362 @@
+"""
+Storage for consult recordings.
+
+An upload is handed to transcription from memory and written to disk by a
+background thread, so neither the page nor the job waits on the disk:
+- put() returns the recording's final path at once. The bytes stay in
+  memory until written, and after that while they fit in the buffer
+  budget; read() serves them from there before touching the disk. At most
+  VOICERX_AUDIO_QUEUE_MAX recordings wait for the writer; put() blocks
+  beyond that. A write is retried a few times, then the recording is
+  dropped from memory with an error rather than held forever
+- names are content-addressed and never collide: two uploads in the same
+  second get different names unless they are the same recording
+      <folder>/<YYYY-MM-DD>/<user>/<user>_<YYYYmmdd_HHMMSS>_<sha256[:12]>.<ext>
+- recordings are compressed on write: losslessly to FLAC by default, or to
+  16 kHz Opus. Without the optional soundfile package they stay WAV, and
+  read() decodes FLAC / Opus back to WAV for transcription
+- tiering and retention, both off by default: day folders older than
+  VOICERX_AUDIO_COLD_DAYS are re-encoded to Opus, those older than
+  VOICERX_AUDIO_RETENTION_DAYS deleted. The writer applies them every few
+  hours (sweep())
+
+Each write records audio_store.write_seconds, .bytes_in, .bytes_out and
+.write_mb_per_second in metrics.py. stats() adds the disk footprint per
+format; `python audio_store.py` prints it.
+
+Settings:
+- VOICERX_AUDIO_CODEC: flac (default), opus or wav
+- VOICERX_AUDIO_BUFFER_MB: written recordings kept in memory (default 64)
+- VOICERX_AUDIO_QUEUE_MAX: recordings waiting to be written (default 32)
+- VOICERX_AUDIO_COLD_DAYS: days before re-encoding to Opus (default 0: never)
+- VOICERX_AUDIO_RETENTION_DAYS: days before deletion (default 0: never)
+"""
+import atexit
+import io
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import metrics
+from result_cache import audio_fingerprint
+
+try:
+    import soundfile
+except ImportError:  # optional: recordings are stored as WAV
+    soundfile = None
+
+logger = logging.getLogger(__name__)
+
+RECORDING_FOLDERS = ("voice_recordings", "doctors_recordings")
+
+# <user>[_doctor]_<YYYYmmdd_HHMMSS>[_<sha256[:12]>].<ext>; older recordings have no digest
+RECORDING_NAME = re.compile(
+    r"^(?P<user>.+?)(?P<doctor>_doctor)?_(?P<timestamp>\d{8}_\d{6})(?:_(?P<digest>[0-9a-f]{12}))?"
+    r"\.(?P<extension>wav|flac|ogg)$"
+)
+
+EXTENSIONS = {'flac': "flac", 'opus': "ogg", 'wav': "wav"}
+
+_DAY_FORMAT = "%Y-%m-%d"
+_OPUS_RATE = 16000
+_SWEEP_SECONDS = 6 * 3600
+_WRITE_ATTEMPTS = 3
+
+
+def _wav_name(path: str) -> str:
+    return os.path.splitext(path)[0] + ".wav"
+
+
+def _stored_path(path: str) -> Optional[str]:
+    """Where a recording is on disk: as named, or re-encoded (cold tier) or kept as WAV under the same stem"""
+    if os.path.exists(path):
+        return path
+    stem = os.path.splitext(path)[0]
+    for extension in ("wav", "flac", "ogg"):
+        if os.path.exists(f"{stem}.{extension}"):
+            return f"{stem}.{extension}"
+    return None
+
+
+def encode(data: bytes, codec: str) -> bytes:
+    """Re-encode WAV bytes as FLAC (same bit depth) or mono 16 kHz Opus"""
+    info = soundfile.info(io.BytesIO(data))
+    buffer = io.BytesIO()
+    if codec == "flac":
+        samples, rate = soundfile.read(io.BytesIO(data), dtype="int32")
+        subtype = info.subtype if info.subtype in ("PCM_16", "PCM_24") else "PCM_16"
+        soundfile.write(buffer, samples, rate, format="FLAC", subtype=subtype)
+    else:
+        from audio_preprocess import resample
+
+        samples, rate = soundfile.read(io.BytesIO(data), dtype="float32")
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1)
+        soundfile.write(buffer, resample(samples, rate, _OPUS_RATE), _OPUS_RATE, format="OGG", subtype="OPUS")
+    return buffer.getvalue()
+
+
+def decode(data: bytes) -> bytes:
+    """FLAC or Opus bytes as 16-bit WAV"""
+    samples, rate = soundfile.read(io.BytesIO(data), dtype="int16")
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+class AudioStore:
+    """Recordings buffered in memory, written compressed to date/user shards by a background thread"""
+
+    def __init__(self, codec: str = "flac", buffer_bytes: int = 64 * 1024 * 1024, cold_days: int = 0,
+                 retention_days: int = 0, folders: Tuple[str, ...] = RECORDING_FOLDERS, queue_max: int = 32):
+        if codec not in EXTENSIONS:
+            raise ValueError(f"Unknown audio codec: {codec}")
+        if codec != "wav" and soundfile is None:
+            logger.warning(f"soundfile is not installed; storing recordings as WAV instead of {codec}")
+            codec = "wav"
+        self.codec = codec
+        self.buffer_bytes = buffer_bytes
+        self.cold_days = cold_days
+        self.retention_days = retention_days
+        self.folders = folders
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=queue_max)
+        self._buffers: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending = set()
+        self._writer: Optional[threading.Thread] = None
+        self._last_sweep = float("-inf")
+        self._written = {'files': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+
+    @classmethod
+    def from_env(cls) -> "AudioStore":
+        return cls(
+            codec=os.getenv("VOICERX_AUDIO_CODEC", "flac").lower(),
+            buffer_bytes=int(float(os.getenv("VOICERX_AUDIO_BUFFER_MB", "64")) * 1024 * 1024),
+            cold_days=int(os.getenv("VOICERX_AUDIO_COLD_DAYS", "0")),
+            retention_days=int(os.getenv("VOICERX_AUDIO_RETENTION_DAYS", "0")),
+            queue_max=int(os.getenv("VOICERX_AUDIO_QUEUE_MAX", "32"))
+        )
+
+    def put(self, data: bytes, user: str, folder: str, sha256: Optional[str] = None,
+            recorded: Optional[datetime] = None) -> str:
+        """Queue a WAV recording for writing (waiting while the queue is full); returns the path it is stored under"""
+        data = bytes(data)
+        recorded = recorded or datetime.now()
+        # Anything but WAV (or a WAV soundfile can't re-encode) is stored as uploaded
+        extension = EXTENSIONS[self.codec] if data[:4] == b"RIFF" else "wav"
+        name = f"{user}_{recorded:%Y%m%d_%H%M%S}_{(sha256 or audio_fingerprint(data))[:12]}.{extension}"
+        path = os.path.join(folder, recorded.strftime(_DAY_FORMAT), user, name)
+        with self._lock:
+            if path in self._buffers or os.path.exists(path):
+                return path
+            self._buffers[path] = data
+            self._pending.add(path)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="voicerx-audio-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        self._queue.put((path, data))
+        return path
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            if path in self._buffers:
+                return True
+        return _stored_path(path) is not None
+
+    def read(self, path: str) -> Tuple[bytes, str]:
+        """
+        WAV bytes of a recording and a file name for them: from memory when
+        buffered, else from disk, decoding FLAC / Opus when soundfile is installed
+        """
+        with self._lock:
+            data = self._buffers.get(path)
+            if data is not None:
+                self._buffers.move_to_end(path)
+        if data is not None:
+            metrics.incr("audio_store.memory_reads")
+            return data, _wav_name(path)
+
+        path = _stored_path(path) or path
+        with open(path, "rb") as f:
+            data = f.read()
+        metrics.incr("audio_store.disk_reads")
+        if path.endswith(".wav") or soundfile is None:
+            return data, path
+        return decode(data), _wav_name(path)
+
+    def flush(self) -> None:
+        """Wait until every queued recording is on disk"""
+        self._queue.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                path, data = self._queue.get(timeout=_SWEEP_SECONDS)
+            except queue.Empty:
+                path = None
+            if path is not None:
+                try:
+                    self._write_retrying(path, data)
+                finally:
+                    self._queue.task_done()
+            if ((self.cold_days or self.retention_days) and self._queue.empty()
+                    and time.monotonic() - self._last_sweep >= _SWEEP_SECONDS):
+                self._last_sweep = time.monotonic()
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"Audio retention sweep failed: {str(e)}")
+
+    def _write_retrying(self, path: str, data: bytes) -> None:
+        """Write with a few retries; a recording that still fails is dropped from memory, not kept forever"""
+        for attempt in range(_WRITE_ATTEMPTS):
+            # One bad recording must not stop the writer: later ones would never be written, and flush() would hang
+            try:
+                self._write(path, data)
+                return
+            except Exception as e:
+                metrics.incr("audio_store.write_failed")
+                error = e
+                if attempt + 1 < _WRITE_ATTEMPTS:
+                    logger.warning(f"Writing recording {path} failed, retry {attempt + 1}: {str(e)}")
+                    time.sleep(2 ** attempt)
+        metrics.incr("audio_store.dropped")
+        logger.error(f"Writing recording {path} failed {_WRITE_ATTEMPTS} times, dropping it: {str(error)}")
+        with self._lock:
+            self._pending.discard(path)
+            self._buffers.pop(path, None)
+
+    def _write(self, path: str, data: bytes) -> None:
+        started = time.perf_counter()
+        encoded, target = data, path
+        if not path.endswith(".wav"):
+            try:
+                encoded = encode(data, self.codec)
+            except Exception as e:
+                # Kept under the same stem, where read() and exists() find it
+                logger.warning(f"Could not encode {os.path.basename(path)} as {self.codec}, storing WAV: {str(e)}")
+                target = _wav_name(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f"{target}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(encoded)
+        os.replace(temporary, target)
+
+        seconds = time.perf_counter() - started
+        metrics.incr("audio_store.files")
+        metrics.observe("audio_store.write_seconds", seconds)
+        metrics.observe("audio_store.bytes_in", len(data))
+        metrics.observe("audio_store.bytes_out", len(encoded))
+        metrics.observe("audio_store.write_mb_per_second", len(data) / 1e6 / max(seconds, 1e-9))
+        with self._lock:
+            self._pending.discard(path)
+            for key, value in (('files', 1), ('bytes_in', len(data)), ('bytes_out', len(encoded)), ('seconds', seconds)):
+                self._written[key] += value
+            # Written recordings stay buffered, oldest dropped first, within the budget
+            buffered = sum(len(value) for value in self._buffers.values())
+            for buffered_path in list(self._buffers):
+                if buffered <= self.buffer_bytes:
+                    break
+                if buffered_path not in self._pending:
+                    buffered -= len(self._buffers.pop(buffered_path))
+
+    def sweep(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Re-encode cold day folders to Opus and delete expired ones; returns what was done"""
+        now = now or datetime.now()
+        report = {'deleted_files': 0, 'deleted_bytes': 0, 'cold_files': 0, 'cold_bytes_saved': 0}
+        for folder in self.folders:
+            for day in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+                try:
+                    age = (now - datetime.strptime(day, _DAY_FORMAT)).days
+                except ValueError:
+                    continue  # recordings from before sharding
+                day_dir = os.path.join(folder, day)
+                if self.retention_days and age >= self.retention_days:
+                    for root, _, names in os.walk(day_dir):
+                        report['deleted_files'] += len(names)
+                        report['deleted_bytes'] += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+                    shutil.rmtree(day_dir)
+                elif self.cold_days and age >= self.cold_days and soundfile is not None:
+                    for root, _, names in os.walk(day_dir):
+                        for name in names:
+                            if name.endswith((".wav", ".flac")):
+                                report['cold_bytes_saved'] += self._make_cold(os.path.join(root, name))
+                                report['cold_files'] += 1
+        if any(report.values()):
+            logger.info("Audio retention sweep: " + ", ".join(f"{key} {value}" for key, value in report.items()))
+            for key, value in report.items():
+                metrics.incr(f"audio_store.{key}", value)
+        return report
+
+    def _make_cold(self, path: str) -> int:
+        """Re-encode one recording as Opus in place; returns bytes saved"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if not path.endswith(".wav"):
+            data = decode(data)
+        target = os.path.splitext(path)[0] + ".ogg"
+        encoded = encode(data, "opus")
+        with open(f"{target}.tmp", "wb") as f:
+            f.write(encoded)
+        os.replace(f"{target}.tmp", target)
+        saved = os.path.getsize(path) - len(encoded)
+        os.remove(path)
+        return saved
+
+    def stats(self) -> dict:
+        """Writes so far and throughput, plus recordings and bytes on disk per format"""
+        with self._lock:
+            written = dict(self._written)
+            buffered = len(self._buffers)
+        footprint: Dict[str, dict] = {}
+        for folder in self.folders:
+            for root, _, names in os.walk(folder):
+                for name in names:
+                    match = RECORDING_NAME.match(name)
+                    if match:
+                        usage = footprint.setdefault(match.group('extension'), {'files': 0, 'bytes': 0})
+                        usage['files'] += 1
+                        usage['bytes'] += os.path.getsize(os.path.join(root, name))
+        return dict(
+            written,
+            mb_per_second=written['bytes_in'] / 1e6 / written['seconds'] if written['seconds'] else 0.0,
+            compression_ratio=written['bytes_in'] / written['bytes_out'] if written['bytes_out'] else 0.0,
+            queued=self._queue.qsize(),
+            buffered=buffered,
+            footprint=footprint
+        )
+
+
+_store: Optional[AudioStore] = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store() -> AudioStore:
+    """Process-wide store, shared by the app and its background jobs"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AudioStore.from_env()
+        return _store
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Disk footprint of stored recordings")
+    parser.add_argument("--sweep", action="store_true", help="apply the tiering and retention policy first")
+    args = parser.parse_args()
+
+    store = AudioStore.from_env()
+    if args.sweep:
+        print(json.dumps(store.sweep(), indent=2))
+    print(json.dumps(store.stats()['footprint'], indent=2))
@@ -0,0 +1,209 @@
+"""
+Batch-process archived consult recordings without the UI.
+
+    python batch_cli.py --output batch_output --parallel 8 --rate 30
+
+Patient recordings (<user>_<YYYYmmdd_HHMMSS>[_<digest>].<wav|flac|ogg>
+anywhere under voice_recordings/, including the audio store's date/user
+shards) are paired with doctor recordings (<user>_doctor_... under
+doctors_recordings/): each doctor recording goes with the same user's
+latest patient recording made before it, within --max-gap minutes. Every
+consult runs through pipeline.run_consult_async; --parallel bounds how many
+run at once and --rate how many start per minute.
+
+Each consult is written to <output>/<user>_<patient timestamp>/ as note.md
+and analysis.json. A consult whose analysis.json exists is skipped, so an
+interrupted run resumes where it stopped. A consult whose transcription,
+disease extraction or clinical note failed writes no analysis.json and is
+retried on the next run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from audio_store import RECORDING_NAME
+from pipeline import run_consult_async
+from processing import NOTE_FAILED, TRANSCRIPTION_FAILED
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+@dataclass
+class Consult:
+    user: str
+    timestamp: datetime
+    patient_audio: str
+    doctor_audio: Optional[str] = None
+
+    @property
+    def consult_id(self) -> str:
+        return f"{self.user}_{self.timestamp.strftime(TIMESTAMP_FORMAT)}"
+
+
+def _recordings(folder: str, doctor: bool) -> Dict[str, List[tuple]]:
+    """{user: [(timestamp, path), ...]} sorted by timestamp"""
+    found: Dict[str, List[tuple]] = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            match = RECORDING_NAME.match(name)
+            if not match or bool(match.group('doctor')) != doctor:
+                continue
+            try:
+                timestamp = datetime.strptime(match.group('timestamp'), TIMESTAMP_FORMAT)
+            except ValueError:
+                logger.warning(f"Skipping {name}: invalid timestamp")
+                continue
+            found.setdefault(match.group('user'), []).append((timestamp, os.path.join(root, name)))
+    for items in found.values():
+        items.sort()
+    return found
+
+
+def pair_recordings(patient_dir: str, doctor_dir: str, max_gap: timedelta) -> List[Consult]:
+    """Pair each doctor recording with the latest earlier unpaired patient recording of the same user"""
+    patients = _recordings(patient_dir, doctor=False)
+    doctors = _recordings(doctor_dir, doctor=True)
+    consults = []
+    for user, recordings in patients.items():
+        user_consults = [Consult(user, timestamp, path) for timestamp, path in recordings]
+        for doctor_time, doctor_path in doctors.get(user, []):
+            candidates = [c for c in user_consults
+                          if c.doctor_audio is None and c.timestamp <= doctor_time <= c.timestamp + max_gap]
+            if candidates:
+                candidates[-1].doctor_audio = doctor_path
+            else:
+                logger.warning(f"No patient recording for {os.path.basename(doctor_path)}")
+        consults += user_consults
+    return sorted(consults, key=lambda c: (c.timestamp, c.user))
+
+
+class StartRateLimiter:
+    """Spaces consult starts so at most per_minute begin in any minute"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def _failed_stage(results: dict) -> Optional[str]:
+    """First stage that returned its failure placeholder instead of a result"""
+    for stage in ('patient_transcription', 'doctor_transcription'):
+        if stage in results and results[stage]['original_text'] == TRANSCRIPTION_FAILED:
+            return stage
+    if results.get('patient_analysis', {}).get('failed'):
+        return 'patient_analysis'
+    if results.get('clinical_note', '').endswith(NOTE_FAILED):
+        return 'clinical_note'
+    return None
+
+
+async def process_consult(consult: Consult, output_dir: str, semaphore: asyncio.Semaphore,
+                          limiter: StartRateLimiter) -> str:
+    """Run one consult and write its outputs; returns 'done', 'skipped' or 'failed'"""
+    consult_dir = os.path.join(output_dir, consult.consult_id)
+    analysis_path = os.path.join(consult_dir, "analysis.json")
+    if os.path.exists(analysis_path):
+        return "skipped"
+
+    async with semaphore:
+        await limiter.wait()
+        try:
+            results = await run_consult_async(consult.patient_audio, consult.doctor_audio, consult.user)
+        except Exception as e:
+            logger.error(f"Consult {consult.consult_id} failed: {str(e)}")
+            return "failed"
+
+    failed = _failed_stage(results)
+    if failed:
+        # Leave no analysis.json so the consult is retried on the next run
+        logger.error(f"Consult {consult.consult_id} failed at {failed}")
+        return "failed"
+
+    os.makedirs(consult_dir, exist_ok=True)
+    if results.get('clinical_note'):
+        _write_atomic(os.path.join(consult_dir, "note.md"), results['clinical_note'])
+    analysis = dict(
+        {key: value for key, value in results.items() if key != 'clinical_note'},
+        patient_audio=consult.patient_audio,
+        doctor_audio=consult.doctor_audio
+    )
+    # Written last: its presence marks the consult as done
+    _write_atomic(analysis_path, json.dumps(analysis, indent=2, default=str))
+    return "done"
+
+
+async def run_batch(consults: List[Consult], output_dir: str, parallel: int, rate: float) -> Dict[str, int]:
+    semaphore = asyncio.Semaphore(parallel)
+    limiter = StartRateLimiter(rate)
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    tasks = [asyncio.create_task(process_consult(c, output_dir, semaphore, limiter)) for c in consults]
+    for finished, task in enumerate(asyncio.as_completed(tasks), 1):
+        counts[await task] += 1
+        elapsed = time.perf_counter() - started
+        if counts['done']:
+            logger.info(f"{finished}/{len(consults)} consults, {counts['done'] / elapsed * 60:.1f} consults/min")
+
+    counts['seconds'] = time.perf_counter() - started
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patient-dir", default="voice_recordings")
+    parser.add_argument("--doctor-dir", default="doctors_recordings")
+    parser.add_argument("--output", default="batch_output")
+    parser.add_argument("--parallel", type=int, default=4, help="consults processed at once")
+    parser.add_argument("--rate", type=float, default=0, help="max consults started per minute (0: no limit)")
+    parser.add_argument("--max-gap", type=float, default=60, help="max minutes between patient and doctor recording")
+    parser.add_argument("--patient-only", action="store_true", help="also process patient recordings without a doctor recording")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    consults = pair_recordings(args.patient_dir, args.doctor_dir, timedelta(minutes=args.max_gap))
+    if not args.patient_only:
+        consults = [c for c in consults if c.doctor_audio]
+    os.makedirs(args.output, exist_ok=True)
+    print(f"{len(consults)} consults found")
+
+    counts = asyncio.run(run_batch(consults, args.output, args.parallel, args.rate))
+    per_minute = counts['done'] / counts['seconds'] * 60 if counts['seconds'] else 0.0
+    print(
+        f"Processed {counts['done']}, skipped {counts['skipped']} already done, {counts['failed']} failed "
+        f"in {counts['seconds']:.1f}s ({per_minute:.1f} consults/min)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Real-time factor and word error rate of the ASR backends on the bundled recordings.
+
+    python benchmarks/asr_backends.py --backends azure local
+    python benchmarks/asr_backends.py --backends local --references path/to/transcripts
+
+Each recording in voice_recordings/ and doctors_recordings/ is transcribed
+by every backend (first call per backend is a warm-up, e.g. the local model
+load). RTF is transcription time divided by audio length. WER is measured
+against <recording stem>.txt in --references when given, otherwise against
+the Azure transcript.
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import sys
+import time
+import wave
+
+from dotenv import load_dotenv
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from asr import get_asr_backend  # noqa: E402
+
+
+def words(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def duration(path: str) -> float:
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["azure", "local"])
+    parser.add_argument("--references", help="directory of <stem>.txt reference transcripts")
+    args = parser.parse_args()
+    load_dotenv()
+
+    recordings = sorted(glob.glob(os.path.join(ROOT, "voice_recordings", "*.wav")) +
+                        glob.glob(os.path.join(ROOT, "doctors_recordings", "*.wav")))
+    transcripts = {name: {} for name in args.backends}
+    rtf = {name: [] for name in args.backends}
+
+    for name in args.backends:
+        backend = get_asr_backend(name)
+        with open(recordings[0], "rb") as f:
+            backend.transcribe(os.path.basename(recordings[0]), f.read())
+        for path in recordings:
+            with open(path, "rb") as f:
+                audio_bytes = f.read()
+            started = time.perf_counter()
+            text, language = backend.transcribe(os.path.basename(path), audio_bytes)
+            elapsed = time.perf_counter() - started
+            transcripts[name][path] = text
+            rtf[name].append(elapsed / duration(path))
+            print(f"{name:6} {os.path.basename(path):40} {language:8} RTF {rtf[name][-1]:.3f}")
+
+    print()
+    for name in args.backends:
+        errors = []
+        for path in recordings:
+            if args.references:
+                reference_file = os.path.join(args.references, os.path.splitext(os.path.basename(path))[0] + ".txt")
+                if not os.path.exists(reference_file):
+                    continue
+                with open(reference_file, encoding="utf-8") as f:
+                    reference = f.read()
+            elif "azure" in transcripts and name != "azure":
+                reference = transcripts["azure"][path]
+            else:
+                continue
+            errors.append(word_error_rate(reference, transcripts[name][path]))
+        wer = f"{statistics.mean(errors) * 100:6.1f}%" if errors else "     -"
+        print(f"{name:6} mean RTF {statistics.mean(rtf[name]):.3f}   WER {wer}")
+
+
+if __name__ == "__main__":
+    main()
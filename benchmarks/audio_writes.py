@@ -0,0 +1,97 @@
+"""
+Write throughput and disk footprint of the audio store per codec.
+
+    python benchmarks/audio_writes.py --copies 20
+
+Stores every bundled recording --copies times (as distinct uploads) into a
+scratch directory with each codec, then reports:
+- put ms: time the caller waits, per recording (the write happens in the background)
+- write MB/s: WAV megabytes encoded and written per second by the writer
+- footprint: bytes on disk, and as a fraction of the WAV input
+- sync ms: the previous behaviour, a plain synchronous WAV write, for comparison
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from audio_store import AudioStore, soundfile  # noqa: E402
+from result_cache import audio_fingerprint  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def recordings() -> list:
+    paths = sorted(glob.glob(os.path.join(ROOT, "voice_recordings", "*.wav")) +
+                   glob.glob(os.path.join(ROOT, "doctors_recordings", "*.wav")))
+    if not paths:
+        raise SystemExit("No recordings in voice_recordings/ or doctors_recordings/")
+    data = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data.append(f.read())
+    return data
+
+
+def run_codec(codec: str, uploads: list) -> dict:
+    folder = tempfile.mkdtemp(prefix=f"voicerx-audio-{codec}-")
+    store = AudioStore(codec=codec, folders=(folder,))
+    started_at = datetime(2025, 1, 1)
+    # The app has each upload's SHA-256 already (it keys the result cache)
+    digests = [audio_fingerprint(data) for data in uploads]
+    put_seconds = []
+    started = time.perf_counter()
+    for i, data in enumerate(uploads):
+        put_started = time.perf_counter()
+        store.put(data, "bench", folder, digests[i], recorded=started_at + timedelta(seconds=i))
+        put_seconds.append(time.perf_counter() - put_started)
+    store.flush()
+    elapsed = time.perf_counter() - started
+    stats = store.stats()
+    return {
+        'put_ms': statistics.median(put_seconds) * 1000,
+        'write_mb_s': stats['bytes_in'] / 1e6 / elapsed,
+        'footprint': sum(usage['bytes'] for usage in stats['footprint'].values()),
+    }
+
+
+def sync_wav_ms(uploads: list) -> float:
+    """Median time of the previous synchronous write of each upload"""
+    folder = tempfile.mkdtemp(prefix="voicerx-audio-sync-")
+    timings = []
+    for i, data in enumerate(uploads):
+        started = time.perf_counter()
+        with open(os.path.join(folder, f"bench_{i}.wav"), "wb") as f:
+            f.write(data)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=20, help="times each bundled recording is stored")
+    parser.add_argument("--codecs", nargs="+", default=["wav", "flac", "opus"], choices=["wav", "flac", "opus"])
+    args = parser.parse_args()
+
+    # A trailing byte per copy makes every upload distinct, as real uploads are
+    uploads = [data + bytes([copy % 256]) for copy in range(args.copies) for data in recordings()]
+    wav_bytes = sum(len(data) for data in uploads)
+    print(f"\n{len(uploads)} recordings, {wav_bytes / 1e6:.1f} MB of WAV; sync WAV write "
+          f"{sync_wav_ms(uploads):.2f} ms each")
+    if soundfile is None:
+        print("soundfile is not installed: every codec stores WAV")
+    print(f"{'codec':<8}{'put ms':>10}{'write MB/s':>12}{'footprint MB':>14}{'of WAV':>9}")
+    for codec in args.codecs:
+        result = run_codec(codec, uploads)
+        print(f"{codec:<8}{result['put_ms']:>10.3f}{result['write_mb_s']:>12.1f}"
+              f"{result['footprint'] / 1e6:>14.2f}{result['footprint'] / wav_bytes:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Time to first render of the Streamlit app in a fresh process.
+
+    python benchmarks/cold_start.py --trials 5
+    python benchmarks/cold_start.py --profile 15
+
+Each trial starts a new interpreter that imports Streamlit (as the server
+would), then runs voicerx.py headless under streamlit.testing (AppTest)
+twice and reports:
+- first render: the first script run, including importing the app's
+  modules and its once-per-process setup
+- rerun: the second run of the same process, for comparison
+
+Azure OpenAI is served by mock_azure.py so the background warm-up has an
+endpoint to connect to; no credentials or network are needed. The SNOMED
+warm-up term list is empty (VOICERX_SNOMED_WARMUP_FILE), so without a
+Neo4j server the warm-up stops at its connectivity check.
+
+--profile N runs one trial under `python -X importtime` and lists the N
+slowest packages imported by the app's modules during the first render.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, "..")
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def child() -> None:
+    """One trial; prints its timings as JSON on the last line of stdout"""
+    sys.path.insert(0, BENCHMARKS)
+    from mock_azure import Latency, start_mock_azure
+    from streamlit import logger as streamlit_logger
+    from streamlit.testing.v1 import AppTest
+
+    streamlit_logger.set_log_level("error")
+    server = start_mock_azure(Latency(whisper_latency=0, chat_latency=0, jitter=0))
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        'AZURE_OPENAI_ENDPOINT': endpoint, 'AZURE_OPENAI_CHAT_ENDPOINT': endpoint,
+        'AZURE_OPENAI_API_KEY': "mock", 'AZURE_OPENAI_CHAT_API_KEY': "mock",
+    })
+
+    app = AppTest.from_file(os.path.join(ROOT, "voicerx.py"), default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    if app.exception:
+        raise SystemExit(f"App raised: {app.exception[0].value}")
+    started = time.perf_counter()
+    app.run()
+    rerun = time.perf_counter() - started
+    print(json.dumps({'first_render': first, 'rerun': rerun}))
+
+
+def run_trial(extra_args=()) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env.setdefault('VOICERX_SNOMED_WARMUP_FILE', os.devnull)
+    env.setdefault('VOICERX_JOB_DB', os.path.join(tempfile.mkdtemp(prefix="voicerx-cold-"), "jobs.sqlite3"))
+    return subprocess.run([sys.executable, *extra_args, os.path.abspath(__file__), "--child"],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def app_imports(importtime_log: str, count: int) -> list:
+    """Slowest packages imported by the app's own modules, as (package, cumulative seconds)"""
+    app_modules = {os.path.splitext(name)[0] for name in os.listdir(ROOT) if name.endswith(".py")}
+    slowest, pending = {}, []
+    for line in importtime_log.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        depth, module, seconds = len(match.group(3)) // 2, match.group(4), int(match.group(2)) / 1e6
+        if depth > 0:
+            pending.append((module, seconds))
+            continue
+        # -X importtime lists a module's imports before the module itself
+        if module in app_modules:
+            for package, package_seconds in pending:
+                if "." not in package and package not in app_modules:
+                    slowest[package] = max(slowest.get(package, 0.0), package_seconds)
+            slowest[f"{module} (total)"] = seconds
+        pending = []
+    return sorted(slowest.items(), key=lambda item: -item[1])[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--profile", type=int, metavar="N", help="list the N slowest imports instead")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    if args.profile:
+        result = run_trial(["-X", "importtime"])
+        print("\nSlowest imports during the first render")
+        print(f"{'module':<40}{'seconds':>10}")
+        for module, seconds in app_imports(result.stderr, args.profile):
+            print(f"{module:<40}{seconds:>10.3f}")
+        return
+
+    trials = [json.loads(run_trial().stdout.strip().splitlines()[-1]) for _ in range(args.trials)]
+    print(f"\nTime to first render ({args.trials} fresh processes)")
+    print(f"{'run':<14}{'median s':>10}{'min s':>10}{'max s':>10}")
+    for name in ('first_render', 'rerun'):
+        samples = [trial[name] for trial in trials]
+        print(f"{name:<14}{statistics.median(samples):>10.3f}{min(samples):>10.3f}{max(samples):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
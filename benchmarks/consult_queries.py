@@ -0,0 +1,94 @@
+"""
+Time writes, loads and searches of the consult store on synthetic consults.
+
+    python benchmarks/consult_queries.py --consults 50000
+
+Fills a scratch database with consults spread over --days days, users and
+patients, each coded with a few concepts from benchmarks/data/snomed_sample.tsv,
+then reports:
+- write: consults per second through the batching writer (save + flush)
+- load: one consult by ID
+- concept this month: every consult coded 25064002 (headache) since the 1st
+- text: full-text search over transcripts and notes
+- user: a user's latest 20 consults
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from consult_store import ConsultStore  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snomed_sample.tsv")
+
+
+def synthetic_consult(index: int, concepts: list, rng: random.Random, now: float, days: int) -> dict:
+    picked = rng.sample(concepts, 3)
+    terms = " and ".join(term.lower() for _, term in picked)
+    return {
+        'consult_id': f"consult-{index}",
+        'user': f"user{rng.randrange(50)}",
+        'patient': f"patient{rng.randrange(5000)}",
+        'created': now - rng.random() * days * 86400,
+        'patient_transcription': {'english_text': f"I have had {terms} for {rng.randrange(1, 14)} days."},
+        'patient_analysis': {'diseases': [term.lower() for _, term in picked], 'symptoms': [],
+                             'severity': 'moderate', 'urgency': 'medium'},
+        'patient_snomed': {term.lower(): [(concept_id, term, 'finding', 1.0)] for concept_id, term in picked},
+        'clinical_note': f"## Assessment\nPresenting with {terms}.\n## Plan\nReview in one week.",
+    }
+
+
+def time_query(query, iterations: int) -> list:
+    query()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        query()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consults", type=int, default=20000, help="consults to write")
+    parser.add_argument("--days", type=int, default=365, help="period the consults are spread over")
+    parser.add_argument("--iterations", type=int, default=200, help="runs of each query")
+    args = parser.parse_args()
+
+    with open(SAMPLE_FILE, newline="", encoding="utf-8") as f:
+        concepts = [(row['conceptId'], row['term']) for row in csv.DictReader(f, delimiter="\t")]
+    rng = random.Random(0)
+    now = time.time()
+    consults = [synthetic_consult(i, concepts, rng, now, args.days) for i in range(args.consults)]
+
+    store = ConsultStore(os.path.join(tempfile.mkdtemp(prefix="voicerx-consults-"), "consults.sqlite3"))
+    started = time.perf_counter()
+    for consult in consults:
+        store.save(consult)
+    store.flush()
+    write_seconds = time.perf_counter() - started
+    print(f"\nWrote {args.consults} consults in {write_seconds:.2f}s "
+          f"({args.consults / write_seconds:.0f}/s), full-text index: {store.fts}")
+
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+    queries = {
+        'load': lambda: store.load(f"consult-{rng.randrange(args.consults)}"),
+        'concept this month': lambda: store.search(concept_id="25064002", since=month_start),
+        'text': lambda: store.search(text="fever cough"),
+        'user': lambda: store.search(user="user7", limit=20),
+    }
+    print(f"{'query':<20}{'median ms':>12}{'p95 ms':>10}")
+    for name, query in queries.items():
+        timings = sorted(time_query(query, args.iterations))
+        print(f"{name:<20}{statistics.median(timings) * 1000:>12.3f}{timings[int(len(timings) * 0.95)] * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
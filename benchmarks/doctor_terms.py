@@ -0,0 +1,66 @@
+"""
+SNOMED lookup latency on the doctor path: whole transcript vs extracted phrases.
+
+    python benchmarks/doctor_terms.py --iterations 20
+
+Uses the configured terminology backend (VOICERX_SNOMED_BACKEND) and
+bypasses the in-process term cache so every iteration reaches the backend.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from phrase_extraction import extract_phrases_rules, snomed_candidate_terms  # noqa: E402
+from processing import _lookup_snomed_uncached  # noqa: E402
+
+# Doctor assessments in the style of the README examples
+TRANSCRIPTS = [
+    "The patient has a burning sensation while passing urine for the past two days, likely a urinary "
+    "tract infection. Avoid traveling and use caution with public restrooms for the next one to two days. "
+    "Get a urine test done, drink plenty of water, and if the discomfort persists after three days, "
+    "visit the hospital.",
+    "Headache and stomach pain for four days, likely fatigue and mental stress. Advice to rest for two "
+    "days. Paracetamol once daily in the morning. Follow up if symptoms worsen within the next three days.",
+    "Fever and sore throat since yesterday. Take Dolo 650 twice a day for three days, salt water gargle "
+    "at night, and get a CBC if the fever continues.",
+]
+
+
+def time_calls(func, iterations: int) -> list:
+    func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    load_dotenv()
+
+    for transcript in TRANSCRIPTS:
+        started = time.perf_counter()
+        terms = snomed_candidate_terms(extract_phrases_rules(transcript))
+        extract_ms = (time.perf_counter() - started) * 1000
+
+        before = time_calls(lambda: _lookup_snomed_uncached([transcript], 10), args.iterations)
+        after = time_calls(lambda: _lookup_snomed_uncached(terms, 10), args.iterations) if terms else [0.0]
+
+        print(f"{transcript[:60]}...")
+        print(f"  phrases      {terms}  (extracted in {extract_ms:.2f} ms)")
+        print(f"  transcript   {statistics.mean(before) * 1000:8.2f} ms per lookup")
+        print(f"  phrases      {statistics.mean(after) * 1000:8.2f} ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
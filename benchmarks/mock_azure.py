@@ -0,0 +1,276 @@
+"""
+Local stand-in for the Azure OpenAI Whisper and GPT-4o deployments.
+
+    python benchmarks/mock_azure.py --port 8089 --whisper-rtf 0.1 --ttft 0.6
+
+Serves the Azure routes the app calls (audio transcriptions and
+translations, chat completions including streaming) and replays the
+responses recorded in benchmarks/data/azure_responses.json, with
+configurable latency, so benchmarks measure our code rather than the
+network. Point the app at it with
+
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089  AZURE_OPENAI_API_KEY=mock
+    AZURE_OPENAI_CHAT_ENDPOINT=http://127.0.0.1:8089  AZURE_OPENAI_CHAT_API_KEY=mock
+
+Whisper responses are chosen by the uploaded file name (recording stem,
+ignoring _partNNN chunk suffixes); chat responses by a substring of the
+system prompt. Latency model:
+- Whisper: --whisper-latency + --whisper-rtf x audio seconds
+- chat: --chat-latency, or for streams --ttft then --token-rate tokens/s
+- every delay is scaled by a random factor within +/- --jitter
+--throttle-rate answers that fraction of requests with a 429 and a
+retry-after-ms header, to exercise rate limiting and retries.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import wave
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+RESPONSES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "azure_responses.json")
+
+_ROUTE = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/(?P<operation>audio/transcriptions|audio/translations|chat/completions)$")
+_CHUNK_SUFFIX = re.compile(r"_part\d+$")
+
+
+@dataclass
+class Latency:
+    whisper_latency: float = 0.3
+    whisper_rtf: float = 0.05
+    chat_latency: float = 1.0
+    ttft: float = 0.5
+    token_rate: float = 80.0
+    jitter: float = 0.1
+    throttle_rate: float = 0.0
+
+
+def _tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), for usage and streaming pace"""
+    return max(1, len(text) // 4)
+
+
+def _audio_seconds(data: bytes, recorded: Optional[float]) -> float:
+    if data[:4] == b"RIFF":
+        try:
+            with wave.open(io.BytesIO(data), "rb") as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError):
+            pass
+    # Compressed uploads: the recorded duration, else ~16 kB per second
+    return recorded if recorded is not None else len(data) / 16000
+
+
+class MockAzure:
+    """Recorded responses plus the latency model; shared by the request handlers"""
+
+    def __init__(self, latency: Latency, responses_file: str = RESPONSES_FILE, seed: int = 0):
+        with open(responses_file, encoding="utf-8") as f:
+            self.responses = json.load(f)
+        self.latency = latency
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, seconds: float) -> None:
+        with self._lock:
+            factor = self._random.uniform(1 - self.latency.jitter, 1 + self.latency.jitter)
+        time.sleep(max(0.0, seconds * factor))
+
+    def throttled(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.latency.throttle_rate
+
+    def audio(self, operation: str, filename: str) -> dict:
+        stem = _CHUNK_SUFFIX.sub("", os.path.splitext(os.path.basename(filename))[0])
+        recorded = self.responses[operation]
+        return recorded.get(stem, recorded['default'])
+
+    def chat(self, system_prompt: str) -> str:
+        for entry in self.responses['chat']:
+            if entry['match'] in system_prompt:
+                return entry['content']
+        return self.responses['chat'][-1]['content']
+
+
+def _parse_form(content_type: str, body: bytes) -> Tuple[dict, str, bytes]:
+    """multipart/form-data fields, plus the uploaded file's name and bytes"""
+    message = BytesParser(policy=email_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields, filename, data = {}, "audio.wav", b""
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename():
+            filename, data = part.get_filename(), part.get_payload(decode=True)
+        else:
+            fields[name] = part.get_content().strip()
+    return fields, filename, data
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the pooled httpx clients expect
+    mock: MockAzure = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text: str) -> None:
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        match = _ROUTE.match(urlparse(self.path).path)
+        if match is None:
+            self._send_json(404, {'error': {'code': "404", 'message': "Resource not found"}})
+            return
+        if self.mock.throttled():
+            self._send_json(429, {'error': {'code': "429", 'message': "Rate limit reached (mock)"}},
+                            {'retry-after-ms': "100", 'retry-after': "1"})
+            return
+        if match.group('operation') == "chat/completions":
+            self._chat(json.loads(body))
+        else:
+            self._audio(match.group('operation').split("/")[1], body)
+
+    def _audio(self, operation: str, body: bytes) -> None:
+        fields, filename, data = _parse_form(self.headers["Content-Type"], body)
+        recorded = self.mock.audio(operation, filename)
+        seconds = _audio_seconds(data, recorded.get('duration'))
+        self.mock.delay(self.mock.latency.whisper_latency + self.mock.latency.whisper_rtf * seconds)
+
+        if fields.get('response_format') == "text":
+            self._send_text(recorded['text'] + "\n")
+            return
+        self._send_json(200, {
+            'task': "transcribe" if operation == "transcriptions" else "translate",
+            'language': recorded.get('language', "english"),
+            'duration': round(seconds, 2),
+            'text': recorded['text'],
+            'segments': []
+        })
+
+    def _chat(self, request: dict) -> None:
+        system_prompt = next((m['content'] for m in request['messages'] if m['role'] == "system"), "")
+        content = self.mock.chat(system_prompt)
+        prompt_tokens = sum(_tokens(str(m.get('content', ""))) for m in request['messages'])
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': _tokens(content),
+            'total_tokens': prompt_tokens + _tokens(content)
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not request.get('stream'):
+            self.mock.delay(self.mock.latency.chat_latency)
+            self._send_json(200, {
+                'id': completion_id, 'object': "chat.completion", 'created': int(time.time()),
+                'model': "gpt-4o",
+                'choices': [{'index': 0, 'finish_reason': "stop",
+                             'message': {'role': "assistant", 'content': content}}],
+                'usage': usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(choices: list, **extra) -> None:
+            payload = dict({'id': completion_id, 'object': "chat.completion.chunk",
+                            'created': int(time.time()), 'model': "gpt-4o", 'choices': choices}, **extra)
+            data = f"data: {json.dumps(payload)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        # Like Azure: a first chunk with no choices (content-filter results), then the deltas
+        event([])
+        self.mock.delay(self.mock.latency.ttft)
+        pieces = re.findall(r"\S+\s*", content)
+        per_piece = len(content) / 4 / max(1, len(pieces)) / self.mock.latency.token_rate
+        for piece in pieces:
+            event([{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}])
+            self.mock.delay(per_piece)
+        event([{'index': 0, 'delta': {}, 'finish_reason': "stop"}])
+        if (request.get('stream_options') or {}).get('include_usage'):
+            event([], usage=usage)
+        data = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_mock_azure(latency: Latency, port: int = 0, host: str = "127.0.0.1",
+                     responses_file: str = RESPONSES_FILE) -> ThreadingHTTPServer:
+    """Serve the mock on a daemon thread; server.server_address has the bound port"""
+    handler = type("BoundMockAzureHandler", (MockAzureHandler,), {'mock': MockAzure(latency, responses_file)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-azure", daemon=True).start()
+    return server
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = Latency()
+    parser.add_argument("--whisper-latency", type=float, default=defaults.whisper_latency,
+                        help="fixed seconds per Whisper request")
+    parser.add_argument("--whisper-rtf", type=float, default=defaults.whisper_rtf,
+                        help="Whisper seconds per second of audio")
+    parser.add_argument("--chat-latency", type=float, default=defaults.chat_latency,
+                        help="seconds per non-streaming chat completion")
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="seconds to the first streamed token")
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate, help="streamed tokens per second")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="relative latency jitter")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate,
+                        help="fraction of requests answered with 429")
+
+
+def latency_from_args(args: argparse.Namespace) -> Latency:
+    return Latency(args.whisper_latency, args.whisper_rtf, args.chat_latency, args.ttft,
+                   args.token_rate, args.jitter, args.throttle_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--responses", default=RESPONSES_FILE, help="recorded responses (JSON)")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_azure(latency_from_args(args), args.port, args.host, args.responses)
+    print(f"Mock Azure OpenAI listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
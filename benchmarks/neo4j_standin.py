@@ -0,0 +1,115 @@
+"""
+In-process stand-in for the Neo4j driver, loaded with the SNOMED CT sample.
+
+Answers the two full-text queries processing.py sends (SNOMED_TERM_QUERY
+and SNOMED_BATCH_QUERY) from an offline index (snomed_index.py) built from
+benchmarks/data/snomed_sample.tsv, so SNOMED lookups can be benchmarked
+without a database server. A Bolt round trip is modelled as a fixed delay
+per query plus a delay per keyword searched, and sessions are limited to
+the driver's connection pool size.
+
+    from neo4j_standin import StandInDriver
+    clients.register_client("neo4j", StandInDriver(round_trip=0.002))
+"""
+import csv
+import os
+import tempfile
+import threading
+import time
+from typing import List
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snomed_sample.tsv")
+
+RF2_COLUMNS = ["id", "effectiveTime", "active", "moduleId", "conceptId", "languageCode", "typeId", "term",
+               "caseSignificanceId"]
+
+
+def build_sample_index(sample_file: str, index_dir: str) -> int:
+    """Convert the sample (conceptId, term, semanticTag) rows to RF2 and index them"""
+    from snomed_index import FSN_TYPE_ID, SYNONYM_TYPE_ID, build_index
+
+    with open(sample_file, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    rf2_path = os.path.join(index_dir, "sct2_Description_Sample.txt")
+    with open(rf2_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(RF2_COLUMNS)
+        described = set()
+        for number, row in enumerate(rows):
+            if row['conceptId'] not in described:
+                # First description of a concept doubles as its FSN, carrying the semantic tag
+                described.add(row['conceptId'])
+                writer.writerow([f"{number}0", "20250101", "1", "0", row['conceptId'], "en", FSN_TYPE_ID,
+                                 f"{row['term']} ({row['semanticTag']})", "0"])
+            writer.writerow([f"{number}1", "20250101", "1", "0", row['conceptId'], "en", SYNONYM_TYPE_ID,
+                             row['term'], "0"])
+    return build_index(rf2_path, index_dir, release="benchmark sample")
+
+
+class _Result:
+    def __init__(self, records: List[dict]):
+        self._records = records
+
+    def data(self) -> List[dict]:
+        return self._records
+
+    def consume(self) -> None:
+        pass
+
+
+class _Transaction:
+    def __init__(self, driver: "StandInDriver"):
+        self.driver = driver
+
+    def run(self, query: str, **params) -> _Result:
+        keywords = params['keywords'] if 'keywords' in params else [params['keyword']]
+        time.sleep(self.driver.round_trip + self.driver.per_keyword * len(keywords))
+        self.driver.queries += 1
+        records = []
+        for idx, keyword in enumerate(keywords):
+            for concept_id, term, tag, score in self.driver.index.search(keyword, params.get('top_k', 10)):
+                if score > params.get('min_score', 0.0):
+                    records.append({'idx': idx, 'conceptId': concept_id, 'term': term,
+                                    'semanticTag': tag, 'score': score})
+        return _Result(records)
+
+
+class _Session:
+    def __init__(self, driver: "StandInDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        self.driver._pool.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.driver._pool.release()
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(_Transaction(self.driver), *args, **kwargs)
+
+    def run(self, query: str, **params) -> _Result:
+        return _Transaction(self.driver).run(query, **params)
+
+
+class StandInDriver:
+    """Duck-typed neo4j.Driver: session() -> execute_read / run"""
+
+    def __init__(self, round_trip: float = 0.002, per_keyword: float = 0.0005, pool_size: int = 50,
+                 sample_file: str = SAMPLE_FILE):
+        from snomed_index import LocalSnomedIndex
+
+        self.round_trip = round_trip
+        self.per_keyword = per_keyword
+        self.queries = 0
+        self._pool = threading.BoundedSemaphore(pool_size)
+        self._index_dir = tempfile.TemporaryDirectory(prefix="voicerx-neo4j-standin-")
+        self.terms = build_sample_index(sample_file, self._index_dir.name)
+        self.index = LocalSnomedIndex(self._index_dir.name)
+
+    def session(self, **kwargs) -> _Session:
+        return _Session(self)
+
+    def close(self) -> None:
+        self.index.close()
+        self._index_dir.cleanup()
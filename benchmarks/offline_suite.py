@@ -0,0 +1,241 @@
+"""
+Offline benchmark suite: the consult pipeline against local stand-ins.
+
+    python benchmarks/offline_suite.py --save baseline.json
+    python benchmarks/offline_suite.py --compare baseline.json
+    python benchmarks/offline_suite.py snomed --threads 1 8 32
+
+Azure OpenAI is replaced by the mock server in mock_azure.py (recorded
+responses, configurable latency) and Neo4j by neo4j_standin.py (the SNOMED
+sample in an embedded index), so the suite needs no network or credentials
+and .env is never read. The result and SNOMED caches and the client-side
+rate limits are disabled so every run does the same work.
+
+Scenarios:
+- consult: single-consult latency over the bundled recordings
+- throughput: concurrent consults per minute at each --concurrency level
+- snomed: SNOMED lookup queries per second at each --threads level
+
+--save writes the summary metrics as JSON; --compare prints each metric's
+change against such a baseline, so a performance change can be measured
+by running the suite before and after it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+# Read when the caches, clients and rate limiters are first built (processing._get_shared,
+# rate_limit.get_limiter), which is on first use; set before any import so nothing built
+# earlier could see the developer's own settings
+os.environ.update({
+    'AZURE_OPENAI_API_KEY': "mock",
+    'AZURE_OPENAI_CHAT_API_KEY': "mock",
+    'VOICERX_ASR_BACKEND': "azure",
+    'VOICERX_SNOMED_BACKEND': "neo4j",
+    'VOICERX_RESULT_CACHE_MB': "0",
+    'VOICERX_SNOMED_CACHE_SIZE': "0",
+    'VOICERX_WHISPER_RPM': "0",
+    'VOICERX_CHAT_RPM': "0",
+    'VOICERX_CHAT_TPM': "0",
+})
+
+import clients  # noqa: E402
+from batch_cli import Consult, pair_recordings  # noqa: E402
+from mock_azure import add_latency_arguments, latency_from_args, start_mock_azure  # noqa: E402
+from neo4j_standin import StandInDriver  # noqa: E402
+from pipeline import run_consult, run_consult_async  # noqa: E402
+from processing import search_snomed_terms  # noqa: E402
+from snomed_lookup import DEFAULT_TERMS  # noqa: E402
+
+SCENARIOS = ("consult", "throughput", "snomed")
+
+# Metrics where a higher value is better; everything else is a duration
+HIGHER_IS_BETTER = ("per_minute", "qps", "terms_per_second")
+
+
+def describe(samples: List[float]) -> Dict[str, float]:
+    """pytest-benchmark style summary of per-call seconds"""
+    ordered = sorted(samples)
+    return {
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': statistics.mean(ordered),
+        'stddev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{title}")
+    print(f"{'name':<24}{'min':>10}{'max':>10}{'mean':>10}{'stddev':>10}{'median':>10}{'p95':>10}  (ms)")
+    for name, row in rows.items():
+        print(f"{name:<24}" + "".join(f"{row[key] * 1000:>10.1f}" for key in
+                                      ('min', 'max', 'mean', 'stddev', 'median', 'p95')))
+
+
+def consults() -> List[Consult]:
+    paired = pair_recordings(os.path.join(ROOT, "voice_recordings"), os.path.join(ROOT, "doctors_recordings"),
+                             timedelta(hours=1))
+    paired = [consult for consult in paired if consult.doctor_audio]
+    if not paired:
+        raise SystemExit("No paired recordings in voice_recordings/ and doctors_recordings/")
+    return paired
+
+
+def bench_consult(iterations: int) -> Dict[str, float]:
+    """End-to-end latency of one consult at a time, plus mean per-stage times"""
+    recordings = consults()
+    run_consult(recordings[0].patient_audio, recordings[0].doctor_audio, recordings[0].user)  # warm-up
+    latencies, stages = [], {}
+    for iteration in range(iterations):
+        consult = recordings[iteration % len(recordings)]
+        started = time.perf_counter()
+        results = run_consult(consult.patient_audio, consult.doctor_audio, consult.user)
+        latencies.append(time.perf_counter() - started)
+        for stage, seconds in results['timings'].items():
+            stages.setdefault(stage, []).append(seconds)
+
+    rows = {'consult': describe(latencies)}
+    rows.update({f"  {stage}": describe(seconds) for stage, seconds in stages.items() if stage != 'total'})
+    print_table(f"Single consult ({iterations} iterations)", rows)
+    summary = {f"consult.latency.{key}": value for key, value in rows['consult'].items()}
+    summary.update({f"consult.stage.{stage}.mean": describe(seconds)['mean']
+                    for stage, seconds in stages.items() if stage != 'total'})
+    return summary
+
+
+async def _run_concurrently(recordings: List[Consult], count: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(consult: Consult) -> float:
+        async with semaphore:
+            started = time.perf_counter()
+            await run_consult_async(consult.patient_audio, consult.doctor_audio, consult.user)
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*(one(recordings[i % len(recordings)]) for i in range(count)))
+
+
+def bench_throughput(levels: List[int], count: int) -> Dict[str, float]:
+    """Consults per minute with up to each level of consults in flight"""
+    recordings = consults()
+    summary = {}
+    print(f"\nConcurrent consults ({count} per level)")
+    print(f"{'concurrency':<14}{'consults/min':>14}{'mean latency':>16}{'p95 latency':>14}")
+    for level in levels:
+        started = time.perf_counter()
+        latencies = asyncio.run(_run_concurrently(recordings, count, level))
+        per_minute = count / (time.perf_counter() - started) * 60
+        stats = describe(latencies)
+        print(f"{level:<14}{per_minute:>14.1f}{stats['mean']:>15.2f}s{stats['p95']:>13.2f}s")
+        summary[f"throughput.c{level}.per_minute"] = per_minute
+        summary[f"throughput.c{level}.latency.p95"] = stats['p95']
+    return summary
+
+
+def bench_snomed(levels: List[int], seconds: float, terms: List[str]) -> Dict[str, float]:
+    """search_snomed_terms calls per second with each number of threads calling it in a loop"""
+    search_snomed_terms(terms)  # warm-up
+    summary = {}
+    print(f"\nSNOMED lookup ({len(terms)} terms per lookup, {seconds:.0f}s per level)")
+    print(f"{'threads':<10}{'qps':>10}{'terms/s':>10}{'p50':>10}{'p95':>10}  (ms)")
+    for level in levels:
+        latencies: List[float] = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def worker():
+            local = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                search_snomed_terms(terms)
+                local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(level)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        qps = len(latencies) / (time.perf_counter() - started)
+        stats = describe(latencies)
+        print(f"{level:<10}{qps:>10.1f}{qps * len(terms):>10.0f}{stats['median'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}")
+        summary[f"snomed.t{level}.qps"] = qps
+        summary[f"snomed.t{level}.terms_per_second"] = qps * len(terms)
+        summary[f"snomed.t{level}.latency.p95"] = stats['p95']
+    return summary
+
+
+def compare(summary: Dict[str, float], baseline_file: str) -> None:
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = json.load(f)['metrics']
+    print(f"\nAgainst {baseline_file}")
+    print(f"{'metric':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, value in summary.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        change = (value - baseline[name]) / baseline[name] * 100
+        better = change > 0 if name.endswith(HIGHER_IS_BETTER) else change < 0
+        verdict = "" if abs(change) < 5 else (" better" if better else " worse")
+        print(f"{name:<40}{baseline[name]:>12.4f}{value:>12.4f}{change:>+9.1f}%{verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help="consult, throughput and/or snomed (default: all)")
+    parser.add_argument("--iterations", type=int, default=5, help="consults timed in the consult scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--consults", type=int, default=16, help="consults per concurrency level")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each SNOMED level")
+    parser.add_argument("--terms", nargs="*", default=DEFAULT_TERMS)
+    parser.add_argument("--neo4j-round-trip", type=float, default=0.002, help="seconds per stand-in query")
+    parser.add_argument("--save", help="write the summary metrics to this JSON file")
+    parser.add_argument("--compare", help="compare against a summary written by --save")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    server = start_mock_azure(latency_from_args(args))
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ['AZURE_OPENAI_ENDPOINT'] = os.environ['AZURE_OPENAI_CHAT_ENDPOINT'] = endpoint
+    clients.register_client("neo4j", StandInDriver(round_trip=args.neo4j_round_trip))
+
+    summary: Dict[str, float] = {}
+    if "consult" in scenarios:
+        summary.update(bench_consult(args.iterations))
+    if "throughput" in scenarios:
+        summary.update(bench_throughput(args.concurrency, args.consults))
+    if "snomed" in scenarios:
+        summary.update(bench_snomed(args.threads, args.seconds, args.terms))
+    server.shutdown()
+
+    if args.compare:
+        compare(summary, args.compare)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({'settings': {key: value for key, value in vars(args).items() if key not in ('save', 'compare')},
+                       'metrics': summary}, f, indent=2)
+        print(f"\nSaved {len(summary)} metrics to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
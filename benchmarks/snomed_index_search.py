@@ -0,0 +1,150 @@
+"""
+Lookup latency of the offline SNOMED CT index (snomed_index.py) at the size
+of a full release.
+
+    python benchmarks/snomed_index_search.py --terms 300000 --iterations 5
+
+Builds a synthetic index of --terms descriptions (once per --index-dir),
+composed from clinical words so that common trigrams such as "ion" or
+"pai" have posting lists as long as in the International Edition, then
+times LocalSnomedIndex.search for each keyword, including misspellings.
+The synthetic terms are for timing only, not a licensed SNOMED CT release.
+
+--check also runs every keyword without the candidate cap and reports how
+many of the capped top-k results agree with it.
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from neo4j_standin import RF2_COLUMNS, SAMPLE_FILE  # noqa: E402
+from snomed_index import FSN_TYPE_ID, SYNONYM_TYPE_ID, LocalSnomedIndex, build_index  # noqa: E402
+
+KEYWORDS = [
+    "headache", "fever", "burning sensation", "stomach pain", "nausea",
+    "dizziness", "fatigue", "cough", "sore throat", "urinary tract infection",
+    "hedache", "abdominal pian", "shortnes of breath", "high blood presure", "pain",
+]
+
+QUALIFIERS = [
+    "acute", "chronic", "recurrent", "bilateral", "left", "right", "congenital", "primary",
+    "secondary", "severe", "mild", "moderate", "postoperative", "traumatic", "idiopathic",
+    "benign", "malignant", "intermittent", "persistent", "juvenile", "neonatal", "allergic",
+]
+SITES = [
+    "abdominal", "chest", "head", "neck", "back", "shoulder", "knee", "hip", "ankle", "wrist",
+    "elbow", "stomach", "throat", "ear", "eye", "skin", "lung", "kidney", "liver", "bladder",
+    "urinary tract", "upper respiratory tract", "lower limb", "upper limb", "spine", "pelvic",
+    "heart", "muscle", "joint", "nasal", "oral", "dental", "gastric", "intestinal", "colon",
+]
+FINDINGS = [
+    "pain", "infection", "inflammation", "swelling", "ulcer", "injury", "fracture", "lesion",
+    "discharge", "bleeding", "obstruction", "stenosis", "neoplasm", "cyst", "abscess",
+    "deformity", "dysfunction", "disorder", "sensation", "tenderness", "stiffness", "weakness",
+    "hemorrhage", "erosion", "hypertrophy", "atrophy", "calcification", "dislocation",
+]
+CONTEXTS = [
+    "", "", "", "due to trauma", "due to infection", "with complication", "without complication",
+    "in pregnancy", "of childhood", "following procedure", "caused by drug", "on exertion",
+    "at rest", "during urination", "after meals", "with fever", "with nausea",
+]
+TAGS = ["finding", "disorder", "procedure", "body structure", "substance"]
+
+
+def write_rf2(path: str, terms: int, seed: int = 1) -> None:
+    """RF2 description file: the bundled sample plus generated terms, about two descriptions per concept"""
+    rng = random.Random(seed)
+    with open(SAMPLE_FILE, newline="", encoding="utf-8") as f:
+        sample = [(row['conceptId'], row['term'], row['semanticTag']) for row in csv.DictReader(f, delimiter="\t")]
+    seen, number = set(), 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(RF2_COLUMNS)
+
+        def describe(concept_id: str, names: list, tag: str) -> None:
+            nonlocal number
+            writer.writerow([f"{number}0", "20250101", "1", "0", concept_id, "en", FSN_TYPE_ID,
+                             f"{names[0]} ({tag})", "0"])
+            for name in names:
+                writer.writerow([f"{number}1", "20250101", "1", "0", concept_id, "en", SYNONYM_TYPE_ID, name, "0"])
+                number += 1
+
+        for concept_id, term, tag in sample:
+            describe(concept_id, [term], tag)
+        concept = 100000000
+        while number < terms:
+            site, finding = rng.choice(SITES), rng.choice(FINDINGS)
+            qualifier, context = rng.choice(QUALIFIERS), rng.choice(CONTEXTS)
+            name = " ".join(part for part in (qualifier, site, finding, context) if part).capitalize()
+            if name in seen:
+                continue
+            seen.add(name)
+            synonym = " ".join(part for part in (qualifier, finding, "of", site, context) if part).capitalize()
+            concept += 1
+            describe(str(concept), [name, synonym], rng.choice(TAGS))
+
+
+def ensure_index(index_dir: str, terms: int) -> None:
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        return
+    os.makedirs(index_dir, exist_ok=True)
+    rf2_path = os.path.join(index_dir, "sct2_Description_Synthetic.txt")
+    started = time.perf_counter()
+    write_rf2(rf2_path, terms)
+    count = build_index(rf2_path, index_dir, release="synthetic benchmark")
+    os.remove(rf2_path)
+    print(f"Indexed {count} synthetic descriptions in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=300000, help="descriptions in the synthetic index")
+    parser.add_argument("--index-dir", help="where to build or reuse the index (default: a temporary directory)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--check", action="store_true", help="compare top-k with an uncapped search")
+    parser.add_argument("keywords", nargs="*", default=KEYWORDS)
+    args = parser.parse_args()
+
+    scratch = None
+    index_dir = args.index_dir
+    if index_dir is None:
+        scratch = tempfile.TemporaryDirectory(prefix="voicerx-snomed-bench-")
+        index_dir = scratch.name
+    ensure_index(index_dir, args.terms)
+    index = LocalSnomedIndex(index_dir)
+
+    print(f"\n{index.size} terms, top_k={args.top_k}")
+    print(f"{'keyword':<28}{'median ms':>11}{'max ms':>9}{'results':>9}" + (f"{'agree':>8}" if args.check else ""))
+    all_timings = []
+    for keyword in args.keywords:
+        timings = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            results = index.search(keyword, args.top_k)
+            timings.append((time.perf_counter() - started) * 1000)
+        all_timings += timings
+        line = f"{keyword:<28}{statistics.median(timings):>11.2f}{max(timings):>9.2f}{len(results):>9}"
+        if args.check:
+            reference = index.search(keyword, args.top_k, max_candidates=None)
+            agree = len({match[0] for match in results} & {match[0] for match in reference})
+            line += f"{agree:>5}/{len(reference):<2}"
+        print(line)
+
+    all_timings.sort()
+    p95 = all_timings[min(len(all_timings) - 1, int(len(all_timings) * 0.95))]
+    print(f"\nall keywords: median {statistics.median(all_timings):.2f} ms, p95 {p95:.2f} ms")
+    index.close()
+    if scratch is not None:
+        scratch.cleanup()
+
+
+if __name__ == "__main__":
+    main()
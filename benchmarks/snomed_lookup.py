@@ -0,0 +1,93 @@
+"""
+Compare per-term and batched (UNWIND) SNOMED lookups against a local Neo4j.
+
+    python benchmarks/snomed_lookup.py --load-sample --iterations 50
+
+--load-sample writes the terms in benchmarks/data/snomed_sample.tsv as
+(:Term) nodes and creates the 'termIndex' full-text index. Only use it
+against a scratch database. The sample is a small illustrative subset for
+timing, not a licensed SNOMED CT release.
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from clients import get_neo4j_driver  # noqa: E402
+from processing import _search_snomed_per_term, _search_snomed_batched  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snomed_sample.tsv")
+
+# Roughly what extract_diseases_enhanced returns for one consult
+DEFAULT_TERMS = [
+    "headache", "fever", "burning sensation", "stomach pain", "nausea",
+    "dizziness", "fatigue", "cough", "sore throat", "urinary tract infection",
+]
+
+
+def load_sample(driver) -> int:
+    """Load the sample subset and its full-text index into Neo4j"""
+    with open(SAMPLE_FILE, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    with driver.session() as session:
+        session.run(
+            "UNWIND $rows AS row "
+            "MERGE (t:Term {conceptId: row.conceptId, term: row.term}) "
+            "SET t.semanticTag = row.semanticTag",
+            rows=rows
+        ).consume()
+        session.run(
+            "CREATE FULLTEXT INDEX termIndex IF NOT EXISTS FOR (t:Term) ON EACH [t.term]"
+        ).consume()
+        session.run("CALL db.awaitIndexes(300)").consume()
+    return len(rows)
+
+
+def time_lookup(lookup, session, terms, iterations: int) -> list:
+    """Wall-clock seconds for each of iterations calls"""
+    lookup(session, terms)  # warm-up: query plans and index readers
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        lookup(session, terms)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(name: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<10} mean {statistics.mean(timings) * 1000:8.2f} ms   "
+          f"p50 {statistics.median(timings) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load-sample", action="store_true", help="Load the sample SNOMED subset first")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--terms", nargs="*", default=DEFAULT_TERMS)
+    args = parser.parse_args()
+
+    load_dotenv()
+    driver = get_neo4j_driver()
+    if args.load_sample:
+        print(f"Loaded {load_sample(driver)} sample descriptions")
+
+    with driver.session() as session:
+        per_term = time_lookup(_search_snomed_per_term, session, args.terms, args.iterations)
+        batched = time_lookup(_search_snomed_batched, session, args.terms, args.iterations)
+
+    print(f"{len(args.terms)} terms, {args.iterations} iterations")
+    summarize("per-term", per_term)
+    summarize("batched", batched)
+    print(f"speed-up   {statistics.mean(per_term) / statistics.mean(batched):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Rerun cost of the Streamlit app with a finished consult on screen.
+
+    python benchmarks/ui_rerun.py --runs 20
+
+Runs voicerx.py headless under streamlit.testing (AppTest) with session
+state holding a completed patient and doctor consult (recorded responses
+from data/azure_responses.json, SNOMED matches from the sample index), and
+measures for each kind of rerun:
+- render time: wall time of the script run
+- payload: number and serialized size of the forward messages the run
+  would send over the WebSocket
+
+Scenarios:
+- full: a rerun of the whole script, as after any widget interaction
+  outside a fragment
+- patient / doctor: a rerun scoped to that portal's fragment, as after an
+  interaction inside it. Skipped when the portal is not a fragment.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+os.environ.setdefault('VOICERX_SNOMED_WARMUP_FILE', os.devnull)
+os.environ.setdefault('VOICERX_JOB_DB', os.path.join(tempfile.mkdtemp(prefix="voicerx-ui-"), "jobs.sqlite3"))
+
+from streamlit import logger as streamlit_logger  # noqa: E402
+from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent  # noqa: E402
+from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequests  # noqa: E402
+from streamlit.testing.v1 import AppTest, app_test  # noqa: E402
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner, require_widgets_deltas  # noqa: E402
+from streamlit.testing.v1.element_tree import parse_tree_from_messages  # noqa: E402
+
+RESPONSES_FILE = os.path.join(BENCHMARKS, "data", "azure_responses.json")
+PORTAL_TITLES = {'patient': "Patient Portal", 'doctor': "Doctor Portal"}
+
+
+class MeasuringScriptRunner(LocalScriptRunner):
+    """LocalScriptRunner that counts forward messages and can run a single fragment"""
+
+    fragment_id: Optional[str] = None
+    last_run: Dict[str, float] = {}
+    last_messages: list = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+        def count(sender, event, **data):
+            if event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG:
+                self.sent.append(data['forward_msg'])
+
+        self.on_event.connect(count, weak=False)
+
+    def run(self, widget_state=None, query_params=None, timeout=3, page_hash=""):
+        fragment_id = MeasuringScriptRunner.fragment_id
+        rerun_data = RerunData(widget_states=widget_state, page_script_hash=page_hash)
+        if fragment_id:
+            # The constructor queued a full-app rerun, which would absorb a fragment request
+            self._requests = ScriptRequests()
+            rerun_data = RerunData(widget_states=widget_state, page_script_hash=page_hash,
+                                   fragment_id_queue=[fragment_id], is_fragment_scoped_rerun=True)
+        started = time.perf_counter()
+        self.request_rerun(rerun_data)
+        try:
+            if not self._script_thread:
+                self.start()
+            require_widgets_deltas(self, timeout)
+        finally:
+            self.join()
+        MeasuringScriptRunner.last_run = {
+            'seconds': time.perf_counter() - started,
+            'messages': len(self.sent),
+            'bytes': sum(message.ByteSize() for message in self.sent),
+        }
+        MeasuringScriptRunner.last_messages = self.sent
+        return parse_tree_from_messages(self.forward_msgs())
+
+
+def session_fixture() -> dict:
+    """Session state of a finished consult, shaped like the pipeline's job results"""
+    from neo4j_standin import StandInDriver
+
+    with open(RESPONSES_FILE, encoding="utf-8") as f:
+        responses = json.load(f)
+
+    def transcription(stem: str) -> dict:
+        original = responses['transcriptions'][stem]
+        translated = responses['translations'].get(stem)
+        return {
+            'original_text': original['text'],
+            'english_text': (translated or original)['text'],
+            'detected_language': original.get('language', "english"),
+            'translated': translated is not None,
+        }
+
+    chat = {entry['match']: entry['content'] for entry in responses['chat']}
+    analysis = json.loads(chat["Analyze the medical transcript"])
+    driver = StandInDriver(round_trip=0)
+    snomed = {term: [list(match) for match in driver.index.search(term, 10)]
+              for term in analysis.get('preferred_terms') or analysis['diseases'] + analysis['symptoms']}
+    driver.close()
+    return {
+        'patient_transcription': transcription("user104_20250623_201946"),
+        'patient_analysis': analysis,
+        'patient_snomed': snomed,
+        'doctor_transcription': transcription("user104_doctor_20250623_202037"),
+        'clinical_note': chat["clinical documentation specialist"],
+    }
+
+
+def portal_fragments(messages) -> Dict[str, str]:
+    """Fragment id of each portal, found from the deltas it emitted"""
+    found = {}
+    for message in messages:
+        fragment_id = message.delta.fragment_id if message.HasField("delta") else ""
+        if not fragment_id:
+            continue
+        for role, title in PORTAL_TITLES.items():
+            if title in str(message.delta):
+                found.setdefault(role, fragment_id)
+    return found
+
+
+def measure(app: AppTest, runs: int, fragment_id: Optional[str] = None) -> Dict[str, float]:
+    MeasuringScriptRunner.fragment_id = fragment_id
+    seconds = []
+    for _ in range(runs):
+        app.run()
+        if app.exception:
+            raise SystemExit(f"App raised: {app.exception[0].value}")
+        seconds.append(MeasuringScriptRunner.last_run['seconds'])
+    MeasuringScriptRunner.fragment_id = None
+    return {
+        'median': statistics.median(seconds),
+        'p95': sorted(seconds)[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+        'messages': MeasuringScriptRunner.last_run['messages'],
+        'bytes': MeasuringScriptRunner.last_run['bytes'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="reruns timed per scenario")
+    parser.add_argument("--save", help="write the results as JSON")
+    args = parser.parse_args()
+
+    app_test.LocalScriptRunner = MeasuringScriptRunner
+    app = AppTest.from_file(os.path.join(ROOT, "voicerx.py"), default_timeout=60)
+    for key, value in session_fixture().items():
+        app.session_state[key] = value
+    app.run()  # first run: imports, cache_resource and the HTML caches
+    streamlit_logger.set_log_level("error")  # after the first run has applied the config
+    results: Dict[str, Dict[str, float]] = {'full': measure(app, args.runs)}
+    fragments = portal_fragments(MeasuringScriptRunner.last_messages)
+    for role in PORTAL_TITLES:
+        if role in fragments:
+            results[role] = measure(app, args.runs, fragments[role])
+
+    print(f"\nRerun cost with a finished consult on screen ({args.runs} runs per scenario)")
+    print(f"{'scenario':<12}{'median ms':>12}{'p95 ms':>10}{'messages':>10}{'bytes':>10}")
+    for name, row in results.items():
+        print(f"{name:<12}{row['median'] * 1000:>12.1f}{row['p95'] * 1000:>10.1f}{row['messages']:>10}{row['bytes']:>10}")
+    if not fragments:
+        print("The portals are not fragments: every interaction reruns the whole app.")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Process-wide registry of pooled Azure OpenAI and Neo4j clients.
+
+Each client is built once per server process and reused by every pipeline
+step, so consults share keep-alive HTTPS connections to Azure and a single
+Bolt connection pool to Neo4j instead of reconnecting on every call.
+
+Pool sizes are configurable through environment variables:
+- VOICERX_HTTP_MAX_CONNECTIONS (default 20)
+- VOICERX_HTTP_MAX_KEEPALIVE (default 10)
+- VOICERX_HTTP_KEEPALIVE_EXPIRY seconds (default 60)
+- VOICERX_NEO4J_POOL_SIZE (default 50)
+- VOICERX_NEO4J_ACQUIRE_TIMEOUT seconds (default 30)
+
+The optional local Whisper model (faster-whisper) is loaded once and shared
+the same way; see local_asr_config for its settings.
+
+The openai, httpx and neo4j SDKs are imported when their client is first
+built, not when this module is imported, so they stay off the app's
+startup path (voicerx.py builds them in a background warm-up).
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, Dict
+
+import metrics
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AzureOpenAI
+
+logger = logging.getLogger(__name__)
+
+WHISPER_API_VERSION = "2024-06-01"
+CHAT_API_VERSION = "2025-01-01-preview"
+
+_lock = threading.Lock()
+_clients: Dict[str, object] = {}
+
+
+def _env_number(name: str, default, cast=int):
+    """Read a numeric setting from the environment, falling back on bad values"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def pool_config() -> dict:
+    """Current pool sizing, as read from the environment"""
+    return {
+        'http_max_connections': _env_number("VOICERX_HTTP_MAX_CONNECTIONS", 20),
+        'http_max_keepalive': _env_number("VOICERX_HTTP_MAX_KEEPALIVE", 10),
+        'http_keepalive_expiry': _env_number("VOICERX_HTTP_KEEPALIVE_EXPIRY", 60.0, float),
+        'neo4j_pool_size': _env_number("VOICERX_NEO4J_POOL_SIZE", 50),
+        'neo4j_acquire_timeout': _env_number("VOICERX_NEO4J_ACQUIRE_TIMEOUT", 30.0, float),
+    }
+
+
+def local_asr_config() -> dict:
+    """Settings for the local faster-whisper model"""
+    return {
+        'model': os.getenv("VOICERX_LOCAL_ASR_MODEL", "small"),
+        'compute_type': os.getenv("VOICERX_LOCAL_ASR_COMPUTE", "int8"),
+        'cpu_threads': _env_number("VOICERX_LOCAL_ASR_THREADS", 4),
+        'num_workers': _env_number("VOICERX_LOCAL_ASR_WORKERS", 2),
+        'batch_size': _env_number("VOICERX_LOCAL_ASR_BATCH", 8),
+    }
+
+
+def _get_or_create(key: str, factory: Callable[[], object]):
+    """Return the shared client for key, building it on first use"""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                metrics.incr(f"client_pool.{key}.miss")
+                logger.info(f"Creating pooled client '{key}'")
+                client = factory()
+                _clients[key] = client
+                return client
+    metrics.incr(f"client_pool.{key}.hit")
+    return client
+
+
+def _http_client() -> "httpx.Client":
+    """Keep-alive HTTP client with a bounded connection pool"""
+    import httpx
+    from openai import DefaultHttpxClient
+
+    config = pool_config()
+    limits = httpx.Limits(
+        max_connections=config['http_max_connections'],
+        max_keepalive_connections=config['http_max_keepalive'],
+        keepalive_expiry=config['http_keepalive_expiry']
+    )
+    return DefaultHttpxClient(limits=limits, timeout=httpx.Timeout(120.0, connect=10.0))
+
+
+def get_whisper_client() -> "AzureOpenAI":
+    """Shared client for the Whisper deployment"""
+    def build():
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=WHISPER_API_VERSION,
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            http_client=_http_client(),
+            max_retries=0  # retries and backoff are handled by rate_limit.py
+        )
+    return _get_or_create("whisper", build)
+
+
+def get_chat_client() -> "AzureOpenAI":
+    """Shared client for the GPT-4o chat deployment"""
+    def build():
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(
+            azure_endpoint=os.getenv("AZURE_OPENAI_CHAT_ENDPOINT"),
+            api_key=os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
+            api_version=CHAT_API_VERSION,
+            http_client=_http_client(),
+            max_retries=0  # retries and backoff are handled by rate_limit.py
+        )
+    return _get_or_create("chat", build)
+
+
+def get_neo4j_driver():
+    """Shared Neo4j driver; sessions borrow connections from its pool"""
+    def build():
+        from neo4j import GraphDatabase
+
+        config = pool_config()
+        return GraphDatabase.driver(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            auth=(os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "aakash@123")),
+            max_connection_pool_size=config['neo4j_pool_size'],
+            connection_acquisition_timeout=config['neo4j_acquire_timeout'],
+            keep_alive=True
+        )
+    return _get_or_create("neo4j", build)
+
+
+def get_local_snomed_index():
+    """Shared memory-mapped offline SNOMED index (see snomed_index.py)"""
+    def build():
+        # Needs numpy; only imported when VOICERX_SNOMED_BACKEND is local or hybrid
+        from snomed_index import LocalSnomedIndex
+
+        return LocalSnomedIndex(os.getenv("VOICERX_SNOMED_INDEX", "snomed_index"))
+    return _get_or_create("snomed_index", build)
+
+
+def get_local_asr_model():
+    """Shared int8 faster-whisper model wrapped for batched decoding; loaded on first use"""
+    def build():
+        # Optional dependency: only needed when VOICERX_ASR_BACKEND=local
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+        config = local_asr_config()
+        model = WhisperModel(
+            config['model'],
+            device="cpu",
+            compute_type=config['compute_type'],
+            cpu_threads=config['cpu_threads'],
+            num_workers=config['num_workers']
+        )
+        return BatchedInferencePipeline(model=model)
+    return _get_or_create("local_asr", build)
+
+
+def register_client(key: str, client: object) -> None:
+    """Install a ready-made client under key, e.g. a local stand-in for benchmarks"""
+    with _lock:
+        previous = _clients.get(key)
+        _clients[key] = client
+    if previous is not None and previous is not client and hasattr(previous, "close"):
+        previous.close()
+
+
+def discard_client(key: str) -> None:
+    """Drop a client (e.g. after a connection failure) so the next call rebuilds it"""
+    with _lock:
+        client = _clients.pop(key, None)
+    if client is not None and hasattr(client, "close"):
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Closing client '{key}' failed: {str(e)}")
+
+
+def close_all() -> None:
+    """Close every pooled client; called at interpreter exit"""
+    for key in list(_clients):
+        discard_client(key)
+
+
+def pool_stats() -> dict:
+    """Hit/miss counters for each pooled client plus the configured pool sizes"""
+    counters = metrics.snapshot()['counters']
+    stats = {}
+    for name, value in counters.items():
+        if name.startswith("client_pool."):
+            _, key, kind = name.split(".")
+            stats.setdefault(key, {'hit': 0, 'miss': 0})[kind] = int(value)
+    return {'clients': stats, 'config': pool_config()}
+
+
+atexit.register(close_all)
@@ -0,0 +1,326 @@
+"""
+Persistent, indexed store of consults.
+
+Each consult (patient and doctor transcripts, analysis, SNOMED CT matches
+and clinical note) is one row in a local SQLite database in WAL mode, so a
+reload can restore it and past consults can be searched:
+- by user or patient, newest first (indexed with the consult time)
+- by SNOMED CT concept ID: the best match for each looked-up term is
+  indexed with the consult time, e.g. every consult coded 25064002 this month
+- by text, through an FTS5 index over the transcripts and the note (a LIKE
+  scan where SQLite is built without FTS5)
+
+save() only queues the consult. A writer thread commits queued consults
+in batches, one transaction per batch, so the UI never waits on a write.
+Saving the same consult again (e.g. once the doctor's note is ready)
+updates it. Reads use their own connection and, under WAL, never wait for
+the writer.
+
+Settings:
+- VOICERX_CONSULT_DB: database path (default .cache/voicerx_consults.sqlite3)
+- VOICERX_CONSULT_FLUSH_SECONDS: longest a queued consult waits to be written (default 0.5)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Session state keys that make up a consult
+CONSULT_FIELDS = (
+    'patient_transcription', 'patient_analysis', 'patient_snomed',
+    'doctor_transcription', 'doctor_phrases', 'doctor_snomed', 'clinical_note',
+)
+
+_BATCH_SIZE = 100
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS consults (
+        id INTEGER PRIMARY KEY,
+        consult_id TEXT NOT NULL UNIQUE,
+        user TEXT NOT NULL,
+        patient TEXT,
+        created REAL NOT NULL,
+        updated REAL NOT NULL,
+        patient_transcript TEXT,
+        doctor_transcript TEXT,
+        clinical_note TEXT,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS consults_user ON consults (user, created)",
+    "CREATE INDEX IF NOT EXISTS consults_patient ON consults (patient, created)",
+    "CREATE INDEX IF NOT EXISTS consults_created ON consults (created)",
+    """
+    CREATE TABLE IF NOT EXISTS consult_concepts (
+        consult INTEGER NOT NULL REFERENCES consults (id) ON DELETE CASCADE,
+        concept_id TEXT NOT NULL,
+        term TEXT NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (consult, concept_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS consult_concepts_concept ON consult_concepts (concept_id, created)",
+]
+
+# External-content FTS5 table kept in sync with consults by triggers
+_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS consults_fts USING fts5(
+        patient_transcript, doctor_transcript, clinical_note,
+        content='consults', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consults_fts_insert AFTER INSERT ON consults BEGIN
+        INSERT INTO consults_fts (rowid, patient_transcript, doctor_transcript, clinical_note)
+        VALUES (new.id, new.patient_transcript, new.doctor_transcript, new.clinical_note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consults_fts_delete AFTER DELETE ON consults BEGIN
+        INSERT INTO consults_fts (consults_fts, rowid, patient_transcript, doctor_transcript, clinical_note)
+        VALUES ('delete', old.id, old.patient_transcript, old.doctor_transcript, old.clinical_note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consults_fts_update AFTER UPDATE ON consults BEGIN
+        INSERT INTO consults_fts (consults_fts, rowid, patient_transcript, doctor_transcript, clinical_note)
+        VALUES ('delete', old.id, old.patient_transcript, old.doctor_transcript, old.clinical_note);
+        INSERT INTO consults_fts (rowid, patient_transcript, doctor_transcript, clinical_note)
+        VALUES (new.id, new.patient_transcript, new.doctor_transcript, new.clinical_note);
+    END
+    """,
+]
+
+
+def _english_text(transcription: Optional[dict]) -> Optional[str]:
+    return transcription.get('english_text') if transcription else None
+
+
+def consult_concepts(consult: dict) -> Dict[str, str]:
+    """Concept ID -> term of the best SNOMED CT match for each term looked up for the patient or doctor"""
+    concepts = {}
+    for role in ('patient', 'doctor'):
+        for term, matches in (consult.get(f'{role}_snomed') or {}).items():
+            if matches:
+                concepts.setdefault(str(matches[0][0]), term)
+    return concepts
+
+
+def _fts_query(text: str) -> str:
+    """Every word must match; words are quoted so user input can't use FTS5 syntax"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class ConsultStore:
+    """SQLite consult table with user, patient, time, concept and full-text indexes, plus a batching writer"""
+
+    def __init__(self, path: str, flush_seconds: float = 0.5):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.fts = True
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._queue: "queue.Queue[dict]" = queue.Queue()
+        self._pending: Dict[str, dict] = {}
+        self._writer: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "ConsultStore":
+        return cls(
+            path=os.getenv("VOICERX_CONSULT_DB", os.path.join(".cache", "voicerx_consults.sqlite3")),
+            flush_seconds=float(os.getenv("VOICERX_CONSULT_FLUSH_SECONDS", "0.5"))
+        )
+
+    def _open(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """Read connection; creates the schema on first use"""
+        if self._conn is None:
+            conn = self._open()
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            try:
+                for statement in _FTS_SCHEMA:
+                    conn.execute(statement)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"SQLite has no FTS5 ({str(e)}); consult text search will scan")
+                self.fts = False
+            self._conn = conn
+        return self._conn
+
+    def save(self, consult: dict) -> None:
+        """
+        Queue a consult for writing. consult: consult_id, user, optional
+        patient and created (epoch seconds), plus any of CONSULT_FIELDS.
+        """
+        consult = dict(consult, saved=time.time())
+        with self._lock:
+            self._pending[consult['consult_id']] = consult
+            if self._writer is None:
+                self._connection()
+                self._writer = threading.Thread(target=self._write_loop, name="voicerx-consult-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        self._queue.put(consult)
+        metrics.incr("consult_store.queued")
+
+    def flush(self) -> None:
+        """Wait until every queued consult is written"""
+        self._queue.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < _BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[dict]) -> None:
+        # Later saves of a consult supersede earlier ones in the same batch
+        latest = {consult['consult_id']: consult for consult in batch}
+        started = time.perf_counter()
+        if self._writer_conn is None:
+            self._writer_conn = self._open()
+        conn = self._writer_conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for consult in latest.values():
+                self._upsert(conn, consult)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            metrics.incr("consult_store.write_failed", len(latest))
+            logger.warning(f"Consult store write of {len(latest)} consults failed: {str(e)}")
+        else:
+            metrics.observe("consult_store.batch_size", len(latest))
+            metrics.observe("consult_store.write_seconds", time.perf_counter() - started)
+        with self._lock:
+            for consult_id, consult in latest.items():
+                if self._pending.get(consult_id) is consult:
+                    del self._pending[consult_id]
+
+    def _upsert(self, conn: sqlite3.Connection, consult: dict) -> None:
+        created = consult.get('created') or consult['saved']
+        data = json.dumps({field: consult.get(field) for field in CONSULT_FIELDS}, default=str)
+        row_id = conn.execute(
+            """
+            INSERT INTO consults (consult_id, user, patient, created, updated,
+                                  patient_transcript, doctor_transcript, clinical_note, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (consult_id) DO UPDATE SET
+                patient = excluded.patient, updated = excluded.updated,
+                patient_transcript = excluded.patient_transcript, doctor_transcript = excluded.doctor_transcript,
+                clinical_note = excluded.clinical_note, data = excluded.data
+            RETURNING id, created
+            """,
+            (consult['consult_id'], consult['user'], consult.get('patient'), created, consult['saved'],
+             _english_text(consult.get('patient_transcription')), _english_text(consult.get('doctor_transcription')),
+             consult.get('clinical_note'), data)
+        ).fetchone()
+        conn.execute("DELETE FROM consult_concepts WHERE consult = ?", (row_id['id'],))
+        conn.executemany(
+            "INSERT INTO consult_concepts (consult, concept_id, term, created) VALUES (?, ?, ?, ?)",
+            [(row_id['id'], concept_id, term, row_id['created']) for concept_id, term in consult_concepts(consult).items()]
+        )
+
+    def load(self, consult_id: str) -> Optional[dict]:
+        """Stored consult (queued or written) with its CONSULT_FIELDS, or None"""
+        with self._lock:
+            pending = self._pending.get(consult_id)
+            if pending is not None:
+                return {key: value for key, value in pending.items() if key != 'saved'}
+            row = self._connection().execute(
+                "SELECT consult_id, user, patient, created, data FROM consults WHERE consult_id = ?", (consult_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        consult = {key: row[key] for key in ('consult_id', 'user', 'patient', 'created')}
+        consult.update(json.loads(row['data']))
+        return consult
+
+    def search(self, text: Optional[str] = None, concept_id: Optional[str] = None, user: Optional[str] = None,
+               patient: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+               limit: int = 50) -> List[dict]:
+        """
+        Written consults matching every given filter, newest first, as
+        summaries: consult_id, user, patient, created and a snippet of the
+        matching text (or the start of the note). since / until are epoch seconds.
+        """
+        # With a concept, rows come from its (concept_id, created) index, already newest first
+        table = "cc" if concept_id else "c"
+        source = "consult_concepts cc JOIN consults c ON c.id = cc.consult" if concept_id else "consults c"
+        conditions, params = [], []
+        if concept_id:
+            conditions.append("cc.concept_id = ?")
+            params.append(concept_id)
+        for column, value in (('user', user), ('patient', patient)):
+            if value:
+                conditions.append(f"c.{column} = ?")
+                params.append(value)
+        for operator, bound in ((">=", since), ("<", until)):
+            if bound is not None:
+                conditions.append(f"{table}.created {operator} ?")
+                params.append(bound)
+
+        snippet = "substr(COALESCE(c.clinical_note, c.patient_transcript, ''), 1, 160)"
+        if text and self.fts:
+            source += " JOIN consults_fts ON consults_fts.rowid = c.id"
+            snippet = "snippet(consults_fts, -1, '**', '**', '…', 16)"
+            conditions.append("consults_fts MATCH ?")
+            params.append(_fts_query(text))
+        elif text:
+            columns = ("c.patient_transcript", "c.doctor_transcript", "c.clinical_note")
+            for word in text.split():
+                conditions.append("(" + " OR ".join(f"{column} LIKE ?" for column in columns) + ")")
+                params.extend([f"%{word}%"] * len(columns))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        started = time.perf_counter()
+        with self._lock:
+            rows = self._connection().execute(
+                f"""
+                SELECT c.consult_id, c.user, c.patient, c.created, {snippet} AS snippet
+                FROM {source} {where}
+                ORDER BY {table}.created DESC LIMIT ?
+                """,
+                (*params, limit)
+            ).fetchall()
+        metrics.observe("consult_store.search_seconds", time.perf_counter() - started)
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            consults = conn.execute("SELECT COUNT(*) FROM consults").fetchone()[0]
+            concepts = conn.execute("SELECT COUNT(DISTINCT concept_id) FROM consult_concepts").fetchone()[0]
+        return {'consults': consults, 'concepts': concepts, 'queued': self._queue.qsize(), 'fts': self.fts}
@@ -0,0 +1,248 @@
+"""
+Background job queue for consult processing.
+
+Each patient or doctor recording becomes a job that a pool of worker
+threads processes outside the Streamlit script. A slow Azure call then no
+longer blocks the user's UI, and a rerun does not lose in-flight work: the
+UI polls the job by id and copies the result into st.session_state when it
+is done. Handlers can publish partial results (e.g. the transcript, or the
+clinical note as it streams) which are stored in the job row.
+
+Jobs live in a local SQLite table, so queued and interrupted jobs survive a
+server restart. Failed jobs are retried with exponential backoff.
+
+Settings:
+- VOICERX_JOB_DB: database path (default .cache/voicerx_jobs.sqlite3)
+- VOICERX_JOB_WORKERS: jobs processed concurrently (default 4)
+- VOICERX_JOB_MAX_ATTEMPTS: tries before a job is marked failed (default 3)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# handler(payload, progress) -> result; progress(dict) merges partial results into the job row
+Handler = Callable[[dict, Callable[[dict], None]], Any]
+
+# Finished jobs older than this are deleted when the queue starts
+_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class JobQueue:
+    """SQLite-backed job table plus a fixed pool of worker threads"""
+
+    def __init__(self, path: str, workers: int, max_attempts: int, handlers: Dict[str, Handler]):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.handlers = handlers
+        self._lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._threads = []
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls, handlers: Dict[str, Handler]) -> "JobQueue":
+        return cls(
+            path=os.getenv("VOICERX_JOB_DB", os.path.join(".cache", "voicerx_jobs.sqlite3")),
+            workers=int(os.getenv("VOICERX_JOB_WORKERS", "4")),
+            max_attempts=int(os.getenv("VOICERX_JOB_MAX_ATTEMPTS", "3")),
+            handlers=handlers
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    after TEXT,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    available REAL NOT NULL,
+                    started REAL,
+                    finished REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available)")
+            self._conn = conn
+        return self._conn
+
+    def start(self) -> None:
+        """Requeue jobs interrupted by a previous shutdown and start the workers (once)"""
+        with self._lock:
+            if self._threads:
+                return
+            conn = self._connection()
+            conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                         (*FINISHED, time.time() - _RETENTION_SECONDS))
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"voicerx-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, payload: dict, after: Optional[str] = None) -> str:
+        """
+        Queue a job and return its id. With after, the job waits until that
+        job has finished and receives its result as payload['after'].
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO jobs (id, kind, status, payload, after, created, available) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), after, now, now)
+            )
+        metrics.incr(f"jobs.{kind}.submitted")
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Job state: status, progress, result, error, attempts and timings"""
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ('payload', 'progress', 'result'):
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        job['duration'] = (job['finished'] or time.time()) - job['started'] if job['started'] else None
+        return job
+
+    def update_progress(self, job_id: str, progress: dict) -> None:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            merged = dict(json.loads(row['progress']), **progress)
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(merged), job_id))
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest runnable job to running"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE status = ? AND available <= ?
+                      AND (after IS NULL OR after IN (SELECT id FROM jobs WHERE status IN (?, ?))
+                           OR after NOT IN (SELECT id FROM jobs))
+                    ORDER BY created LIMIT 1
+                    """,
+                    (QUEUED, now, *FINISHED)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, now, row['id'])
+                    )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _work(self) -> None:
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Job queue read failed: {str(e)}")
+                row = None
+            if row is None:
+                with self._wake:
+                    self._wake.wait(timeout=0.5)
+                continue
+            self._run(row)
+
+    def _run(self, row: sqlite3.Row) -> None:
+        job_id, kind = row['id'], row['kind']
+        payload = json.loads(row['payload'])
+        if row['after']:
+            previous = self.get(row['after'])
+            payload['after'] = previous['result'] if previous else None
+        metrics.observe(f"jobs.{kind}.wait_seconds", time.time() - row['created'])
+        started = time.perf_counter()
+        try:
+            result = self.handlers[kind](payload, lambda progress: self.update_progress(job_id, progress))
+        except Exception as e:
+            self._failed(job_id, kind, row['attempts'] + 1, e)
+            return
+        duration = time.perf_counter() - started
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, finished = ? WHERE id = ?",
+                (SUCCEEDED, json.dumps(result, default=str), time.time(), job_id)
+            )
+        metrics.observe(f"jobs.{kind}.duration_seconds", duration)
+        metrics.incr(f"jobs.{kind}.succeeded")
+        logger.info(f"Job {job_id} ({kind}) finished in {duration:.2f}s")
+        with self._wake:
+            self._wake.notify_all()
+
+    def _failed(self, job_id: str, kind: str, attempts: int, error: Exception) -> None:
+        """Requeue with exponential backoff, or mark failed after max_attempts"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            if attempts < self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, available = ? WHERE id = ?",
+                    (QUEUED, str(error), now + min(30, 2 ** attempts), job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                    (FAILED, str(error), now, job_id)
+                )
+        if attempts < self.max_attempts:
+            metrics.incr(f"jobs.{kind}.retried")
+            logger.warning(f"Job {job_id} ({kind}) attempt {attempts} failed, retrying: {str(error)}")
+        else:
+            metrics.incr(f"jobs.{kind}.failed")
+            logger.error(f"Job {job_id} ({kind}) failed after {attempts} attempts: {str(error)}")
+
+    def stats(self) -> dict:
+        """Job counts by kind and status, with mean/max durations of finished jobs"""
+        with self._lock:
+            rows = self._connection().execute(
+                """
+                SELECT kind, status, COUNT(*), AVG(finished - started), MAX(finished - started)
+                FROM jobs GROUP BY kind, status
+                """
+            ).fetchall()
+        stats: Dict[str, dict] = {}
+        for kind, status, count, mean, longest in rows:
+            entry = stats.setdefault(kind, {})
+            entry[status] = count
+            if status in FINISHED and mean is not None:
+                entry[f'{status}_mean_seconds'] = round(mean, 3)
+                entry[f'{status}_max_seconds'] = round(longest, 3)
+        return {'workers': self.workers, 'kinds': stats}
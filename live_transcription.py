@@ -0,0 +1,262 @@
+"""
+Incremental transcription of a recording that is still in progress.
+
+Audio frames are fed in as they arrive from the browser. Every
+VOICERX_LIVE_STEP seconds of new audio, the uncommitted part of the
+recording is re-transcribed in the background. Words on which two
+consecutive hypotheses agree form the stable prefix (LocalAgreement): they
+are shown as settled and handed to on_stable, e.g. to start disease
+extraction while the patient is still talking. on_stable may return a
+Future; it is not called again until that Future is done, so at most one
+early extraction runs at a time and only the latest is kept
+(early_result).
+
+Once the uncommitted audio grows past VOICERX_LIVE_WINDOW seconds, it is cut
+at the quietest point and the part before the cut is committed (and, for a
+non-English speaker, translated). Each decode therefore covers at most one
+window, and the final transcript and translation are ready one short decode
+after the recording stops.
+
+Each decode re-sends the pending window. With a paid backend (Azure
+Whisper), decodes of every live session in the process share a budget of
+VOICERX_LIVE_RPM requests per minute, well under the Whisper quota, so
+live capture cannot starve uploaded and batch consults: a step that finds
+the budget used up is skipped and the audio is decoded at a later step.
+The local backend is not limited.
+
+Settings:
+- VOICERX_LIVE_STEP: seconds of new audio between decodes (default 1.0)
+- VOICERX_LIVE_WINDOW: max seconds of uncommitted audio (default 15)
+- VOICERX_LIVE_RPM: paid ASR requests per minute for all live sessions
+  (default a quarter of VOICERX_WHISPER_RPM)
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import metrics
+from asr import get_asr_backend
+from audio_chunking import find_segments, stitch_transcripts
+from audio_preprocess import TARGET_RATE, encode, resample
+from rate_limit import QUOTAS, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[^\w']+")
+
+
+_budget: Optional[TokenBucket] = None
+_budget_lock = threading.Lock()
+
+
+def _live_budget() -> TokenBucket:
+    """Process-wide bucket for live decodes on a paid backend, sized on first use"""
+    global _budget
+    if _budget is None:
+        rpm_var, rpm_default = QUOTAS['whisper'][:2]
+        whisper_rpm = float(os.getenv(rpm_var, rpm_default)) or 60.0
+        _budget = TokenBucket(float(os.getenv("VOICERX_LIVE_RPM", whisper_rpm / 4)))
+    return _budget
+
+
+def _take_budget(requests: int, required: bool = False) -> bool:
+    """
+    Charge requests to the live budget. Unless required, nothing is charged
+    and False is returned when the budget has no room.
+    """
+    with _budget_lock:
+        budget, now = _live_budget(), time.monotonic()
+        if not required and not budget.has(requests, now):
+            return False
+        budget.reserve(requests, now)
+        return True
+
+
+def pcm_to_float(pcm: np.ndarray, channels: int) -> np.ndarray:
+    """Interleaved int16 PCM (as delivered by WebRTC audio frames) to mono float32"""
+    samples = pcm.reshape(-1).astype(np.float32) / 32768
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _common_prefix(left: List[str], right: List[str]) -> int:
+    count = 0
+    for a, b in zip(left, right):
+        if _WORD.sub("", a.lower()) != _WORD.sub("", b.lower()):
+            break
+        count += 1
+    return count
+
+
+class IncrementalTranscriber:
+    """Re-transcribes the growing tail of a recording; feed() never blocks on ASR"""
+
+    def __init__(self, backend=None, on_stable: Optional[Callable[[str], Optional[Future]]] = None,
+                 step_seconds: Optional[float] = None, window_seconds: Optional[float] = None):
+        self.backend = backend or get_asr_backend()
+        self.paid = getattr(self.backend, 'name', None) != 'local'
+        self.on_stable = on_stable
+        self.step_seconds = step_seconds or float(os.getenv("VOICERX_LIVE_STEP", "1.0"))
+        self.window_seconds = window_seconds or float(os.getenv("VOICERX_LIVE_WINDOW", "15"))
+        self.rate: Optional[int] = None
+        self.language = 'unknown'
+
+        self._lock = threading.Lock()
+        self._recording: List[np.ndarray] = []   # everything fed so far, at the input rate
+        self._pending: List[np.ndarray] = []     # audio not yet committed
+        self._pending_len = 0
+        self._decoded_len = 0                    # _pending_len at the last decode
+        self._committed: List[str] = []
+        self._committed_english: List[Optional[str]] = []     # None: committed before the language was known
+        self._untranslated: List[Optional[np.ndarray]] = []  # audio of the chunks still to translate
+        self._words: List[str] = []              # latest hypothesis for the pending audio
+        self._stable = 0                         # leading words of _words both hypotheses agree on
+        self._spoken_stable = ""
+        self.early_result: Optional[Future] = None  # latest on_stable Future
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voicerx-live")
+        self._inflight: Optional[Future] = None
+
+    def feed(self, samples: np.ndarray, rate: int) -> None:
+        """Append mono float samples; schedules a decode once enough new audio arrived"""
+        with self._lock:
+            if self.rate is None:
+                self.rate = rate
+            elif rate != self.rate:
+                samples = resample(samples, rate, self.rate)
+            self._recording.append(samples)
+            self._pending.append(samples)
+            self._pending_len += len(samples)
+            due = self._pending_len - self._decoded_len >= self.step_seconds * self.rate
+            idle = self._inflight is None or self._inflight.done()
+            if due and idle:
+                if self.paid and not _take_budget(1):
+                    metrics.incr("live.decode_throttled")
+                    return
+                self._inflight = self._executor.submit(self._decode)
+
+    @property
+    def stable_text(self) -> str:
+        with self._lock:
+            return stitch_transcripts(self._committed + [" ".join(self._words[:self._stable])])
+
+    @property
+    def unstable_text(self) -> str:
+        with self._lock:
+            return " ".join(self._words[self._stable:])
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return stitch_transcripts(self._committed + [" ".join(self._words)])
+
+    def _transcribe(self, samples: np.ndarray) -> str:
+        data, extension = encode(resample(samples, self.rate, TARGET_RATE), TARGET_RATE, "wav")
+        text, language = self.backend.transcribe(f"live.{extension}", data)
+        if language and language != 'unknown':
+            self.language = language
+        return text
+
+    def _translating(self) -> bool:
+        return self.language.strip().lower() not in ('en', 'english', 'unknown')
+
+    def _translate(self, samples: np.ndarray) -> str:
+        data, extension = encode(resample(samples, self.rate, TARGET_RATE), TARGET_RATE, "wav")
+        return self.backend.translate(f"live.{extension}", data)
+
+    def _decode(self) -> None:
+        try:
+            self._decode_pending()
+        except Exception as e:
+            logger.error(f"Live transcription step failed: {str(e)}")
+
+    def _decode_pending(self) -> None:
+        started = time.perf_counter()
+        with self._lock:
+            audio = np.concatenate(self._pending) if self._pending else np.zeros(0, dtype=np.float32)
+            self._pending = [audio]
+            decoded_len = len(audio)
+
+        if decoded_len > self.window_seconds * self.rate:
+            # Commit everything before the quietest point of the window
+            cut = find_segments(audio, self.rate, self.window_seconds, 0.0)[0][1]
+            if self.paid:
+                # The commit sends one or two requests on top of the decode itself
+                _take_budget(2 if self._translating() else 1, required=True)
+            committed = self._transcribe(audio[:cut])
+            english = self._translate(audio[:cut]) if self._translating() else None
+            with self._lock:
+                self._committed.append(committed)
+                self._committed_english.append(english)
+                self._untranslated.append(audio[:cut] if english is None else None)
+                rest = np.concatenate(self._pending)[cut:]
+                self._pending, self._pending_len = [rest], len(rest)
+                self._words, self._stable = [], 0
+            audio, decoded_len = audio[cut:], decoded_len - cut
+
+        words = self._transcribe(audio).split()
+        with self._lock:
+            self._stable = _common_prefix(self._words, words)
+            self._words = words
+            self._decoded_len = decoded_len
+        metrics.observe("live.decode_seconds", time.perf_counter() - started)
+        self._notify_stable()
+
+    def _notify_stable(self) -> None:
+        """Pass the stable prefix on whenever it grows to the end of a sentence (English only)"""
+        if self.on_stable is None or self.language.strip().lower() not in ('en', 'english'):
+            return
+        if self.early_result is not None and not self.early_result.done():
+            return
+        stable = self.stable_text
+        if stable != self._spoken_stable and stable.rstrip().endswith((".", "?", "!")):
+            self._spoken_stable = stable
+            self.early_result = self.on_stable(stable)
+
+    def finish(self) -> dict:
+        """
+        Decode whatever arrived since the last step and return the final
+        transcript in the shape transcribe_audio_multilingual returns.
+        """
+        started = time.perf_counter()
+        if self._inflight is not None:
+            self._inflight.result()
+        with self._lock:
+            stale = self._pending_len != self._decoded_len
+        if stale:
+            self._decode_pending()
+        self._executor.shutdown(wait=False)
+
+        original_text = self.text
+        translated = self._translating()
+        english_text = original_text
+        if translated:
+            # Committed chunks were translated as they were committed; only the tail is left
+            with self._lock:
+                parts = list(zip(self._committed_english, self._untranslated))
+                tail = np.concatenate(self._pending) if self._pending else np.zeros(0, dtype=np.float32)
+            english = [text if text is not None else self._translate(audio) for text, audio in parts]
+            if len(tail):
+                english.append(self._translate(tail))
+            english_text = stitch_transcripts(english)
+        metrics.observe("live.finalize_seconds", time.perf_counter() - started)
+        return {
+            'original_text': original_text,
+            'english_text': english_text,
+            'detected_language': self.language,
+            'translated': translated
+        }
+
+    def samples(self) -> np.ndarray:
+        with self._lock:
+            return np.concatenate(self._recording) if self._recording else np.zeros(0, dtype=np.float32)
+
+    def wav_bytes(self) -> bytes:
+        """The whole recording as 16-bit WAV at the input rate, like st.audio_input returns"""
+        return encode(self.samples(), self.rate or TARGET_RATE, "wav")[0]
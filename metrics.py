@@ -0,0 +1,284 @@
+"""
+Process-wide counters and timing observations for VoiceRx.
+
+Streamlit re-executes the app script on every rerun but imported modules
+stay loaded, so anything recorded here lives for the whole server process.
+
+Per-consult tracing: code wrapped in span() is timed and, inside
+consult_trace(), recorded on that consult's trace together with every
+counter incremented meanwhile (cache hits, tokens, cost). The trace follows
+the consult through asyncio tasks and asyncio.to_thread; work handed to
+other thread pools must be wrapped with bind(). When the opentelemetry
+package is installed, every span is also exported as an OpenTelemetry span
+through the globally configured tracer provider.
+
+serve_prometheus() exposes all counters and observations in the Prometheus
+text format at /metrics (VOICERX_METRICS_PORT in the app).
+
+Cost estimates use Azure list prices, overridable for your agreement:
+- VOICERX_PRICE_WHISPER_MINUTE: USD per audio minute (default 0.006)
+- VOICERX_PRICE_CHAT_INPUT / VOICERX_PRICE_CHAT_OUTPUT: USD per million
+  GPT-4o prompt / completion tokens (default 2.50 / 10.00)
+"""
+import contextvars
+import functools
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional: spans are still recorded on the consult trace
+    otel_trace = None
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_observations: Dict[str, dict] = {}
+
+
+class ConsultTrace:
+    """Spans and counters recorded while one consult (or one job of it) is processed"""
+
+    def __init__(self, consult_id: str):
+        self.consult_id = consult_id
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def add_span(self, record: dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self) -> dict:
+        """JSON-serialisable copy: spans in start order, counters and wall time"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda record: record['start'])
+            return {
+                'consult_id': self.consult_id,
+                'seconds': round(time.perf_counter() - self.started, 3),
+                'spans': [dict(record, attributes=dict(record['attributes'])) for record in spans],
+                'counters': {name: round(value, 6) for name, value in self.counters.items()}
+            }
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("voicerx_consult_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("voicerx_span", default=None)
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Increment a named counter"""
+    with _lock:
+        _counters[name] += value
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.incr(name, value)
+
+
+def observe(name: str, value: float) -> None:
+    """Record a single observation (latency, size, ...) under a name"""
+    with _lock:
+        stats = _observations.get(name)
+        if stats is None:
+            _observations[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+        else:
+            stats['count'] += 1
+            stats['sum'] += value
+            stats['min'] = min(stats['min'], value)
+            stats['max'] = max(stats['max'], value)
+
+
+def snapshot() -> dict:
+    """Return a copy of all counters and observation summaries"""
+    with _lock:
+        observations = {}
+        for name, stats in _observations.items():
+            observations[name] = dict(stats, mean=stats['sum'] / stats['count'])
+        return {'counters': dict(_counters), 'observations': observations}
+
+
+def _otel_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    """
+    Time a block as a named span: observed as span.<name>.seconds, added to
+    the current consult trace and exported to OpenTelemetry if installed.
+    """
+    parent = _current_span.get()
+    trace = _current_trace.get()
+    record = {
+        'name': name,
+        'parent': parent['name'] if parent else None,
+        'start': round(time.perf_counter() - trace.started, 3) if trace else 0.0,
+        'attributes': dict(attributes)
+    }
+    exporter = (
+        otel_trace.get_tracer("voicerx").start_as_current_span(
+            name, attributes={key: _otel_value(value) for key, value in attributes.items() if value is not None}
+        ) if otel_trace is not None else nullcontext()
+    )
+    started = time.perf_counter()
+    with exporter as otel_span:
+        record['_otel'] = otel_span
+        token = _current_span.set(record)
+        try:
+            yield record
+        except Exception as e:
+            record['attributes']['error'] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            del record['_otel']
+            record['seconds'] = round(time.perf_counter() - started, 4)
+            observe(f"span.{name}.seconds", record['seconds'])
+            if trace is not None:
+                trace.add_span(record)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run the function inside span(name)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes) -> None:
+    """Attach attributes (sizes, counts, tokens) to the innermost open span"""
+    record = _current_span.get()
+    if record is None:
+        return
+    record['attributes'].update(attributes)
+    if record.get('_otel') is not None:
+        for key, value in attributes.items():
+            if value is not None:
+                record['_otel'].set_attribute(key, _otel_value(value))
+
+
+def record_span(name: str, seconds: float, **attributes) -> None:
+    """Add an already-timed span, for work that cannot sit in a with block (generators)"""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    observe(f"span.{name}.seconds", seconds)
+    if trace is not None:
+        trace.add_span({
+            'name': name,
+            'parent': parent['name'] if parent else None,
+            'start': round(time.perf_counter() - trace.started - seconds, 3),
+            'attributes': attributes,
+            'seconds': round(seconds, 4)
+        })
+
+
+@contextmanager
+def consult_trace(consult_id: str) -> Iterator[ConsultTrace]:
+    """Collect the spans and counters of everything run inside the block"""
+    trace = ConsultTrace(consult_id)
+    token = _current_trace.set(trace)
+    try:
+        with span("consult", consult_id=consult_id):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def bind(func: Callable) -> Callable:
+    """Wrap func to run in a copy of the caller's context, for thread pool submissions"""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def _price(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def record_usage(usage: Any, annotate: bool = True) -> dict:
+    """
+    Count prompt/completion tokens and estimated cost from a chat response's
+    usage; returns them as span attributes, which are also set on the current
+    span unless annotate is False.
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    if prompt_tokens is None:
+        return {}
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    cost = (prompt_tokens * _price("VOICERX_PRICE_CHAT_INPUT", 2.50)
+            + completion_tokens * _price("VOICERX_PRICE_CHAT_OUTPUT", 10.00)) / 1_000_000
+    incr("tokens.prompt", prompt_tokens)
+    incr("tokens.completion", completion_tokens)
+    incr("cost.chat_usd", cost)
+    attributes = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'cost_usd': round(cost, 6)}
+    if annotate:
+        set_attributes(**attributes)
+    return attributes
+
+
+def record_audio(seconds: Optional[float], uploaded_bytes: int = 0, billed: bool = True) -> None:
+    """Audio sent to speech recognition; billed audio is costed per minute"""
+    seconds = seconds or 0.0
+    incr("audio.seconds", seconds)
+    incr("audio.bytes_uploaded", uploaded_bytes)
+    attributes = {'audio_seconds': round(seconds, 2), 'bytes_uploaded': uploaded_bytes}
+    if billed:
+        cost = seconds / 60 * _price("VOICERX_PRICE_WHISPER_MINUTE", 0.006)
+        incr("cost.whisper_usd", cost)
+        attributes['cost_usd'] = round(cost, 6)
+    set_attributes(**attributes)
+
+
+def _prometheus_name(name: str) -> str:
+    return "voicerx_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text() -> str:
+    """All counters and observations in the Prometheus text exposition format"""
+    current = snapshot()
+    lines = []
+    for name, value in sorted(current['counters'].items()):
+        metric = _prometheus_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, stats in sorted(current['observations'].items()):
+        metric = _prometheus_name(name)
+        lines += [
+            f"# TYPE {metric} summary", f"{metric}_count {stats['count']}", f"{metric}_sum {stats['sum']}",
+            f"# TYPE {metric}_max gauge", f"{metric}_max {stats['max']}"
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics for Prometheus scraping on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _PrometheusHandler)
+    threading.Thread(target=server.serve_forever, name="voicerx-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,185 @@
+"""
+Prompt construction for clinical note generation.
+
+The request is laid out for Azure OpenAI prompt caching, which reuses the
+longest previously seen prefix of 1024 tokens or more:
+- the system message (NOTE_SYSTEM_PROMPT: role, style rules and the note
+  sections) is the same bytes for every consult and comes first
+- the user message carries only this consult's data
+
+SNOMED CT matches are sent compactly: each concept once, at most top_k
+matches per term scoring at least min_ratio of the term's best match, as
+unindented JSON of [conceptId, term] pairs without scores or semantic tags.
+
+The user message is held to a token budget, counted with tiktoken's GPT-4o
+encoding when tiktoken is installed (else about 4 characters per token).
+Over budget, fewer SNOMED matches are sent first, then none, then the
+middle of the longest transcript is cut.
+
+Tokens saved against sending every match as indented JSON and the full
+transcripts are logged per consult and counted as note_prompt.tokens_saved.
+
+Settings:
+- VOICERX_NOTE_PROMPT_TOKENS: user message budget (default 4000)
+- VOICERX_NOTE_SNOMED_TOP_K: matches per term (default 3)
+- VOICERX_NOTE_SNOMED_MIN_RATIO: minimum score relative to the term's best match (default 0.6)
+"""
+import functools
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+NOTE_SYSTEM_PROMPT = """You are an expert clinical documentation specialist. Write a structured clinical note for an electronic health record from the patient's and the doctor's transcripts, the extracted analysis and the SNOMED CT matches given.
+
+- Clinically accurate, professionally formatted, with clear headers and bullet points
+- SOAP (Subjective, Objective, Assessment, Plan) structure where appropriate
+- Cite the given SNOMED CT codes where applicable
+- Include severity and urgency, and any urgent care recommendations
+- Mention where a transcript was translated
+
+Sections:
+1. Patient Presentation & Chief Complaint
+2. Clinical Findings & Symptoms
+3. Assessment & Diagnosis
+4. Treatment Plan & Recommendations
+5. Medications & Dosage (if prescribed)
+6. Follow-up Instructions
+7. Clinical Codes & References"""
+
+_TRUNCATION_MARK = " [...] "
+
+
+def prompt_settings() -> dict:
+    return {
+        'max_tokens': int(os.getenv("VOICERX_NOTE_PROMPT_TOKENS", "4000")),
+        'top_k': int(os.getenv("VOICERX_NOTE_SNOMED_TOP_K", "3")),
+        'min_ratio': float(os.getenv("VOICERX_NOTE_SNOMED_MIN_RATIO", "0.6")),
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """GPT-4o tokenizer, or None to estimate from characters"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception as e:  # the encoding file is downloaded on first use
+        logger.warning(f"tiktoken encoding unavailable, estimating prompt tokens: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate_middle(text: str, max_tokens: int) -> str:
+    """Keep the start and end of text within max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    head = max_tokens // 2
+    if encoding is None:
+        return text[:head * 4] + _TRUNCATION_MARK + text[len(text) - (max_tokens - head) * 4:]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:head]) + _TRUNCATION_MARK + encoding.decode(tokens[len(tokens) - (max_tokens - head):])
+
+
+def compact_snomed(snomed: dict, top_k: int, min_ratio: float) -> Dict[str, list]:
+    """Term -> [[conceptId, term], ...]: the best matches per term, each concept listed once"""
+    compact, seen = {}, set()
+    for term, matches in snomed.items():
+        ranked = sorted(matches or [], key=lambda match: match[3], reverse=True)
+        if not ranked:
+            continue
+        threshold = ranked[0][3] * min_ratio
+        kept = []
+        for concept_id, label, _, score in ranked:
+            if len(kept) == top_k or score < threshold:
+                break
+            if concept_id not in seen:
+                seen.add(concept_id)
+                kept.append([concept_id, label])
+        if kept:
+            compact[term] = kept
+    return compact
+
+
+def _user_message(patient_transcript: str, patient_analysis: dict, doctor_transcript: str, snomed_json: str,
+                  patient_lang_info: dict, doctor_lang_info: dict) -> str:
+    return (
+        f"Patient (original language: {patient_lang_info.get('detected_language', 'English')}):\n"
+        f"Transcript: {patient_transcript}\n"
+        f"Conditions: {', '.join(patient_analysis.get('diseases', []))}\n"
+        f"Symptoms: {', '.join(patient_analysis.get('symptoms', []))}\n"
+        f"Severity: {patient_analysis.get('severity', 'Not assessed')}; "
+        f"Urgency: {patient_analysis.get('urgency', 'Not assessed')}\n\n"
+        f"Doctor (original language: {doctor_lang_info.get('detected_language', 'English')}):\n"
+        f"Transcript: {doctor_transcript}\n\n"
+        f"SNOMED CT matches by term, as [conceptId, term]:\n{snomed_json}"
+    )
+
+
+def build_note_messages(
+    patient_transcript: str,
+    patient_analysis: dict,
+    doctor_transcript: str,
+    doctor_snomed: dict,
+    patient_lang_info: dict,
+    doctor_lang_info: dict,
+    settings: Optional[dict] = None
+) -> List[dict]:
+    """System and user messages for note generation, within the token budget"""
+    settings = settings or prompt_settings()
+    doctor_snomed = doctor_snomed or {}
+    transcripts = {'patient': patient_transcript, 'doctor': doctor_transcript}
+
+    def build(snomed_json: str) -> str:
+        return _user_message(transcripts['patient'], patient_analysis, transcripts['doctor'], snomed_json,
+                             patient_lang_info, doctor_lang_info)
+
+    # Fewer matches per term, then none, until the message fits
+    for top_k in [*range(settings['top_k'], 0, -1), 0]:
+        snomed = compact_snomed(doctor_snomed, top_k, settings['min_ratio']) if top_k else {}
+        snomed_json = json.dumps(snomed, separators=(',', ':'), ensure_ascii=False)
+        prompt = build(snomed_json)
+        tokens = count_tokens(prompt)
+        if tokens <= settings['max_tokens']:
+            break
+
+    # Then cut the middle of the longest transcript
+    while tokens > settings['max_tokens']:
+        role = max(transcripts, key=lambda name: len(transcripts[name]))
+        length = count_tokens(transcripts[role])
+        if length <= 16:
+            break
+        transcripts[role] = _truncate_middle(transcripts[role], max(length - (tokens - settings['max_tokens']) - 8, 8))
+        prompt = build(snomed_json)
+        tokens = count_tokens(prompt)
+        metrics.incr("note_prompt.truncated")
+
+    previous_layout = (
+        count_tokens(json.dumps(doctor_snomed, indent=2)) - count_tokens(snomed_json)
+        + count_tokens(patient_transcript) + count_tokens(doctor_transcript)
+        - count_tokens(transcripts['patient']) - count_tokens(transcripts['doctor'])
+    )
+    saved = max(previous_layout, 0)
+    metrics.incr("note_prompt.tokens_saved", saved)
+    metrics.observe("note_prompt.tokens", tokens)
+    metrics.set_attributes(prompt_tokens_estimate=tokens, prompt_tokens_saved=saved)
+    logger.info(f"Clinical note prompt: {tokens} tokens, {saved} saved by compact SNOMED context and the budget")
+
+    return [
+        {"role": "system", "content": NOTE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
@@ -0,0 +1,169 @@
+"""
+Clinical phrase extraction for the doctor's transcript.
+
+Rather than sending the whole transcript to SNOMED CT as one fuzzy
+keyword, pull out short candidate phrases: medications, procedures and
+investigations, advice, and durations/frequencies. The default extractor
+is a local dictionary and regex pass with no model call. An LLM extractor
+is available for transcripts the rules do not cover.
+
+VOICERX_DOCTOR_PHRASES selects the extractor:
+- rules: local dictionary only (default)
+- llm: always ask GPT-4o
+- auto: rules first, GPT-4o only when the rules find nothing
+"""
+import json
+import logging
+import os
+import re
+from typing import Dict, List
+
+import metrics
+from clients import get_chat_client
+from rate_limit import limited_call
+
+logger = logging.getLogger(__name__)
+
+# Generic names, plus common Indian brand names mapped to their generic
+MEDICATIONS = {
+    "paracetamol": "paracetamol", "acetaminophen": "paracetamol", "crocin": "paracetamol",
+    "dolo": "paracetamol", "calpol": "paracetamol", "ibuprofen": "ibuprofen",
+    "combiflam": "ibuprofen", "diclofenac": "diclofenac", "aspirin": "aspirin",
+    "amoxicillin": "amoxicillin", "augmentin": "amoxicillin and clavulanic acid",
+    "azithromycin": "azithromycin", "ciprofloxacin": "ciprofloxacin",
+    "nitrofurantoin": "nitrofurantoin", "metronidazole": "metronidazole",
+    "doxycycline": "doxycycline", "cetirizine": "cetirizine", "levocetirizine": "levocetirizine",
+    "montelukast": "montelukast", "pantoprazole": "pantoprazole", "omeprazole": "omeprazole",
+    "ranitidine": "ranitidine", "ondansetron": "ondansetron", "domperidone": "domperidone",
+    "metformin": "metformin", "insulin": "insulin", "amlodipine": "amlodipine",
+    "telmisartan": "telmisartan", "atorvastatin": "atorvastatin", "salbutamol": "salbutamol",
+    "oral rehydration salts": "oral rehydration salts", "ors": "oral rehydration salts",
+    "antacid": "antacid", "cough syrup": "cough syrup", "antibiotic": "antibiotic",
+    "painkiller": "analgesic", "pain killer": "analgesic", "vitamin c": "vitamin c",
+    "vitamin d": "vitamin d", "iron supplement": "iron supplement", "calcium": "calcium",
+}
+
+PROCEDURES = {
+    "complete blood count": "complete blood count", "cbc": "complete blood count",
+    "blood test": "blood test", "blood sugar test": "blood glucose measurement",
+    "blood sugar": "blood glucose measurement", "urine test": "urinalysis",
+    "urinalysis": "urinalysis", "urine culture": "urine culture", "chest x-ray": "chest x-ray",
+    "chest x ray": "chest x-ray", "x-ray": "x-ray", "x ray": "x-ray", "ultrasound": "ultrasonography",
+    "sonography": "ultrasonography", "ecg": "electrocardiogram", "ekg": "electrocardiogram",
+    "electrocardiogram": "electrocardiogram", "mri": "magnetic resonance imaging",
+    "ct scan": "computed tomography", "thyroid test": "thyroid function test",
+    "dressing": "wound dressing", "nebulization": "nebulization", "injection": "injection",
+}
+
+ADVICE = {
+    # Rest only as advice: a bare "rest" would match "the rest of the tablets"
+    "bed rest": "bed rest", "take rest": "rest", "take some rest": "rest", "get some rest": "rest",
+    "get plenty of rest": "rest", "drink plenty of water": "increased fluid intake",
+    "drink plenty of fluids": "increased fluid intake", "drink more water": "increased fluid intake",
+    "stay hydrated": "increased fluid intake", "fluids": "increased fluid intake",
+    "steam inhalation": "steam inhalation", "salt water gargle": "gargling",
+    "gargle": "gargling", "avoid travel": "avoid travel", "avoid traveling": "avoid travel",
+    "avoid travelling": "avoid travel", "avoid spicy food": "avoid spicy food",
+    "light diet": "light diet", "bland diet": "bland diet", "exercise": "exercise",
+    "follow up": "follow-up", "follow-up": "follow-up", "review after": "follow-up",
+    "come back": "follow-up", "visit the hospital": "hospital visit",
+}
+
+_NUMBER = r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|a few|few|couple of)"
+_DURATION = re.compile(
+    rf"\b(?:for|since|next|after|within)?\s*(?:the\s+)?(?:next\s+|past\s+|last\s+)?"
+    rf"{_NUMBER}(?:\s*(?:-|to)\s*{_NUMBER})?\s+(?:days?|weeks?|months?|hours?)\b",
+    re.IGNORECASE
+)
+_FREQUENCY = re.compile(
+    r"\b(?:once|twice|thrice|(?:one|two|three|four|\d+)\s+times?)\s+(?:a|per|every)?\s*(?:day|daily|week)\b"
+    r"|\b(?:once|twice|thrice)\s+daily\b"
+    r"|\b(?:in the morning|at night|at bedtime|after (?:meals|food)|before (?:meals|food)|every \d+ hours)\b",
+    re.IGNORECASE
+)
+
+
+def _dictionary_pattern(dictionary: Dict[str, str]) -> re.Pattern:
+    # Longest phrases first so "chest x-ray" wins over "x-ray"
+    phrases = sorted(dictionary, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b", re.IGNORECASE)
+
+
+_PATTERNS = {
+    'medications': (_dictionary_pattern(MEDICATIONS), MEDICATIONS),
+    'procedures': (_dictionary_pattern(PROCEDURES), PROCEDURES),
+    'advice': (_dictionary_pattern(ADVICE), ADVICE),
+}
+
+
+def _unique(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+
+def extract_phrases_rules(transcript: str) -> dict:
+    """Local dictionary/regex extraction; no network calls"""
+    phrases = {}
+    for category, (pattern, dictionary) in _PATTERNS.items():
+        phrases[category] = _unique([dictionary[m.group(0).lower()] for m in pattern.finditer(transcript)])
+    # Frequencies first; skip durations inside them ("a day" in "twice a day")
+    frequencies = list(_FREQUENCY.finditer(transcript))
+    taken = [m.span() for m in frequencies]
+    timing = [m for m in _DURATION.finditer(transcript)
+              if not any(start < m.end() and m.start() < end for start, end in taken)]
+    phrases['durations'] = _unique(m.group(0).strip().lower() for m in sorted(timing + frequencies, key=lambda m: m.start()))
+    return phrases
+
+
+def extract_phrases_llm(transcript: str) -> dict:
+    """Ask GPT-4o for the same categories; used when the rules find nothing"""
+    try:
+        client = get_chat_client()
+        response = limited_call(
+            "chat", client.chat.completions.create, hedge=True,
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Extract short clinical phrases from the doctor's assessment. Return a JSON object "
+                        'with arrays "medications", "procedures", "advice" and "durations". Use generic '
+                        "drug names and standard terminology, two to four words per phrase."
+                    )
+                },
+                {"role": "user", "content": transcript}
+            ],
+            temperature=0.0,
+            max_tokens=300,
+            response_format={"type": "json_object"}
+        )
+        result = json.loads(response.choices[0].message.content)
+        if not isinstance(result, dict):
+            raise ValueError(f"expected a JSON object, got {type(result).__name__}")
+        phrases = {}
+        for key in ('medications', 'procedures', 'advice', 'durations'):
+            # The model may return a string, an object or nulls where a list of phrases belongs; keep only phrases
+            items = result.get(key)
+            items = items if isinstance(items, list) else []
+            phrases[key] = _unique(item.strip() for item in items if isinstance(item, str) and item.strip())
+        return phrases
+    except Exception as e:
+        logger.error(f"LLM phrase extraction failed: {str(e)}")
+        return {'medications': [], 'procedures': [], 'advice': [], 'durations': []}
+
+
+@metrics.traced("doctor_phrases")
+def extract_doctor_phrases(transcript: str) -> dict:
+    """Extract candidate clinical phrases using the configured extractor"""
+    mode = os.getenv("VOICERX_DOCTOR_PHRASES", "rules").lower()
+    metrics.set_attributes(mode=mode)
+    if mode == "llm":
+        return extract_phrases_llm(transcript)
+    phrases = extract_phrases_rules(transcript)
+    if mode == "auto" and not any(phrases[key] for key in ('medications', 'procedures', 'advice')):
+        return extract_phrases_llm(transcript)
+    return phrases
+
+
+def snomed_candidate_terms(phrases: dict) -> List[str]:
+    """Phrases worth looking up in SNOMED CT; durations stay out of the lookup"""
+    return _unique(phrases.get('medications', []) + phrases.get('procedures', []) + phrases.get('advice', []))
@@ -0,0 +1,306 @@
+"""
+Asyncio consult pipeline for VoiceRx.
+
+A consult is expressed as a dependency graph of stages. Every stage starts
+as soon as the stages it depends on have finished, so independent work
+overlaps: the doctor's recording is transcribed while the patient's
+transcript is still being analysed, and the doctor's SNOMED lookup runs
+alongside the patient's.
+
+Headless usage:
+
+    from pipeline import run_consult
+    result = run_consult("voice_recordings/a.wav", "doctors_recordings/b.wav")
+
+or from the shell:
+
+    python pipeline.py voice_recordings/a.wav doctors_recordings/b.wav
+
+patient_job, doctor_job and note_job are the handlers the Streamlit app
+registers with its background job queue (jobs.py).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from processing import (
+    TRANSCRIPTION_FAILED,
+    transcribe_audio_multilingual,
+    extract_diseases_enhanced,
+    search_snomed_terms,
+    generate_clinical_note_enhanced,
+    generate_clinical_note_stream
+)
+from phrase_extraction import extract_doctor_phrases, snomed_candidate_terms
+
+logger = logging.getLogger(__name__)
+
+# Worker threads for blocking stages started from the Streamlit script
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="voicerx-stage")
+
+
+@dataclass
+class Stage:
+    """One pipeline step: func is called with the results of deps, in order"""
+    name: str
+    func: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+
+
+def _check_graph(stages: List[Stage]) -> None:
+    """Reject unknown dependencies and cycles before anything is scheduled"""
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Duplicate stage names in pipeline")
+
+    visiting, done = set(), set()
+
+    def visit(name: str):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a dependency cycle through '{name}'")
+        if name not in by_name:
+            raise ValueError(f"Unknown pipeline stage '{name}'")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+
+
+async def run_stages(stages: List[Stage], timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Run a stage graph and return {stage name: result}.
+    Coroutine stages are awaited directly; blocking stages run on worker threads.
+    """
+    _check_graph(stages)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage):
+        dep_results = [await tasks[dep] for dep in stage.deps]
+        started = time.perf_counter()
+        if asyncio.iscoroutinefunction(stage.func):
+            result = await stage.func(*dep_results)
+        else:
+            result = await asyncio.to_thread(stage.func, *dep_results)
+        elapsed = time.perf_counter() - started
+        if timings is not None:
+            timings[stage.name] = elapsed
+        logger.info(f"Stage '{stage.name}' finished in {elapsed:.2f}s")
+        return result
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(run(stage), name=stage.name)
+
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except Exception:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return dict(zip(tasks.keys(), results))
+
+
+def _patient_terms(analysis: dict) -> List[str]:
+    """SNOMED lookup terms: the normalized preferred terms, or the raw lists for older cached analyses"""
+    return analysis.get('preferred_terms') or analysis.get('diseases', []) + analysis.get('symptoms', [])
+
+
+def consult_stages(
+    patient_audio: Optional[str],
+    doctor_audio: Optional[str],
+    user: Optional[str] = None
+) -> List[Stage]:
+    """Build the stage graph for whichever recordings are available"""
+    doctor_speaker = f"{user}_doctor" if user else None
+    stages = []
+    if patient_audio:
+        stages += [
+            Stage("patient_transcription", lambda: transcribe_audio_multilingual(patient_audio, speaker=user)),
+            Stage("patient_analysis",
+                  lambda transcription: extract_diseases_enhanced(transcription['english_text']),
+                  ("patient_transcription",)),
+            Stage("patient_snomed",
+                  lambda analysis: search_snomed_terms(_patient_terms(analysis)) if _patient_terms(analysis) else {},
+                  ("patient_analysis",)),
+        ]
+    if doctor_audio:
+        stages += [
+            Stage("doctor_transcription", lambda: transcribe_audio_multilingual(doctor_audio, speaker=doctor_speaker)),
+            Stage("doctor_phrases",
+                  lambda transcription: extract_doctor_phrases(transcription['english_text']),
+                  ("doctor_transcription",)),
+            Stage("doctor_snomed",
+                  lambda phrases: search_snomed_terms(snomed_candidate_terms(phrases)) if snomed_candidate_terms(phrases) else {},
+                  ("doctor_phrases",)),
+        ]
+    if patient_audio and doctor_audio:
+        stages.append(Stage(
+            "clinical_note",
+            lambda patient, analysis, doctor, doctor_snomed: generate_clinical_note_enhanced(
+                patient['english_text'], analysis, doctor['english_text'], doctor_snomed, patient, doctor
+            ),
+            ("patient_transcription", "patient_analysis", "doctor_transcription", "doctor_snomed")
+        ))
+    return stages
+
+
+async def run_consult_async(
+    patient_audio: Optional[str],
+    doctor_audio: Optional[str],
+    user: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Process a consult and return every stage result plus per-stage timings
+    and the consult trace (spans, tokens, cost, cache hits; see metrics.py)
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    with metrics.consult_trace(_consult_id(patient_audio or doctor_audio)) as trace:
+        results = await run_stages(consult_stages(patient_audio, doctor_audio, user), timings)
+    results['timings'] = dict(timings, total=time.perf_counter() - started)
+    results['trace'] = trace.summary()
+    return results
+
+
+def run_consult(
+    patient_audio: Optional[str],
+    doctor_audio: Optional[str],
+    user: Optional[str] = None
+) -> Dict[str, Any]:
+    """Blocking wrapper around run_consult_async for scripts and other sync callers"""
+    return asyncio.run(run_consult_async(patient_audio, doctor_audio, user))
+
+
+def _consult_id(filepath: str) -> str:
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+def _transcribe_for_job(payload: dict) -> dict:
+    """Transcription for a job; failures raise so the job queue retries them"""
+    transcription = transcribe_audio_multilingual(
+        payload['filepath'], speaker=payload.get('speaker'), audio_sha256=payload.get('audio_sha256')
+    )
+    if transcription['original_text'] == TRANSCRIPTION_FAILED:
+        raise RuntimeError(f"Transcription of {payload['filepath']} failed")
+    return transcription
+
+
+def patient_job(payload: dict, progress: Callable[[dict], None]) -> dict:
+    """
+    Background job for a patient recording: transcription, analysis and SNOMED
+    lookup. payload: filepath, speaker, audio_sha256 and optionally a finished
+    (live) transcription. Failed transcription or extraction raises, so the
+    job queue retries it. The job's trace is returned as patient_trace.
+    """
+    with metrics.consult_trace(_consult_id(payload['filepath'])) as trace:
+        transcription = payload.get('transcription') or _transcribe_for_job(payload)
+        progress({'stage': 'patient_analysis', 'patient_transcription': transcription})
+        analysis = extract_diseases_enhanced(transcription['english_text'])
+        if analysis.get('failed'):
+            raise RuntimeError(f"Disease extraction for {payload['filepath']} failed")
+        progress({'stage': 'patient_snomed', 'patient_analysis': analysis})
+        terms = _patient_terms(analysis)
+        result = {
+            'patient_transcription': transcription,
+            'patient_analysis': analysis,
+            'patient_snomed': search_snomed_terms(terms) if terms else {}
+        }
+    result['patient_trace'] = trace.summary()
+    return result
+
+
+def doctor_job(payload: dict, progress: Callable[[dict], None],
+               submit_job: Optional[Callable[..., str]] = None) -> dict:
+    """
+    Background job for a doctor recording: transcription, phrase extraction
+    and SNOMED lookup. When patient results are given (payload['patient']) or
+    coming (the patient job payload['patient_job']), it then queues a note job
+    with submit_job (JobQueue.submit), after the patient job if there is one,
+    and returns its id as note_job_id. The job's trace is returned as
+    doctor_trace.
+    """
+    with metrics.consult_trace(_consult_id(payload['filepath'])) as trace:
+        transcription = _transcribe_for_job(payload)
+        progress({'stage': 'doctor_snomed', 'doctor_transcription': transcription})
+        phrases = extract_doctor_phrases(transcription['english_text'])
+        terms = snomed_candidate_terms(phrases)
+        result = {
+            'doctor_transcription': transcription,
+            'doctor_phrases': phrases,
+            'doctor_snomed': search_snomed_terms(terms) if terms else {}
+        }
+    result['doctor_trace'] = trace.summary()
+
+    if submit_job is not None and (payload.get('patient') or payload.get('patient_job')):
+        # The note job waits in the queue, not in a worker, until the patient job has finished
+        note_payload = {
+            'filepath': payload['filepath'],
+            'patient': payload.get('patient'),
+            'doctor_transcription': transcription,
+            'doctor_snomed': result['doctor_snomed']
+        }
+        after = None if payload.get('patient') else payload['patient_job']
+        result['note_job_id'] = submit_job('note', note_payload, after=after)
+    return result
+
+
+def note_job(payload: dict, progress: Callable[[dict], None]) -> dict:
+    """
+    Background job for the clinical note, from the doctor results in the
+    payload and the patient results in payload['patient'] or, when queued
+    after the patient job, payload['after']. The note is published to
+    progress as it streams; a failed stream raises, so the job is retried
+    and the partial note is never returned. The job's trace is returned as
+    note_trace.
+    """
+    patient = payload.get('patient') or payload.get('after')
+    if not patient:
+        raise RuntimeError("Patient job failed: no patient analysis for the clinical note")
+    transcription = payload['doctor_transcription']
+    with metrics.consult_trace(_consult_id(payload['filepath'])) as trace:
+        progress({'stage': 'clinical_note', 'clinical_note': ""})  # drop a failed attempt's partial note
+        chunks, published = [], time.perf_counter()
+        for chunk in generate_clinical_note_stream(
+            patient['patient_transcription']['english_text'],
+            patient['patient_analysis'],
+            transcription['english_text'],
+            payload['doctor_snomed'],
+            patient['patient_transcription'],
+            transcription
+        ):
+            chunks.append(chunk)
+            if time.perf_counter() - published > 0.25:
+                progress({'clinical_note': "".join(chunks)})
+                published = time.perf_counter()
+    return {'clinical_note': "".join(chunks), 'note_trace': trace.summary()}
+
+
+def start_stage(func: Callable[..., Any], *args) -> Future:
+    """Start a blocking stage in the background; used by the UI to overlap work with rendering"""
+    return _executor.submit(metrics.bind(func), *args)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Run the VoiceRx consult pipeline without the UI")
+    parser.add_argument("patient_audio", help="Patient recording (WAV)")
+    parser.add_argument("doctor_audio", nargs="?", help="Doctor recording (WAV)")
+    args = parser.parse_args()
+
+    print(json.dumps(run_consult(args.patient_audio, args.doctor_audio), indent=2, default=str))
@@ -0,0 +1,851 @@
+"""
+Consult processing stages for VoiceRx: transcription, medical term
+extraction, SNOMED CT lookup and clinical note generation.
+
+These functions are shared by the Streamlit app (voicerx.py) and the
+headless pipeline (pipeline.py).
+"""
+import ast
+import os
+from datetime import datetime
+from typing import Iterator, List, Dict, Optional
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+
+import metrics
+from asr import asr_backend_name, get_asr_backend
+from audio_store import get_audio_store
+from clients import (
+    CHAT_API_VERSION,
+    get_chat_client,
+    get_whisper_client,
+    get_neo4j_driver,
+    get_local_snomed_index,
+    discard_client
+)
+from note_prompt import build_note_messages, count_tokens
+from snomed_cache import TermCache
+from rate_limit import limited_call
+from result_cache import ResultCache, audio_fingerprint, cache_key
+
+try:
+    import audio_preprocess
+    import audio_chunking
+except ImportError:  # numpy not installed: upload recordings unprocessed and whole
+    audio_preprocess = None
+    audio_chunking = None
+
+logger = logging.getLogger(__name__)
+
+# First passing credentials check; the environment doesn't change within a process
+_verified_credentials: Optional[dict] = None
+
+def check_azure_credentials() -> dict:
+    """Check if Azure credentials are properly configured; once passed, the result is reused"""
+    global _verified_credentials
+    if _verified_credentials is not None:
+        return _verified_credentials
+    credentials = {
+        'whisper_api_key': os.getenv("AZURE_OPENAI_API_KEY"),
+        'whisper_endpoint': os.getenv("AZURE_OPENAI_ENDPOINT"),
+        'chat_api_key': os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
+        'chat_endpoint': os.getenv("AZURE_OPENAI_CHAT_ENDPOINT")
+    }
+    
+    missing = [key for key, value in credentials.items() if not value]
+    result = {
+        'valid': len(missing) == 0,
+        'missing': missing,
+        'credentials': credentials
+    }
+    if result['valid']:
+        _verified_credentials = result
+    return result
+
+# Caches and pools sized from the environment, created on first use so that
+# settings from .env (loaded by the app after importing this module) apply
+_shared: Dict[str, object] = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared(name: str, factory):
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def _result_cache() -> ResultCache:
+    """Content-addressed store of stage results (see result_cache.py)"""
+    return _get_shared("result_cache", ResultCache.from_env)
+
+# Whisper request settings; part of the transcription cache key
+TRANSCRIPTION_SETTINGS = {'transcription_format': 'verbose_json', 'translation_format': 'verbose_json', 'temperature': 0.1}
+
+# Placeholder transcript returned when transcription fails
+TRANSCRIPTION_FAILED = "Transcription failed. Please check your Azure OpenAI configuration."
+
+# Placeholder note returned (or streamed last) when note generation fails
+NOTE_FAILED = "Clinical note generation failed. Please check your configuration."
+
+# Last language detected per speaker, used as a hint for their next recording
+_language_hints: Dict[str, str] = {}
+
+# Translations started speculatively alongside the transcription request
+_translation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="voicerx-translate")
+
+def _segment_executor() -> ThreadPoolExecutor:
+    """Segments of long recordings, transcribed concurrently (see audio_chunking.py)"""
+    return _get_shared("segment_executor", lambda: ThreadPoolExecutor(
+        max_workers=int(os.getenv("VOICERX_CHUNK_WORKERS", "4")), thread_name_prefix="voicerx-segment"
+    ))
+
+
+def _is_english(language: Optional[str]) -> bool:
+    return (language or '').strip().lower() in ('en', 'english')
+
+
+def _speculative_translation_enabled() -> bool:
+    return os.getenv("VOICERX_SPECULATIVE_TRANSLATION", "1") != "0"
+
+
+def _preprocess_settings() -> Optional[dict]:
+    if audio_preprocess is None:
+        return None
+    settings = audio_preprocess.preprocess_settings()
+    return settings if settings['enabled'] else None
+
+
+def _prepare_upload(audio_bytes: bytes, filename: str) -> tuple:
+    """Run local preprocessing on WAV uploads; returns (bytes, filename, report or None)"""
+    settings = _preprocess_settings()
+    if settings is None or not filename.lower().endswith(".wav"):
+        return audio_bytes, filename, None
+    try:
+        processed, extension, report = audio_preprocess.preprocess_audio(audio_bytes, settings['compress'])
+    except Exception as e:
+        logger.warning(f"Audio preprocessing failed, uploading original recording: {str(e)}")
+        return audio_bytes, filename, None
+    return processed, f"{os.path.splitext(filename)[0]}.{extension}", report
+
+
+def _report_preprocessing(report: dict, asr_seconds: float) -> None:
+    """Record bytes saved and the ASR time saved by trimming, estimated from the observed real-time factor"""
+    if report['seconds_out'] > 0:
+        metrics.observe("transcription.real_time_factor", asr_seconds / report['seconds_out'])
+    rtf = metrics.snapshot()['observations'].get("transcription.real_time_factor", {}).get('mean', 0.0)
+    asr_saved = report['seconds_trimmed'] * rtf
+    metrics.observe("preprocess.bytes_saved", report['bytes_saved'])
+    metrics.observe("preprocess.seconds_trimmed", report['seconds_trimmed'])
+    metrics.observe("preprocess.asr_seconds_saved", asr_saved)
+    logger.info(
+        f"Preprocessing saved {report['bytes_saved']} of {report['bytes_in']} bytes "
+        f"({report['format']}), trimmed {report['seconds_trimmed']}s of audio, "
+        f"~{asr_saved:.2f}s of ASR time"
+    )
+
+
+def _should_chunk(audio_bytes: bytes, filename: str) -> bool:
+    if audio_chunking is None or not filename.lower().endswith(".wav"):
+        return False
+    return audio_chunking.needs_chunking(audio_bytes, audio_chunking.chunk_settings())
+
+
+def _transcribe_upload(backend, audio_bytes: bytes, filename: str, language_hint: Optional[str]) -> tuple:
+    """
+    Transcribe one upload-ready file with the ASR backend, translating it to
+    English if needed. Returns (result dict, seconds spent transcribing).
+    """
+    def translate():
+        with metrics.span("asr.translate", backend=backend.name, file_bytes=len(audio_bytes)):
+            return backend.translate(filename, audio_bytes)
+
+    translation_future = None
+    if language_hint and not _is_english(language_hint) and _speculative_translation_enabled():
+        logger.info(f"Language hint '{language_hint}': starting translation alongside transcription")
+        translation_future = _translation_executor.submit(metrics.bind(translate))
+        metrics.incr("transcription.speculative_translation.started")
+
+    # First transcription - detect language and transcribe in original language
+    started = time.perf_counter()
+    with metrics.span("asr.transcribe", backend=backend.name, file_bytes=len(audio_bytes)):
+        original_text, detected_language = backend.transcribe(filename, audio_bytes)
+        metrics.set_attributes(language=detected_language)
+    asr_seconds = time.perf_counter() - started
+    translated = not _is_english(detected_language)
+
+    # If not English, translate to English using Whisper's translation feature
+    english_text = original_text
+    if translated:
+        if translation_future is not None:
+            metrics.incr("transcription.speculative_translation.used")
+            english_text = translation_future.result()
+        else:
+            logger.info(f"Detected non-English language: {detected_language}. Translating to English...")
+            english_text = translate()
+    elif translation_future is not None:
+        # Hint was wrong: cancel if still queued, otherwise ignore the result
+        if not translation_future.cancel():
+            metrics.incr("transcription.speculative_translation.wasted")
+        else:
+            metrics.incr("transcription.speculative_translation.cancelled")
+
+    return {
+        'original_text': original_text,
+        'english_text': english_text,
+        'detected_language': detected_language,
+        'translated': translated
+    }, asr_seconds
+
+
+def _transcribe_segment(backend, samples, rate: int, name: str, language_hint: Optional[str]) -> tuple:
+    """Preprocess, encode and transcribe one segment; runs on _segment_executor"""
+    settings = _preprocess_settings()
+    compress = settings['compress'] if settings else "wav"
+    data, extension, seconds = audio_preprocess.process_samples(samples, rate, compress, clean=settings is not None)
+    result, asr_seconds = _transcribe_upload(backend, data, f"{name}.{extension}", language_hint)
+    return result, asr_seconds, len(data), seconds, extension
+
+
+def _transcribe_chunked(backend, audio_bytes: bytes, filename: str, language_hint: Optional[str]) -> dict:
+    """Split a long WAV recording at pauses, transcribe the segments concurrently and stitch the text"""
+    settings = audio_chunking.chunk_settings()
+    samples, rate = audio_preprocess.decode_wav(audio_bytes)
+    segments = audio_chunking.find_segments(samples, rate, settings['segment_seconds'], settings['overlap_seconds'])
+    stem = os.path.splitext(filename)[0]
+    logger.info(f"Transcribing {len(samples) / rate:.0f}s recording as {len(segments)} segments")
+
+    started = time.perf_counter()
+    futures = [
+        _segment_executor().submit(metrics.bind(_transcribe_segment), backend, samples[first:last], rate, f"{stem}_part{index:03d}", language_hint)
+        for index, (first, last) in enumerate(segments)
+    ]
+    outputs = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - started
+
+    results = [output[0] for output in outputs]
+    asr_seconds = sum(output[1] for output in outputs)
+    metrics.observe("transcription.chunked.segments", len(segments))
+    if wall_seconds > 0:
+        metrics.observe("transcription.chunked.speedup", asr_seconds / wall_seconds)
+    if _preprocess_settings() is not None:
+        report = audio_preprocess.build_report(
+            len(audio_bytes), sum(output[2] for output in outputs),
+            len(samples) / rate, sum(output[3] for output in outputs), outputs[0][4]
+        )
+        _report_preprocessing(report, asr_seconds)
+
+    # Majority language over segments with speech; a segment in another language is still translated
+    languages = Counter(r['detected_language'] for r in results if r['original_text'].strip())
+    detected_language = languages.most_common(1)[0][0] if languages else results[0]['detected_language']
+    return {
+        'original_text': audio_chunking.stitch_transcripts([r['original_text'] for r in results]),
+        'english_text': audio_chunking.stitch_transcripts([r['english_text'] for r in results]),
+        'detected_language': detected_language,
+        'translated': any(r['translated'] for r in results)
+    }
+
+
+def _transcription_key(backend, audio_sha256: str, chunked: bool) -> str:
+    settings = dict(TRANSCRIPTION_SETTINGS, preprocess=_preprocess_settings())
+    if chunked:
+        settings['chunking'] = audio_chunking.chunk_settings()
+    return cache_key("transcription", audio_sha256, *backend.cache_identity(), settings)
+
+
+def store_transcription(audio_bytes: bytes, result: dict, speaker: Optional[str] = None,
+                        audio_sha256: Optional[str] = None, filename: str = "audio.wav") -> None:
+    """
+    Record a transcript produced elsewhere (live transcription) so that
+    transcribe_audio_multilingual returns it for these audio bytes.
+    """
+    backend = get_asr_backend()
+    key = _transcription_key(backend, audio_sha256 or audio_fingerprint(audio_bytes), _should_chunk(audio_bytes, filename))
+    if speaker and result['detected_language'] != 'unknown':
+        _language_hints[speaker] = result['detected_language']
+    _result_cache().put("transcription", key, result)
+
+
+@metrics.traced("transcription")
+def transcribe_audio_multilingual(
+    filepath: str,
+    speaker: Optional[str] = None,
+    language_hint: Optional[str] = None,
+    audio_bytes: Optional[bytes] = None,
+    audio_sha256: Optional[str] = None
+) -> dict:
+    """
+    Enhanced transcribe audio using Whisper with multilingual support
+    Returns both original and English translation if needed
+
+    Whisper runs on Azure OpenAI or locally, per VOICERX_ASR_BACKEND (see asr.py).
+
+    The audio is read once (from the audio store's memory buffer when the
+    upload is recent) and shared by both Whisper requests.
+    When the speaker's previous recording (or language_hint) was not English,
+    the translation request is started at the same time as the transcription
+    and dropped if the audio turns out to be English. Recordings longer than
+    VOICERX_CHUNK_SECONDS are split at pauses and transcribed in parallel.
+
+    audio_sha256 is the fingerprint of audio_bytes when the caller already has it.
+    """
+    metrics.set_attributes(speaker=speaker, backend=asr_backend_name())
+    if asr_backend_name() == "azure":
+        creds_check = check_azure_credentials()
+        if not creds_check['valid']:
+            raise ValueError(f"Missing Azure OpenAI credentials: {', '.join(creds_check['missing'])}")
+    
+    try:
+        backend = get_asr_backend()
+
+        if audio_bytes is None:
+            # Served from memory while the upload is still buffered; stored FLAC / Opus comes back as WAV
+            audio_bytes, filepath = get_audio_store().read(filepath)
+        filename = os.path.basename(filepath) if filepath else "audio.wav"
+
+        chunked = _should_chunk(audio_bytes, filename)
+        key = _transcription_key(backend, audio_sha256 or audio_fingerprint(audio_bytes), chunked)
+        cached = _result_cache().get("transcription", key)
+        metrics.set_attributes(audio_bytes=len(audio_bytes), chunked=chunked, cached=cached is not None)
+        if cached is not None:
+            if speaker and cached['detected_language'] != 'unknown':
+                _language_hints[speaker] = cached['detected_language']
+            return cached
+
+        if language_hint is None and speaker:
+            language_hint = _language_hints.get(speaker)
+
+        if chunked:
+            result = _transcribe_chunked(backend, audio_bytes, filename, language_hint)
+        else:
+            # Denoise, trim and compress locally so less audio is uploaded and transcribed
+            audio_bytes, filename, preprocess_report = _prepare_upload(audio_bytes, filename)
+            result, asr_seconds = _transcribe_upload(backend, audio_bytes, filename, language_hint)
+            if preprocess_report:
+                _report_preprocessing(preprocess_report, asr_seconds)
+
+        if speaker and result['detected_language'] != 'unknown':
+            _language_hints[speaker] = result['detected_language']
+        _result_cache().put("transcription", key, result)
+        return result
+            
+    except Exception as e:
+        logger.error(f"Transcription failed: {str(e)}")
+        st.error(f"Transcription failed: {str(e)}")
+        return {
+            'original_text': TRANSCRIPTION_FAILED,
+            'english_text': TRANSCRIPTION_FAILED,
+            'detected_language': 'unknown',
+            'translated': False
+        }
+
+# Extractions currently waiting on GPT-4o, by cache key
+_extractions_in_flight: Dict[str, Future] = {}
+_extractions_lock = threading.Lock()
+
+# Extraction prompt; the output structure is enforced by EXTRACTION_SCHEMA
+EXTRACTION_SYSTEM_PROMPT = """You are an expert medical AI assistant specializing in clinical documentation.
+Analyze the medical transcript and extract the diseases/conditions mentioned, the symptoms reported,
+the overall severity and urgency, and preferred_terms: each condition and symptom restated as a short
+standard clinical term as used in SNOMED CT (e.g. "burning when I pee" -> "dysuria").
+Use standard medical terminology. If nothing clinical is mentioned, return empty arrays."""
+
+SEVERITY_LEVELS = ["mild", "moderate", "severe", "critical", "unknown"]
+URGENCY_LEVELS = ["low", "medium", "high", "emergency", "unknown"]
+
+# Structured-output schema (strict mode: every property required, no extras)
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "diseases": {"type": "array", "items": {"type": "string"}},
+        "symptoms": {"type": "array", "items": {"type": "string"}},
+        "severity": {"type": "string", "enum": SEVERITY_LEVELS},
+        "urgency": {"type": "string", "enum": URGENCY_LEVELS},
+        "preferred_terms": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["diseases", "symptoms", "severity", "urgency", "preferred_terms"],
+    "additionalProperties": False
+}
+
+EMPTY_ANALYSIS = {'diseases': [], 'symptoms': [], 'severity': 'unknown', 'urgency': 'unknown', 'preferred_terms': []}
+
+# Returned when extraction fails; 'failed' tells it apart from a transcript with no findings
+FAILED_ANALYSIS = dict(EMPTY_ANALYSIS, failed=True)
+
+
+def _string_list(value) -> List[str]:
+    """Non-empty, de-duplicated strings from a model-provided list"""
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    return list(dict.fromkeys(items))
+
+
+def validate_extraction(data: dict) -> dict:
+    """
+    Coerce a parsed extraction into EXTRACTION_SCHEMA: lists of strings,
+    known severity/urgency levels, and preferred_terms defaulting to the
+    diseases and symptoms.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Extraction is not a JSON object")
+    result = {field: _string_list(data.get(field)) for field in ('diseases', 'symptoms', 'preferred_terms')}
+    for field, levels in (('severity', SEVERITY_LEVELS), ('urgency', URGENCY_LEVELS)):
+        level = str(data.get(field, '')).strip().lower()
+        result[field] = level if level in levels else 'unknown'
+    if not result['preferred_terms']:
+        result['preferred_terms'] = list(dict.fromkeys(result['diseases'] + result['symptoms']))
+    return result
+
+
+def parse_extraction(content: str) -> dict:
+    """
+    Parse the model's extraction locally. Strict structured output should
+    always be valid JSON; if it is not (truncated or wrapped in prose or
+    code fences), the outermost JSON object is tried, then a bare list of
+    terms (JSON or Python literal, never eval'd) treated as both diseases
+    and symptoms. Raises ValueError if nothing usable is found.
+    """
+    text = content.strip()
+    try:
+        return validate_extraction(json.loads(text))
+    except (json.JSONDecodeError, ValueError):
+        pass
+
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return validate_extraction(json.loads(text[start:end + 1]))
+        except (json.JSONDecodeError, ValueError):
+            pass
+
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            terms = ast.literal_eval(text[start:end + 1])
+        except (ValueError, SyntaxError):
+            terms = None
+        if isinstance(terms, list):
+            terms = _string_list(terms)
+            return validate_extraction({'diseases': terms, 'symptoms': terms})
+    raise ValueError("No extraction found in model output")
+
+
+@metrics.traced("extract_diseases")
+def extract_diseases_enhanced(transcript: str) -> dict:
+    """
+    Single GPT-4o call returning diseases, symptoms, severity, urgency and
+    SNOMED-friendly preferred_terms, constrained by EXTRACTION_SCHEMA.
+    Malformed output is parsed locally (parse_extraction) rather than
+    asking the model again. A call for a transcript whose extraction is
+    already running (e.g. started early during live capture) waits for
+    that request instead of sending another.
+    """
+    creds_check = check_azure_credentials()
+    if not creds_check['valid']:
+        st.error(f"Missing Azure OpenAI credentials: {', '.join(creds_check['missing'])}")
+        return dict(FAILED_ANALYSIS)
+    
+    key = cache_key("extraction", transcript, "gpt-4o", CHAT_API_VERSION, EXTRACTION_SYSTEM_PROMPT, EXTRACTION_SCHEMA)
+    cached = _result_cache().get("extraction", key)
+    metrics.set_attributes(cached=cached is not None)
+    if cached is not None:
+        return cached
+
+    with _extractions_lock:
+        running = _extractions_in_flight.get(key)
+        if running is None:
+            _extractions_in_flight[key] = future = Future()
+    if running is not None:
+        metrics.set_attributes(joined=True)
+        return dict(running.result())
+    try:
+        result = _extract_uncached(transcript, key)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _extractions_lock:
+            del _extractions_in_flight[key]
+
+def _extract_uncached(transcript: str, key: str) -> dict:
+    try:
+        client = get_chat_client()
+        
+        response = limited_call(
+            "chat", client.chat.completions.create, hedge=True,
+            model="gpt-4o",  # Latest GPT-4o model
+            messages=[
+                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Medical transcript to analyze: {transcript}"}
+            ],
+            temperature=0.1,  # Low temperature for consistent medical analysis
+            max_tokens=1000,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "clinical_extraction", "strict": True, "schema": EXTRACTION_SCHEMA}
+            }
+        )
+        
+        result = parse_extraction(response.choices[0].message.content or "")
+        _result_cache().put("extraction", key, result)
+        return result
+        
+    except ValueError as e:
+        logger.error(f"Could not parse disease extraction: {str(e)}")
+        metrics.incr("extraction.unparsed")
+        return dict(FAILED_ANALYSIS)
+    except Exception as e:
+        logger.error(f"Disease extraction failed: {str(e)}")
+        st.error(f"Disease extraction failed: {str(e)}")
+        return dict(FAILED_ANALYSIS)
+
+# Fuzzy full-text lookup for a single keyword
+SNOMED_TERM_QUERY = """
+CALL db.index.fulltext.queryNodes('termIndex', $keyword + '~') YIELD node, score
+WHERE score > $min_score
+RETURN node.conceptId AS conceptId, node.term AS term, 
+       node.semanticTag AS semanticTag, score
+ORDER BY score DESC
+LIMIT $top_k
+"""
+
+# Same lookup for every keyword in one round-trip; idx maps rows back to $keywords
+SNOMED_BATCH_QUERY = """
+UNWIND range(0, size($keywords) - 1) AS idx
+CALL {
+    WITH idx
+    CALL db.index.fulltext.queryNodes('termIndex', $keywords[idx] + '~') YIELD node, score
+    WHERE score > $min_score
+    RETURN node.conceptId AS conceptId, node.term AS term,
+           node.semanticTag AS semanticTag, score
+    ORDER BY score DESC
+    LIMIT $top_k
+}
+RETURN idx, conceptId, term, semanticTag, score
+"""
+
+SNOMED_MIN_SCORE = 0.3
+
+def _snomed_cache() -> TermCache:
+    """Process-wide cache in front of Neo4j (see snomed_cache.py)"""
+    return _get_shared("snomed_cache", TermCache.from_env)
+
+# Most frequent terms in our consults, preloaded at server start
+COMMON_CLINICAL_TERMS = [
+    "headache", "fever", "cough", "cold", "stomach pain", "abdominal pain",
+    "burning sensation", "nausea", "vomiting", "diarrhea", "dizziness",
+    "fatigue", "body ache", "sore throat", "back pain", "chest pain",
+    "shortness of breath", "runny nose", "joint pain", "loss of appetite",
+    "constipation", "skin rash", "itching", "insomnia", "anxiety",
+    "hypertension", "diabetes", "asthma", "urinary tract infection", "migraine",
+]
+
+
+def _match_tuple(record: dict) -> tuple:
+    return (record["conceptId"], record["term"], record.get("semanticTag", ""), record["score"])
+
+
+def _search_snomed_per_term(session, keywords: List[str], top_k: int = 10) -> Dict[str, list]:
+    """One full-text query per keyword; failures only affect that keyword"""
+    results = {}
+    for keyword in keywords:
+        try:
+            matches = session.execute_read(
+                lambda tx: tx.run(SNOMED_TERM_QUERY, keyword=keyword, min_score=SNOMED_MIN_SCORE, top_k=top_k).data()
+            )
+            results[keyword] = [_match_tuple(r) for r in matches]
+        except Exception as e:
+            logger.warning(f"SNOMED search failed for term '{keyword}': {str(e)}")
+            results[keyword] = []
+    return results
+
+
+def _search_snomed_batched(session, keywords: List[str], top_k: int = 10) -> Dict[str, list]:
+    """All keywords in a single UNWIND transaction, top_k matches each"""
+    records = session.execute_read(
+        lambda tx: tx.run(SNOMED_BATCH_QUERY, keywords=keywords, min_score=SNOMED_MIN_SCORE, top_k=top_k).data()
+    )
+    results = {keyword: [] for keyword in keywords}
+    for r in records:
+        results[keywords[r["idx"]]].append(_match_tuple(r))
+    for matches in results.values():
+        matches.sort(key=lambda match: match[3], reverse=True)
+    return results
+
+
+def _lookup_snomed_neo4j(keywords: List[str], top_k: int) -> tuple:
+    """Neo4j lookup; returns (matches by keyword, whether the results may be cached)"""
+    driver = get_neo4j_driver()
+    with metrics.span("neo4j.query", keywords=len(keywords)), driver.session() as session:
+        try:
+            results, cacheable = _search_snomed_batched(session, keywords, top_k), True
+        except Exception as e:
+            # A single bad keyword fails the whole batch; retry term by term.
+            # Those results are not cached since failures also come back empty.
+            logger.warning(f"Batched SNOMED search failed, falling back to per-term queries: {str(e)}")
+            results, cacheable = _search_snomed_per_term(session, keywords, top_k), False
+        metrics.set_attributes(rows=sum(len(matches) for matches in results.values()), batched=cacheable)
+        return results, cacheable
+
+
+def _lookup_snomed_uncached(keywords: List[str], top_k: int) -> tuple:
+    """
+    Dispatch to the configured terminology backend (VOICERX_SNOMED_BACKEND):
+    - neo4j: full-text index on the Neo4j server (default)
+    - local: offline index built by snomed_index.py, no database needed
+    - hybrid: local index first, Neo4j only for keywords it cannot match
+    """
+    backend = os.getenv("VOICERX_SNOMED_BACKEND", "neo4j").lower()
+    if backend == "neo4j":
+        return _lookup_snomed_neo4j(keywords, top_k)
+
+    with metrics.span("snomed_index.query", keywords=len(keywords)):
+        results = get_local_snomed_index().search_many(keywords, top_k)
+        metrics.set_attributes(rows=sum(len(matches) for matches in results.values()))
+    metrics.incr("snomed.local_lookups", len(keywords))
+    if backend == "hybrid":
+        unresolved = [keyword for keyword in keywords if not results[keyword]]
+        if unresolved:
+            fetched, cacheable = _lookup_snomed_neo4j(unresolved, top_k)
+            results.update(fetched)
+            return results, cacheable
+    return results, True
+
+
+@metrics.traced("snomed_lookup")
+def search_snomed_terms(term_list: List[str], top_k: int = 10) -> dict:
+    """Enhanced SNOMED CT search with better error handling"""
+    try:
+        # Query each distinct normalized keyword once, skipping cached ones
+        normalized = {term: term.strip().lower() for term in term_list}
+        keywords = sorted({keyword for keyword in normalized.values() if keyword})
+        matches_by_keyword = _snomed_cache().get_many(keywords, top_k)
+        missing = [keyword for keyword in keywords if keyword not in matches_by_keyword]
+        metrics.set_attributes(terms=len(keywords), cache_hits=len(keywords) - len(missing))
+        
+        if missing:
+            fetched, cacheable = _lookup_snomed_uncached(missing, top_k)
+            if cacheable:
+                for keyword, matches in fetched.items():
+                    _snomed_cache().put(keyword, top_k, matches)
+            matches_by_keyword.update(fetched)
+                    
+        return {term: list(matches_by_keyword.get(keyword, [])) for term, keyword in normalized.items()}
+        
+    except Exception as e:
+        logger.error(f"SNOMED database connection failed: {str(e)}")
+        # Rebuild the pooled driver on the next call in case it is unusable
+        discard_client("neo4j")
+        st.error(f"SNOMED search failed: {str(e)}")
+        return {term: [] for term in term_list}
+
+def warm_up_snomed_cache(top_n: int = 100) -> int:
+    """
+    Preload the SNOMED cache with the top_n most frequent clinical terms.
+    VOICERX_SNOMED_WARMUP_FILE can point at a file with one term per line,
+    most frequent first; otherwise COMMON_CLINICAL_TERMS is used.
+    """
+    terms = COMMON_CLINICAL_TERMS
+    warmup_file = os.getenv("VOICERX_SNOMED_WARMUP_FILE")
+    if warmup_file:
+        try:
+            with open(warmup_file, encoding="utf-8") as f:
+                terms = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            logger.warning(f"Could not read SNOMED warm-up file '{warmup_file}': {str(e)}")
+    terms = terms[:top_n]
+    started = time.perf_counter()
+    search_snomed_terms(terms)
+    logger.info(f"Warmed SNOMED cache with {len(terms)} terms in {time.perf_counter() - started:.2f}s")
+    return len(terms)
+
+def _open_azure_connection(client) -> None:
+    from openai import APIStatusError
+
+    try:
+        client.models.list()
+    except APIStatusError:
+        pass  # any HTTP response means the connection is open and pooled
+
+def _warm_up_neo4j() -> None:
+    driver = get_neo4j_driver()
+    driver.verify_connectivity()
+    with driver.session() as session:
+        session.execute_read(
+            lambda tx: tx.run(SNOMED_TERM_QUERY, keyword=COMMON_CLINICAL_TERMS[0], min_score=SNOMED_MIN_SCORE, top_k=1).data()
+        )
+
+def prewarm_connections() -> Dict[str, float]:
+    """
+    Build the pooled clients and open their connections before the first
+    consult: a models request per Azure OpenAI client, loading the note
+    prompt tokenizer, and on Neo4j a connectivity check plus one full-text
+    query so the term index is loaded. Returns seconds per step; failures are logged and left for the
+    first consult to report.
+    """
+    steps = []
+    if check_azure_credentials()['valid']:
+        if asr_backend_name() == "azure":
+            steps.append(("azure.whisper", lambda: _open_azure_connection(get_whisper_client())))
+        steps.append(("azure.chat", lambda: _open_azure_connection(get_chat_client())))
+        steps.append(("tokenizer", lambda: count_tokens(COMMON_CLINICAL_TERMS[0])))
+    snomed_backend = os.getenv("VOICERX_SNOMED_BACKEND", "neo4j").lower()
+    if snomed_backend in ("local", "hybrid"):
+        steps.append(("snomed_index", lambda: get_local_snomed_index().search(COMMON_CLINICAL_TERMS[0], 1)))
+    if snomed_backend in ("neo4j", "hybrid"):
+        steps.append(("neo4j", _warm_up_neo4j))
+
+    timings = {}
+    for step, warm_up in steps:
+        started = time.perf_counter()
+        try:
+            warm_up()
+        except Exception as e:
+            logger.warning(f"Prewarming {step} failed: {str(e)}")
+        timings[step] = time.perf_counter() - started
+        metrics.observe(f"prewarm.{step}.seconds", timings[step])
+    logger.info("Prewarmed connections: " + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+    return timings
+
+def snomed_cache_stats() -> dict:
+    return _snomed_cache().stats()
+
+def _note_cache_key(messages: List[dict]) -> str:
+    # The messages embed every input, so they are the cache key along with model settings.
+    # Only the note body is cached; the metadata footer is rebuilt each time.
+    return cache_key("clinical_note", messages, "gpt-4o", CHAT_API_VERSION, 0.2, 2000)
+
+def _note_metadata(patient_lang_info: dict, doctor_lang_info: dict) -> str:
+    """Metadata footer appended to every generated note"""
+    return f"""
+
+---
+**Documentation Metadata:**
+- Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+- Patient Language: {patient_lang_info.get('detected_language', 'English')}
+- Doctor Language: {doctor_lang_info.get('detected_language', 'English')}
+- AI Assistant: GPT-4o Clinical Documentation
+- Translation Applied: {'Yes' if patient_lang_info.get('translated', False) or doctor_lang_info.get('translated', False) else 'No'}
+"""
+
+@metrics.traced("clinical_note")
+def generate_clinical_note_enhanced(
+    patient_transcript: str, 
+    patient_analysis: dict, 
+    doctor_transcript: str, 
+    doctor_snomed: dict,
+    patient_lang_info: dict,
+    doctor_lang_info: dict
+) -> str:
+    """
+    Enhanced clinical note generation with latest GPT-4o capabilities
+    """
+    try:
+        client = get_chat_client()
+        messages = build_note_messages(
+            patient_transcript, patient_analysis, doctor_transcript,
+            doctor_snomed, patient_lang_info, doctor_lang_info
+        )
+
+        key = _note_cache_key(messages)
+        clinical_note = _result_cache().get("clinical_note", key)
+        metrics.set_attributes(cached=clinical_note is not None)
+        if clinical_note is None:
+            response = limited_call(
+                "chat", client.chat.completions.create,
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.2,  # Low temperature for clinical accuracy
+                max_tokens=2000
+            )
+            
+            clinical_note = response.choices[0].message.content.strip()
+            _result_cache().put("clinical_note", key, clinical_note)
+        
+        return clinical_note + _note_metadata(patient_lang_info, doctor_lang_info)
+        
+    except Exception as e:
+        logger.error(f"Clinical note generation failed: {str(e)}")
+        st.error(f"Clinical note generation failed: {str(e)}")
+        return NOTE_FAILED
+
+def generate_clinical_note_stream(
+    patient_transcript: str,
+    patient_analysis: dict,
+    doctor_transcript: str,
+    doctor_snomed: dict,
+    patient_lang_info: dict,
+    doctor_lang_info: dict
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_clinical_note_enhanced: yields the note as
+    it is generated, then the metadata footer once the stream ends.
+    Time to first token is recorded as clinical_note.ttft_seconds; the
+    stream's duration and token usage as a clinical_note span. A failure
+    raises, even after part of the note was yielded, so callers never keep
+    a truncated note (unlike generate_clinical_note_enhanced, which returns
+    NOTE_FAILED).
+    """
+    try:
+        client = get_chat_client()
+        messages = build_note_messages(
+            patient_transcript, patient_analysis, doctor_transcript,
+            doctor_snomed, patient_lang_info, doctor_lang_info
+        )
+
+        key = _note_cache_key(messages)
+        clinical_note = _result_cache().get("clinical_note", key)
+        if clinical_note is not None:
+            metrics.record_span("clinical_note", 0.0, streamed=True, cached=True)
+            yield clinical_note
+        else:
+            started = time.perf_counter()
+            # Retries cover opening the stream; throttling is reported before the first chunk
+            stream = limited_call(
+                "chat", client.chat.completions.create,
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.2,  # Low temperature for clinical accuracy
+                max_tokens=2000,
+                stream=True,
+                stream_options={"include_usage": True}  # Token counts arrive in the last chunk
+            )
+
+            parts, ttft, usage = [], None, {}
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = metrics.record_usage(chunk.usage, annotate=False)
+                # Azure sends a first chunk with content-filter results and no choices
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if not parts:
+                    ttft = time.perf_counter() - started
+                    metrics.observe("clinical_note.ttft_seconds", ttft)
+                    logger.info(f"Clinical note first token after {ttft:.2f}s")
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+            stream_seconds = time.perf_counter() - started
+            metrics.observe("clinical_note.stream_seconds", stream_seconds)
+            metrics.record_span("clinical_note", stream_seconds, streamed=True,
+                               ttft_seconds=round(ttft, 3) if ttft is not None else None, **usage)
+            _result_cache().put("clinical_note", key, "".join(parts).strip())
+
+        yield _note_metadata(patient_lang_info, doctor_lang_info)
+
+    except Exception as e:
+        logger.error(f"Clinical note generation failed: {str(e)}")
+        metrics.incr("clinical_note.stream_failed")
+        raise
@@ -0,0 +1,282 @@
+"""
+Client-side rate limiting, retries and hedging for Azure OpenAI calls.
+
+Each deployment (whisper, chat) has a shared limiter with token buckets
+sized from its requests-per-minute and tokens-per-minute quota, so
+concurrent sessions queue locally instead of all receiving 429s. When Azure
+still throttles, the limiter pauses the deployment for the retry-after
+period and temporarily lowers its rate, recovering gradually on success.
+
+limited_call retries throttled, timed-out, connection and 5xx failures with
+jittered exponential backoff (honouring retry-after), and can hedge
+cheap idempotent requests (chat extractions, not audio uploads, which
+would be uploaded and billed twice): if a request is slower than the
+deployment's recent 95th percentile latency, a second copy is started when
+the buckets have room and whichever finishes first wins. The losing
+copy's token usage is still counted.
+
+Settings:
+- VOICERX_WHISPER_RPM: Whisper requests per minute (default 60, 0 for no limit)
+- VOICERX_CHAT_RPM / VOICERX_CHAT_TPM: GPT-4o requests and tokens per minute (default 300 / 50000)
+- VOICERX_MAX_RETRIES: retries per call (default 5)
+- VOICERX_RETRY_BASE / VOICERX_RETRY_CAP: backoff base and cap in seconds (default 0.5 / 30)
+- VOICERX_HEDGE: 1 to hedge slow extraction requests (default 0)
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Quota env vars per deployment: (RPM variable, RPM default, TPM variable, TPM default)
+QUOTAS = {
+    'whisper': ("VOICERX_WHISPER_RPM", 60, None, 0),
+    'chat': ("VOICERX_CHAT_RPM", 300, "VOICERX_CHAT_TPM", 50000),
+}
+
+_MIN_HEDGE_SAMPLES = 20
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="voicerx-hedge")
+
+
+class TokenBucket:
+    """
+    Refills at per_minute / 60 per second, with a burst of one tenth of the
+    minute (Azure enforces quotas over short windows). Callers reserve
+    capacity and sleep for the returned delay, so waiters are served in order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.scale = 1.0
+        self.capacity = max(1.0, per_minute / 10)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute * self.scale / 60
+
+    def _refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount (possibly going into debt); returns seconds until it is covered"""
+        self._refill(now)
+        self.available -= amount
+        return max(0.0, -self.available / self.rate)
+
+    def has(self, amount: float, now: float) -> bool:
+        self._refill(now)
+        return self.available >= amount
+
+
+class DeploymentLimiter:
+    """Request and token buckets for one deployment, adapted to 429 responses"""
+
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of the given token cost may start; returns seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self.blocked_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            self.waiting += 1
+            metrics.observe(f"rate_limit.{self.name}.queue_depth", self.waiting)
+        try:
+            if delay > 0:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        metrics.observe(f"rate_limit.{self.name}.wait_seconds", delay)
+        return delay
+
+    def try_acquire(self, tokens: int = 0) -> bool:
+        """Take capacity only if it is available right now (used for hedged requests)"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until or not all(
+                bucket.has(1 if bucket is self.requests else tokens, now) for bucket in self._buckets()
+            ):
+                return False
+            for bucket in self._buckets():
+                bucket.reserve(1 if bucket is self.requests else tokens, now)
+            return True
+
+    def throttled(self, retry_after: float) -> None:
+        """Azure returned 429: pause until retry-after and cut the rate (multiplicative decrease)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            for bucket in self._buckets():
+                bucket.scale = max(0.25, bucket.scale * 0.7)
+        metrics.incr(f"rate_limit.{self.name}.throttled")
+
+    def succeeded(self, latency: float) -> None:
+        """Record latency and recover the rate (additive increase)"""
+        with self._lock:
+            self._latencies.append(latency)
+            for bucket in self._buckets():
+                bucket.scale = min(1.0, bucket.scale + 0.02)
+
+    def hedge_delay(self) -> Optional[float]:
+        """95th percentile of recent latencies, once there are enough samples"""
+        with self._lock:
+            if len(self._latencies) < _MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'waiting': self.waiting,
+                'blocked_for': round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                'rate_scale': round(min((b.scale for b in self._buckets()), default=1.0), 2),
+            }
+
+
+_limiters: Dict[str, DeploymentLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(deployment: str) -> DeploymentLimiter:
+    """Shared limiter for a deployment, sized from the environment on first use"""
+    with _limiters_lock:
+        limiter = _limiters.get(deployment)
+        if limiter is None:
+            rpm_var, rpm_default, tpm_var, tpm_default = QUOTAS[deployment]
+            rpm = float(os.getenv(rpm_var, rpm_default))
+            tpm = float(os.getenv(tpm_var, tpm_default)) if tpm_var else 0.0
+            limiter = _limiters[deployment] = DeploymentLimiter(deployment, rpm, tpm)
+        return limiter
+
+
+def limiter_stats() -> dict:
+    """Current queue depth, pause and rate reduction per deployment"""
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Rough chat request cost: ~4 characters per prompt token plus the completion budget"""
+    messages = kwargs.get('messages')
+    if not messages:
+        return 0
+    prompt_chars = sum(len(str(message.get('content', ''))) for message in messages)
+    return prompt_chars // 4 + kwargs.get('max_tokens', 1000)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from retry-after-ms / retry-after response headers, if present"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def _record_discarded(future) -> None:
+    """Count the tokens of the hedged copy that lost the race; it is billed too"""
+    if not future.cancelled() and future.exception() is None:
+        metrics.record_usage(getattr(future.result(), 'usage', None), annotate=False)
+
+
+def _hedged(limiter: DeploymentLimiter, func: Callable[[], Any], tokens: int, delay: float) -> Any:
+    """Start func; if it is still running after delay and there is capacity, race a second copy"""
+    primary = _hedge_executor.submit(metrics.bind(func))
+    done, _ = wait([primary], timeout=delay)
+    if done or not limiter.try_acquire(tokens):
+        return primary.result()
+
+    metrics.incr(f"rate_limit.{limiter.name}.hedged")
+    backup = _hedge_executor.submit(metrics.bind(func))
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    metrics.incr(f"rate_limit.{limiter.name}.hedge_won")
+                for other in pending:
+                    other.add_done_callback(_record_discarded)
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+def limited_call(deployment: str, func: Callable[..., Any], *args, hedge: bool = False, **kwargs) -> Any:
+    """
+    Call func(*args, **kwargs) under the deployment's rate limit, retrying
+    retryable Azure errors with jittered exponential backoff. hedge=True
+    marks the request as idempotent and cheap enough to duplicate when slow;
+    leave it off for audio uploads.
+    """
+    # Imported here rather than at module load to keep the SDK off the app's startup path
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    retryable = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+    limiter = get_limiter(deployment)
+    tokens = estimate_tokens(kwargs)
+    max_retries = int(os.getenv("VOICERX_MAX_RETRIES", "5"))
+    base = float(os.getenv("VOICERX_RETRY_BASE", "0.5"))
+    cap = float(os.getenv("VOICERX_RETRY_CAP", "30"))
+    hedge = hedge and os.getenv("VOICERX_HEDGE", "0") == "1"
+
+    with metrics.span(f"azure.{deployment}"):
+        attempt, waited = 0, 0.0
+        while True:
+            waited += limiter.acquire(tokens)
+            started = time.perf_counter()
+            try:
+                delay = limiter.hedge_delay() if hedge else None
+                if delay is not None:
+                    result = _hedged(limiter, lambda: func(*args, **kwargs), tokens, delay)
+                else:
+                    result = func(*args, **kwargs)
+            except retryable as e:
+                retry_after = _retry_after(e)
+                if isinstance(e, RateLimitError):
+                    limiter.throttled(retry_after if retry_after is not None else base * 2 ** attempt)
+                if attempt >= max_retries:
+                    metrics.incr(f"rate_limit.{deployment}.gave_up")
+                    raise
+                # Full jitter, but never sooner than the server asked for
+                backoff = max(retry_after or 0.0, random.uniform(0, min(cap, base * 2 ** attempt)))
+                metrics.incr(f"rate_limit.{deployment}.retries")
+                logger.warning(f"{deployment} call failed ({type(e).__name__}), retry {attempt + 1} in {backoff:.2f}s")
+                time.sleep(backoff)
+                waited += backoff
+                attempt += 1
+                continue
+            limiter.succeeded(time.perf_counter() - started)
+            metrics.set_attributes(retries=attempt, queued_seconds=round(waited, 3))
+            # Streams report usage in their last chunk instead
+            metrics.record_usage(getattr(result, 'usage', None))
+            return result
@@ -0,0 +1,151 @@
+"""
+Persistent content-addressed cache for pipeline stage results.
+
+Each entry is keyed by a SHA-256 over everything that determines the
+output: the audio bytes or transcript, the model, the prompt and the API
+version. Re-uploading a recording or rerunning a session after a
+reconnect then returns the stored transcription, analysis or note without
+calling Azure again.
+
+Entries live in a local SQLite database. When it grows past its size
+bound, the least recently used entries are evicted.
+
+Settings:
+- VOICERX_RESULT_CACHE: database path (default .cache/voicerx_results.sqlite3)
+- VOICERX_RESULT_CACHE_MB: size bound in megabytes (default 256, 0 disables)
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def audio_fingerprint(buffer) -> str:
+    """Stable SHA-256 of an audio buffer; memoryviews are hashed without copying"""
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """SHA-256 over the given parts; bytes are hashed as-is, everything else as JSON"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = part
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Size-bounded SQLite store of JSON values keyed by content hash"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            path=os.getenv("VOICERX_RESULT_CACHE", os.path.join(".cache", "voicerx_results.sqlite3")),
+            max_bytes=int(float(os.getenv("VOICERX_RESULT_CACHE_MB", "256")) * 1024 * 1024)
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        """Stored value for key, or None"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache read failed: {str(e)}")
+            return None
+        if row is None:
+            metrics.incr(f"result_cache.{stage}.miss")
+            return None
+        metrics.incr(f"result_cache.{stage}.hit")
+        return json.loads(row[0])
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, stage, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, stage, data, len(data), now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache write failed: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used entries until the store fits its bound"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if excess <= 0:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            excess -= size
+            evicted += 1
+        metrics.incr("result_cache.evicted", evicted)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT stage, COUNT(*), COALESCE(SUM(size), 0) FROM results GROUP BY stage"
+            ).fetchall()
+        return {
+            'enabled': True,
+            'max_bytes': self.max_bytes,
+            'stages': {stage: {'entries': count, 'bytes': size} for stage, count, size in rows}
+        }
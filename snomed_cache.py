@@ -0,0 +1,98 @@
+"""
+In-process cache of SNOMED CT lookups, keyed on the normalized keyword.
+
+SNOMED releases change only a couple of times a year, so matches for
+common terms ("headache", "fever") can be reused across patients. Entries
+are evicted least-recently-used beyond a size bound. They expire after a
+TTL, or at once when SNOMED_RELEASE_VERSION changes.
+
+Settings:
+- VOICERX_SNOMED_CACHE_SIZE: max cached keywords (default 10000, 0 disables)
+- VOICERX_SNOMED_CACHE_TTL: seconds an entry stays valid (default ~6 months)
+- SNOMED_RELEASE_VERSION: release identifier stored with each entry
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import metrics
+
+DEFAULT_TTL_SECONDS = 183 * 24 * 3600
+
+
+class TermCache:
+    """Thread-safe LRU of {keyword: matches} with TTL and release pinning"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 release: str = "unknown"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.release = release
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TermCache":
+        return cls(
+            max_entries=int(os.getenv("VOICERX_SNOMED_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("VOICERX_SNOMED_CACHE_TTL", str(DEFAULT_TTL_SECONDS))),
+            release=os.getenv("SNOMED_RELEASE_VERSION", "unknown")
+        )
+
+    def get(self, keyword: str, top_k: int) -> Optional[list]:
+        """Cached matches for keyword, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(keyword)
+            if entry is not None:
+                release, stored_at, stored_top_k, matches = entry
+                fresh = release == self.release and time.time() - stored_at < self.ttl_seconds
+                if not fresh:
+                    del self._entries[keyword]
+                elif stored_top_k >= top_k:
+                    self._entries.move_to_end(keyword)
+                    self.hits += 1
+                    metrics.incr("snomed_cache.hit")
+                    return list(matches[:top_k])
+            self.misses += 1
+            metrics.incr("snomed_cache.miss")
+            return None
+
+    def put(self, keyword: str, top_k: int, matches: list) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[keyword] = (self.release, time.time(), top_k, tuple(matches))
+            self._entries.move_to_end(keyword)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("snomed_cache.evicted")
+
+    def get_many(self, keywords: List[str], top_k: int) -> Dict[str, list]:
+        """Cached matches for every keyword that hits; misses are left out"""
+        found = {}
+        for keyword in keywords:
+            matches = self.get(keyword, top_k)
+            if matches is not None:
+                found[keyword] = matches
+        return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'release': self.release,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,319 @@
+"""
+Offline SNOMED CT term index built directly from RF2 description files.
+
+Lets VoiceRx resolve terms in-process, without a Neo4j server. The index
+is a directory of compact files that are memory-mapped when loaded:
+
+- terms.bin     fixed-size records (term offset, length, conceptId, semantic tag id)
+- strings.bin   UTF-8 text of every description
+- postings.bin  uint32 term ids, grouped by character trigram
+- trigrams.json {trigram: [first posting, posting count]}
+- meta.json     term count, semantic tags and the source release
+
+Lookups count, per term id, how many of the query's trigrams each term
+shares across the posting lists, leaving out the padding and word-boundary
+trigrams that most terms contain. Terms below the overlap threshold are
+dropped before any record is decoded, and only the MAX_CANDIDATES terms
+with the highest estimated overlap are decoded and ranked by trigram
+similarity and (bounded) edit distance. They return the same (conceptId,
+term, semanticTag, score) tuples as the Neo4j search.
+
+Build an index from a release:
+
+    python snomed_index.py build \\
+        SnomedCT_InternationalRF2/Snapshot/Terminology/sct2_Description_Snapshot-en_INT_20250101.txt \\
+        snomed_index
+"""
+import array
+import csv
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FSN_TYPE_ID = "900000000000003001"
+SYNONYM_TYPE_ID = "900000000000013009"
+
+# term offset, term length (bytes), conceptId, semantic tag id
+_RECORD = struct.Struct("<IIQH2x")
+_RECORD_DTYPE = np.dtype([("offset", "<u4"), ("length", "<u4"), ("concept_id", "<u8"), ("tag_id", "<u2"), ("", "V2")])
+_SEMANTIC_TAG = re.compile(r"\s*\(([^()]+)\)\s*$")
+_NON_WORD = re.compile(r"[^\w]+")
+
+MIN_SCORE = 0.3
+
+# Terms decoded and scored per lookup, those sharing the most trigrams with the query
+MAX_CANDIDATES = 500
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace, as used for matching"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """
+    Levenshtein distance between two strings. With max_distance, only the
+    diagonal band of that width is computed, and max_distance + 1 is
+    returned as soon as the distance must exceed it.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    limit = len(a) if max_distance is None else max_distance
+    beyond = limit + 1
+    if len(a) - len(b) > limit:
+        return beyond
+    previous = [j if j <= limit else beyond for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [beyond] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        for j in range(low, high + 1):
+            # min() of the three costs, unrolled: this loop dominates lookup time
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] < cost:
+                cost = previous[j] + 1
+            if current[j - 1] < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+        if min(current[low - 1:high + 1]) > limit:
+            return beyond
+        previous = current
+    return min(previous[-1], beyond)
+
+
+def _read_descriptions(rf2_path: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (conceptId, term, semantic tag) for active FSNs and synonyms"""
+    semantic_tags: Dict[str, str] = {}
+    rows = []
+    with open(rf2_path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        for row in reader:
+            if row["active"] != "1":
+                continue
+            term = row["term"]
+            if row["typeId"] == FSN_TYPE_ID:
+                match = _SEMANTIC_TAG.search(term)
+                if match:
+                    semantic_tags[row["conceptId"]] = match.group(1)
+                    term = term[:match.start()]
+            elif row["typeId"] != SYNONYM_TYPE_ID:
+                continue
+            rows.append((row["conceptId"], term))
+
+    seen = set()
+    for concept_id, term in rows:
+        key = (concept_id, normalize(term))
+        if key in seen:
+            continue
+        seen.add(key)
+        yield concept_id, term, semantic_tags.get(concept_id, "")
+
+
+def build_index(rf2_path: str, out_dir: str, release: str = "") -> int:
+    """Build an index directory from an RF2 description file; returns the term count"""
+    os.makedirs(out_dir, exist_ok=True)
+    tags: Dict[str, int] = {}
+    postings: Dict[str, array.array] = defaultdict(lambda: array.array("I"))
+    count = 0
+
+    with open(os.path.join(out_dir, "terms.bin"), "wb") as terms_file, \
+            open(os.path.join(out_dir, "strings.bin"), "wb") as strings_file:
+        offset = 0
+        for concept_id, term, tag in _read_descriptions(rf2_path):
+            encoded = term.encode("utf-8")
+            tag_id = tags.setdefault(tag, len(tags))
+            terms_file.write(_RECORD.pack(offset, len(encoded), int(concept_id), tag_id))
+            strings_file.write(encoded)
+            offset += len(encoded)
+            for gram in trigrams(normalize(term)):
+                postings[gram].append(count)
+            count += 1
+
+    directory = {}
+    with open(os.path.join(out_dir, "postings.bin"), "wb") as postings_file:
+        position = 0
+        for gram in sorted(postings):
+            ids = postings[gram]
+            ids.tofile(postings_file)
+            directory[gram] = [position, len(ids)]
+            position += len(ids)
+
+    with open(os.path.join(out_dir, "trigrams.json"), "w", encoding="utf-8") as f:
+        json.dump(directory, f, ensure_ascii=False, separators=(",", ":"))
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            'terms': count,
+            'semantic_tags': sorted(tags, key=tags.get),
+            'release': release or os.path.basename(rf2_path),
+        }, f, indent=2)
+    return count
+
+
+def _map(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LocalSnomedIndex:
+    """Read-only, memory-mapped view of an index directory"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(index_dir, "trigrams.json"), encoding="utf-8") as f:
+            self._trigrams: Dict[str, List[int]] = json.load(f)
+        self.release = meta.get('release', '')
+        self.size = meta['terms']
+        self._tags = meta['semantic_tags']
+        self._terms = _map(os.path.join(index_dir, "terms.bin"))
+        self._strings = _map(os.path.join(index_dir, "strings.bin"))
+        self._postings_map = _map(os.path.join(index_dir, "postings.bin"))
+        self._postings = np.frombuffer(self._postings_map, dtype=np.uint32)
+        self._lengths = np.frombuffer(self._terms, dtype=_RECORD_DTYPE)["length"]
+
+    def close(self) -> None:
+        # The arrays export the mapped buffers, which cannot be closed while they exist
+        self._postings = self._lengths = None
+        for mapped in (self._terms, self._strings, self._postings_map):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def _record(self, term_id: int) -> Tuple[str, str, str]:
+        offset, length, concept_id, tag_id = _RECORD.unpack_from(self._terms, term_id * _RECORD.size)
+        term = self._strings[offset:offset + length].decode("utf-8")
+        return str(concept_id), term, self._tags[tag_id]
+
+    def _candidates(self, query_grams: List[str], max_candidates: Optional[int]) -> np.ndarray:
+        """
+        Ids of the terms sharing enough of the query's trigrams, counted across
+        the posting lists; at most max_candidates, those with the highest
+        estimated overlap
+        """
+        # Padding and word-boundary trigrams (" he", "ad ", "d p") occur in most
+        # terms; they are left out unless the query has no others
+        grams = [gram for gram in query_grams if " " not in gram] or query_grams
+        shared = np.zeros(self.size, dtype=np.uint16)
+        for gram in grams:
+            start, count = self._trigrams[gram]
+            shared[self._postings[start:start + count]] += 1
+
+        # Same overlap the scoring requires (dice of at least MIN_SCORE / 2)
+        min_shared = max(1, math.ceil(MIN_SCORE * len(grams) / 2))
+        candidates = np.flatnonzero(shared >= min_shared)
+        if max_candidates is None or len(candidates) <= max_candidates:
+            return candidates
+        # Dice estimated from the term's length, which is stored in its record
+        overlap = shared[candidates] / (len(grams) + self._lengths[candidates].astype(np.float32))
+        return candidates[np.argpartition(-overlap, max_candidates - 1)[:max_candidates]]
+
+    def search(self, keyword: str, top_k: int = 10, max_candidates: Optional[int] = MAX_CANDIDATES) -> List[tuple]:
+        """
+        Fuzzy lookup of one keyword; returns [(conceptId, term, semanticTag, score)].
+        max_candidates=None scores every term above the overlap threshold.
+        """
+        query = normalize(keyword)
+        if not query:
+            return []
+        query_grams = [gram for gram in trigrams(query) if gram in self._trigrams]
+        if not query_grams:
+            return []
+
+        total_grams = len(trigrams(query))
+        candidates = self._candidates(query_grams, max_candidates)
+
+        query_set = set(query_grams)
+        matches = []
+        for term_id in candidates.tolist():
+            concept_id, term, tag = self._record(term_id)
+            normalized = normalize(term)
+            term_grams = trigrams(normalized)
+            shared = len(query_set & term_grams)
+            dice = 2 * shared / (total_grams + len(term_grams))
+            if dice >= MIN_SCORE / 2:
+                # An edit changes at most 3 trigrams, which bounds the edit distance from below
+                min_distance = math.ceil((max(total_grams, len(term_grams)) - shared) / 3)
+                matches.append((dice, concept_id, term, tag, normalized, min_distance))
+
+        # Best trigram matches first, so the top_k floor rises before most edit distances
+        matches.sort(key=lambda match: -match[0])
+        scored = []
+        best_by_concept: Dict[str, float] = {}
+        floor = MIN_SCORE  # a match must score above this to reach the top_k concepts
+        for dice, concept_id, term, tag, normalized, min_distance in matches:
+            # Edit distance only matters when it could beat the trigram score and the floor
+            longest = max(len(query), len(normalized))
+            max_distance = math.ceil((1 - max(dice, floor)) * longest) - 1
+            edit_similarity = 0.0
+            if max_distance >= min_distance:
+                distance = edit_distance(query, normalized, max_distance)
+                if distance <= max_distance:
+                    edit_similarity = 1 - distance / longest
+            score = round(max(dice, edit_similarity), 4)
+            if score > MIN_SCORE:
+                scored.append((concept_id, term, tag, score))
+                if score > best_by_concept.get(concept_id, 0.0):
+                    best_by_concept[concept_id] = score
+                    if len(best_by_concept) >= top_k:
+                        floor = max(MIN_SCORE, heapq.nlargest(top_k, best_by_concept.values())[-1])
+
+        scored.sort(key=lambda match: (-match[3], len(match[1])))
+        results, seen = [], set()
+        for match in scored:
+            if match[0] in seen:
+                continue
+            seen.add(match[0])
+            results.append(match)
+            if len(results) == top_k:
+                break
+        return results
+
+    def search_many(self, keywords: List[str], top_k: int = 10) -> Dict[str, list]:
+        return {keyword: self.search(keyword, top_k) for keyword in keywords}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build or query an offline SNOMED CT term index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an index from an RF2 description file")
+    build.add_argument("rf2_file")
+    build.add_argument("index_dir")
+    build.add_argument("--release", default="", help="Release identifier stored in meta.json")
+    query = commands.add_parser("query", help="Look up terms in an existing index")
+    query.add_argument("index_dir")
+    query.add_argument("terms", nargs="+")
+    query.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        total = build_index(args.rf2_file, args.index_dir, args.release)
+        print(f"Indexed {total} descriptions in {time.perf_counter() - started:.1f}s")
+    else:
+        index = LocalSnomedIndex(args.index_dir)
+        for term in args.terms:
+            started = time.perf_counter()
+            matches = index.search(term, args.top_k)
+            elapsed_us = (time.perf_counter() - started) * 1e6
+            print(f"{term!r} ({elapsed_us:.0f} us)")
+            for concept_id, label, tag, score in matches:
+                print(f"  {concept_id}  {label} ({tag})  {score}")
+        index.close()
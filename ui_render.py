@@ -0,0 +1,148 @@
+"""
+HTML builders for the result panels of the Streamlit app.
+
+Each panel (transcript, medical analysis, SNOMED CT matches) is built as a
+single HTML string and sent with one st.markdown call, instead of one call
+per line or per SNOMED match. Builders are memoized on a fingerprint of the
+result they render, so reruns that show an unchanged result reuse the HTML.
+Cache hits and misses are counted as ui.html_cache.hit / .miss.
+"""
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from html import escape
+from typing import Callable
+
+import metrics
+
+_CACHE_SIZE = 256
+
+SEVERITY_COLORS = {'mild': '#10b981', 'moderate': '#f59e0b', 'severe': '#ef4444', 'critical': '#dc2626'}
+URGENCY_COLORS = {'low': '#10b981', 'medium': '#f59e0b', 'high': '#ef4444', 'emergency': '#dc2626'}
+
+# (original-language heading, English heading) per portal
+TRANSCRIPT_HEADINGS = {
+    'patient': ("Original Transcript", "Patient Transcript"),
+    'doctor': ("Original Assessment", "Doctor's Assessment"),
+}
+
+
+def fingerprint(value) -> str:
+    """Stable digest of a JSON-like result"""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def memoized_html(builder: Callable[..., str]) -> Callable[..., str]:
+    """Cache builder(value, *args) on (fingerprint(value), args), LRU-bounded and shared by sessions"""
+    cache: "OrderedDict[tuple, str]" = OrderedDict()
+    lock = threading.Lock()
+
+    @functools.wraps(builder)
+    def wrapper(value, *args) -> str:
+        key = (fingerprint(value), args)
+        with lock:
+            html = cache.get(key)
+            if html is not None:
+                cache.move_to_end(key)
+        if html is not None:
+            metrics.incr("ui.html_cache.hit")
+            return html
+        metrics.incr("ui.html_cache.miss")
+        html = builder(value, *args)
+        with lock:
+            cache[key] = html
+            if len(cache) > _CACHE_SIZE:
+                cache.popitem(last=False)
+        return html
+
+    return wrapper
+
+
+def _heading(text: str) -> str:
+    return f'<p style="margin: 16px 0 8px 0;"><strong>📝 {escape(text)}:</strong></p>'
+
+
+def _box(text: str, style: str = "") -> str:
+    style_attribute = f' style="{style}"' if style else ""
+    return f'<div class="content-box transcript-box"{style_attribute}>{escape(text)}</div>'
+
+
+@memoized_html
+def transcript_html(transcription: dict, role: str) -> str:
+    """Language badge plus the original and/or English transcript"""
+    original_heading, english_heading = TRANSCRIPT_HEADINGS[role]
+    if not transcription['translated']:
+        return (
+            '<span class="language-badge">🇺🇸 Detected: English</span>'
+            + _heading(english_heading) + _box(transcription['english_text'])
+        )
+
+    language = escape(transcription['detected_language'].title())
+    parts = [f'<span class="language-badge">🌐 Detected: {language} → Translated to English</span>']
+    if transcription['original_text'] != transcription['english_text']:
+        parts += [_heading(original_heading), _box(transcription['original_text'], "border-left-color: #f59e0b;")]
+    parts += [_heading("English Translation"), _box(transcription['english_text'])]
+    return "".join(parts)
+
+
+def _tags(items: list, empty: str, box_style: str, tag_style: str = "") -> str:
+    if not items:
+        return f'<div class="content-box" style="border-left-color: #6b7280;"><em>{empty}</em></div>'
+    tag_attribute = f' style="{tag_style}"' if tag_style else ""
+    tags = "".join(f'<span class="disease-tag"{tag_attribute}>{escape(item.title())}</span>' for item in items)
+    return f'<div class="content-box diseases-box"{box_style}>{tags}</div>'
+
+
+def _level_box(label: str, level: str, color: str) -> str:
+    return (
+        f'<div class="content-box" style="border-left-color: {color};">'
+        f'<strong>{label}:</strong> <span style="color: {color}; font-weight: 600;">{escape(level.title())}</span></div>'
+    )
+
+
+@memoized_html
+def analysis_html(analysis: dict) -> str:
+    """Conditions and symptoms side by side, then severity and urgency"""
+    severity = analysis.get('severity', 'unknown')
+    urgency = analysis.get('urgency', 'unknown')
+    conditions = _tags(analysis.get('diseases', []), "No specific conditions identified", "")
+    symptoms = _tags(
+        analysis.get('symptoms', []), "No specific symptoms identified",
+        ' style="border-left-color: #f59e0b; background: #fffbeb;"',
+        "background: linear-gradient(135deg, #f59e0b, #d97706);"
+    )
+    grid = '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 16px;">'
+    return (
+        f'{grid}<div><p><strong>🏥 Medical Conditions:</strong></p>{conditions}</div>'
+        f'<div><p><strong>🩺 Symptoms Reported:</strong></p>{symptoms}</div></div>'
+        f'{grid}{_level_box("⚕️ Severity", severity, SEVERITY_COLORS.get(severity, "#6b7280"))}'
+        f'{_level_box("🚨 Urgency", urgency, URGENCY_COLORS.get(urgency, "#6b7280"))}</div>'
+    )
+
+
+@memoized_html
+def snomed_html(snomed: dict, per_term: int = 5) -> str:
+    """Top SNOMED CT matches for each looked-up term, or the empty-state message"""
+    terms = []
+    for term, matches in snomed.items():
+        if not matches:
+            continue
+        rows = []
+        for match in matches[:per_term]:
+            concept_id, label = match[0], match[1]
+            rows.append(
+                f'<div class="snomed-match"><span><span class="concept-id">{escape(str(concept_id))}</span>'
+                f' - {escape(label)}</span></div>'
+            )
+        terms.append(f'<div class="snomed-term"><div class="snomed-term-title">🔍 {escape(term.title())}</div>'
+                     f'{"".join(rows)}</div>')
+    if not terms:
+        return ('<div class="content-box" style="border-left-color: #6b7280;">'
+                '<em>No SNOMED CT matches found or no specific medical terms identified</em></div>')
+    return (
+        '<div class="snomed-container"><div class="snomed-header">📚 SNOMED CT Medical Terminology Matches</div>'
+        f'<div class="snomed-content">{"".join(terms)}</div></div>'
+    )
@@ -1,1254 +1,587 @@
-import streamlit as st
-import os
-from datetime import datetime
-from openai import AzureOpenAI
-from typing import List, Dict, Optional
-from neo4j import GraphDatabase
-from dotenv import load_dotenv
-import json
-import logging
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# --- Config ---
-st.set_page_config(
-    page_title="VoiceRx",
-    page_icon="🏥",
-    layout="wide",
-    initial_sidebar_state="collapsed"
-)
-
-# Create directories
-os.makedirs("voice_recordings", exist_ok=True)
-os.makedirs("doctors_recordings", exist_ok=True)
-
-# Custom CSS matching ABHA profile style
-st.markdown("""
-<style>
-    /* Global Styles */
-    .stApp {
-        background: linear-gradient(135deg, #ffffff 0%, #f8fafb 100%);
-    }
-    
-    /* Hide Streamlit elements */
-    .stDeployButton {display: none;}
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Main Header */
-    .main-header {
-        background: white;
-        padding: 20px 40px;
-        border-bottom: 2px solid #e5e7eb;
-        margin-bottom: 30px;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.08);
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-    }
-    
-    .welcome-section {
-        flex: 1;
-    }
-    
-    .welcome-title {
-        font-size: 2rem;
-        font-weight: 700;
-        color: #1f2937;
-        margin-bottom: 5px;
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-    }
-    
-    .welcome-subtitle {
-        font-size: 1rem;
-        color: #6b7280;
-        margin: 0;
-    }
-    
-    .header-controls {
-        display: flex;
-        align-items: center;
-        gap: 20px;
-    }
-    
-    /* User Info */
-    .user-info {
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        color: white;
-        padding: 12px 20px;
-        border-radius: 25px;
-        font-weight: 600;
-        box-shadow: 0 4px 15px rgba(99, 102, 241, 0.3);
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    
-    /* Main Container */
-    .profile-container {
-        max-width: 1200px;
-        margin: 0 auto;
-        padding: 0 20px;
-    }
-    
-    /* Recording Section Cards */
-    .recording-section {
-        background: white;
-        border-radius: 20px;
-        padding: 30px;
-        margin-bottom: 30px;
-        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.1);
-        border: 1px solid #e5e7eb;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .recording-section::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 4px;
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        transition: height 0.3s ease;
-    }
-    
-    .recording-section:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 20px 50px rgba(0, 0, 0, 0.15);
-    }
-    
-    .recording-section:hover::before {
-        height: 8px;
-    }
-    
-    /* Language Detection Badge */
-    .language-badge {
-        background: linear-gradient(135deg, #10b981, #059669);
-        color: white;
-        padding: 4px 12px;
-        border-radius: 12px;
-        font-size: 12px;
-        font-weight: 500;
-        display: inline-block;
-        margin: 5px 0;
-        box-shadow: 0 2px 8px rgba(16, 185, 129, 0.3);
-    }
-    
-    /* Section Headers */
-    .section-header {
-        display: flex;
-        align-items: center;
-        gap: 15px;
-        margin-bottom: 25px;
-        padding-bottom: 15px;
-        border-bottom: 2px solid #f3f4f6;
-    }
-    
-    .section-icon {
-        width: 60px;
-        height: 60px;
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        border-radius: 50%;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.8rem;
-        color: white;
-        box-shadow: 0 8px 25px rgba(99, 102, 241, 0.3);
-        transition: all 0.3s ease;
-    }
-    
-    .section-header:hover .section-icon {
-        transform: scale(1.1);
-        box-shadow: 0 12px 35px rgba(99, 102, 241, 0.4);
-    }
-    
-    .section-title {
-        font-size: 1.5rem;
-        font-weight: 700;
-        color: #1f2937;
-        margin: 0;
-    }
-    
-    .section-subtitle {
-        font-size: 1rem;
-        color: #6b7280;
-        margin: 5px 0 0 0;
-    }
-    
-    /* Audio Input Container */
-    .audio-container {
-        background: #f9fafb;
-        border: 2px dashed #d1d5db;
-        border-radius: 12px;
-        padding: 20px;
-        text-align: center;
-        margin-bottom: 20px;
-        transition: all 0.3s ease;
-    }
-    
-    .audio-container:hover {
-        border-color: #6366f1;
-        background: #f8faff;
-    }
-    
-    /* Buttons */
-    .stButton > button {
-        background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-        color: white;
-        border: none;
-        border-radius: 8px;
-        padding: 12px 20px;
-        font-size: 14px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 3px 10px rgba(99, 102, 241, 0.3);
-        width: 100%;
-        height: 45px;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 15px rgba(99, 102, 241, 0.4);
-        background: linear-gradient(135deg, #5855eb 0%, #7c3aed 100%);
-        color: #fde047;
-    }
-    
-    /* Status Messages */
-    .success-message {
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        color: white;
-        padding: 12px 16px;
-        border-radius: 8px;
-        margin: 15px 0;
-        font-weight: 500;
-        box-shadow: 0 3px 10px rgba(16, 185, 129, 0.3);
-    }
-    
-    .processing-message {
-        background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-        color: white;
-        padding: 12px 16px;
-        border-radius: 8px;
-        margin: 15px 0;
-        font-weight: 500;
-        box-shadow: 0 3px 10px rgba(245, 158, 11, 0.3);
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    
-    /* Content Display Boxes */
-    .content-box {
-        background: #f9fafb;
-        border: 1px solid #e5e7eb;
-        border-radius: 12px;
-        padding: 20px;
-        margin: 15px 0;
-        border-left: 4px solid #6366f1;
-    }
-    
-    .transcript-box {
-        font-family: 'Georgia', serif;
-        line-height: 1.6;
-        color: #374151;
-        font-size: 15px;
-    }
-    
-    .diseases-box {
-        background: #f0fdf4;
-        border-left-color: #10b981;
-    }
-    
-    .disease-tag {
-        display: inline-block;
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        color: white;
-        padding: 6px 12px;
-        border-radius: 20px;
-        font-size: 12px;
-        font-weight: 500;
-        margin: 4px;
-        box-shadow: 0 2px 8px rgba(16, 185, 129, 0.3);
-    }
-    
-    /* SNOMED Results */
-    .snomed-container {
-        background: #fefefe;
-        border: 1px solid #e5e7eb;
-        border-radius: 12px;
-        margin: 15px 0;
-        overflow: hidden;
-    }
-    
-    .snomed-header {
-        background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-        color: white;
-        padding: 12px 20px;
-        font-weight: 600;
-        font-size: 14px;
-    }
-    
-    .snomed-content {
-        padding: 20px;
-    }
-    
-    .snomed-term {
-        background: #f8faff;
-        border: 1px solid #e0e7ff;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-    }
-    
-    .snomed-term-title {
-        font-weight: 600;
-        color: #374151;
-        margin-bottom: 8px;
-        text-transform: capitalize;
-    }
-    
-    .snomed-match {
-        background: white;
-        border: 1px solid #d1d5db;
-        border-radius: 6px;
-        padding: 8px 12px;
-        margin: 4px 0;
-        font-family: 'Courier New', monospace;
-        font-size: 12px;
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-    }
-    
-    .concept-id {
-        font-weight: 600;
-        color: #6366f1;
-    }
-    
-    /* Clinical Note */
-    .clinical-note-container {
-        background: white;
-        border: 2px solid #6366f1;
-        border-radius: 16px;
-        margin: 30px 0;
-        overflow: hidden;
-        box-shadow: 0 10px 30px rgba(99, 102, 241, 0.2);
-    }
-    
-    .clinical-note-header {
-        background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-        color: white;
-        padding: 20px;
-        text-align: center;
-    }
-    
-    .clinical-note-title {
-        font-size: 1.3rem;
-        font-weight: 700;
-        margin: 0;
-    }
-    
-    .clinical-note-content {
-        padding: 30px;
-        font-family: 'Georgia', serif;
-        line-height: 1.8;
-        color: #374151;
-    }
-    
-    .clinical-note-content h4 {
-        color: #6366f1;
-        border-bottom: 2px solid #e0e7ff;
-        padding-bottom: 8px;
-        margin: 20px 0 15px 0;
-        font-weight: 600;
-    }
-    
-    /* Step Indicators */
-    .step-indicator {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 15px;
-        margin: 20px 0;
-        padding: 15px;
-        background: #f8faff;
-        border-radius: 12px;
-        border: 1px solid #e0e7ff;
-    }
-    
-    .step-dot {
-        width: 12px;
-        height: 12px;
-        border-radius: 50%;
-        background: #d1d5db;
-        transition: all 0.3s ease;
-    }
-    
-    .step-dot.active {
-        background: #6366f1;
-        box-shadow: 0 0 12px rgba(99, 102, 241, 0.6);
-        transform: scale(1.3);
-    }
-    
-    .step-dot.completed {
-        background: #10b981;
-        transform: scale(1.2);
-    }
-    
-    .step-line {
-        width: 30px;
-        height: 2px;
-        background: #d1d5db;
-        transition: all 0.3s ease;
-    }
-    
-    .step-line.active {
-        background: #6366f1;
-    }
-    
-    /* Responsive Design */
-    @media (max-width: 768px) {
-        .main-header {
-            flex-direction: column;
-            gap: 15px;
-            padding: 20px;
-        }
-        
-        .welcome-title {
-            font-size: 1.5rem;
-        }
-        
-        .recording-section {
-            padding: 20px;
-            margin-bottom: 20px;
-        }
-        
-        .section-header {
-            flex-direction: column;
-            text-align: center;
-            gap: 10px;
-        }
-    }
-    
-    /* Animation */
-    @keyframes fadeInUp {
-        from {
-            opacity: 0;
-            transform: translateY(20px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    .recording-section {
-        animation: fadeInUp 0.6s ease-out;
-    }
-    
-    /* Spinner customization */
-    .stSpinner > div {
-        border-color: #6366f1 transparent #6366f1 transparent !important;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# --- Helper Functions ---
-def save_audio_file(audio_file, username: str, folder: str) -> str:
-    """Save uploaded audio file with timestamp"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{username}_{timestamp}.wav"
-    filepath = os.path.join(folder, filename)
-    with open(filepath, "wb") as f:
-        f.write(audio_file.getbuffer())
-    return filepath
-
-def check_azure_credentials() -> dict:
-    """Check if Azure credentials are properly configured"""
-    credentials = {
-        'whisper_api_key': os.getenv("AZURE_OPENAI_API_KEY"),
-        'whisper_endpoint': os.getenv("AZURE_OPENAI_ENDPOINT"),
-        'chat_api_key': os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
-        'chat_endpoint': os.getenv("AZURE_OPENAI_CHAT_ENDPOINT")
-    }
-    
-    missing = [key for key, value in credentials.items() if not value]
-    return {
-        'valid': len(missing) == 0,
-        'missing': missing,
-        'credentials': credentials
-    }
-
-def transcribe_audio_multilingual(filepath: str) -> dict:
-    """
-    Enhanced transcribe audio using Azure OpenAI Whisper with multilingual support
-    Returns both original and English translation if needed
-    """
-    creds_check = check_azure_credentials()
-    if not creds_check['valid']:
-        raise ValueError(f"Missing Azure OpenAI credentials: {', '.join(creds_check['missing'])}")
-    
-    try:
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-06-01",  # Latest Whisper API version
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        with open(filepath, "rb") as audio:
-            # First transcription - detect language and transcribe in original language
-            result = client.audio.transcriptions.create(
-                file=audio,
-                model="whisper",
-                response_format="verbose_json",  # Get detailed response with language detection
-                temperature=0.1  # Lower temperature for more consistent results
-            )
-            
-            original_text = result.text
-            detected_language = result.language if hasattr(result, 'language') else 'unknown'
-            
-            # If not English, translate to English using Whisper's translation feature
-            english_text = original_text
-            if detected_language != 'en' and detected_language != 'english':
-                logger.info(f"Detected non-English language: {detected_language}. Translating to English...")
-                
-                # Reset file pointer for translation
-                with open(filepath, "rb") as audio_translate:
-                    translation_result = client.audio.translations.create(
-                        file=audio_translate,
-                        model="whisper",
-                        response_format="text",
-                        temperature=0.1
-                    )
-                    english_text = translation_result
-            
-            return {
-                'original_text': original_text,
-                'english_text': english_text,
-                'detected_language': detected_language,
-                'translated': detected_language != 'en' and detected_language != 'english'
-            }
-            
-    except Exception as e:
-        logger.error(f"Transcription failed: {str(e)}")
-        st.error(f"Transcription failed: {str(e)}")
-        return {
-            'original_text': "Transcription failed. Please check your Azure OpenAI configuration.",
-            'english_text': "Transcription failed. Please check your Azure OpenAI configuration.",
-            'detected_language': 'unknown',
-            'translated': False
-        }
-
-def extract_diseases_enhanced(transcript: str) -> dict:
-    """
-    Enhanced disease extraction using latest GPT-4o with structured output
-    """
-    creds_check = check_azure_credentials()
-    if not creds_check['valid']:
-        st.error(f"Missing Azure OpenAI credentials: {', '.join(creds_check['missing'])}")
-        return {'diseases': [], 'symptoms': [], 'severity': 'unknown'}
-    
-    try:
-        client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_CHAT_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
-            api_version="2025-01-01-preview"  # Latest API version for GPT-4o
-        )
-        
-        # Enhanced system prompt for better medical extraction
-        system_prompt = """You are an expert medical AI assistant specializing in clinical documentation.
-        
-        Analyze the medical transcript and extract:
-        1. Diseases/Conditions mentioned
-        2. Symptoms reported
-        3. Overall severity assessment (mild, moderate, severe, critical)
-        
-        Return your response as a valid JSON object with this exact structure:
-        {
-            "diseases": ["list of medical conditions/diseases"],
-            "symptoms": ["list of symptoms"],
-            "severity": "mild|moderate|severe|critical",
-            "urgency": "low|medium|high|emergency"
-        }
-        
-        Be precise and use standard medical terminology. If no clear diseases are mentioned, return empty arrays."""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",  # Latest GPT-4o model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Medical transcript to analyze: {transcript}"}
-            ],
-            temperature=0.1,  # Low temperature for consistent medical analysis
-            max_tokens=1000,
-            response_format={"type": "json_object"}  # Structured JSON response
-        )
-        
-        result = json.loads(response.choices[0].message.content.strip())
-        
-        # Validate the response structure
-        expected_keys = ['diseases', 'symptoms', 'severity', 'urgency']
-        for key in expected_keys:
-            if key not in result:
-                result[key] = [] if key in ['diseases', 'symptoms'] else 'unknown'
-        
-        return result
-        
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing failed: {str(e)}")
-        # Fallback to simple list extraction
-        return extract_diseases_fallback(transcript)
-    except Exception as e:
-        logger.error(f"Disease extraction failed: {str(e)}")
-        st.error(f"Disease extraction failed: {str(e)}")
-        return {'diseases': [], 'symptoms': [], 'severity': 'unknown', 'urgency': 'unknown'}
-
-def extract_diseases_fallback(transcript: str) -> dict:
-    """Fallback method for disease extraction"""
-    try:
-        client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_CHAT_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
-            api_version="2025-01-01-preview"
-        )
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Extract medical conditions and symptoms from the transcript. Reply only with a Python list like: ['fever', 'headache', 'cold']."
-                },
-                {"role": "user", "content": transcript}
-            ],
-            temperature=0.1
-        )
-        
-        diseases_list = eval(response.choices[0].message.content.strip())
-        return {
-            'diseases': diseases_list,
-            'symptoms': diseases_list,  # Fallback: treat as both
-            'severity': 'unknown',
-            'urgency': 'unknown'
-        }
-    except Exception:
-        return {'diseases': [], 'symptoms': [], 'severity': 'unknown', 'urgency': 'unknown'}
-
-def search_snomed_terms(term_list: List[str]) -> dict:
-    """Enhanced SNOMED CT search with better error handling"""
-    try:
-        uri = "bolt://localhost:7687"
-        username = "neo4j"
-        password = "aakash@123"
-        driver = GraphDatabase.driver(uri, auth=(username, password))
-        results_by_keyword = {}
-        
-        # Enhanced query with better scoring and fuzzy matching
-        query = """
-        CALL db.index.fulltext.queryNodes('termIndex', $keyword + '~') YIELD node, score
-        WHERE score > 0.3
-        RETURN node.conceptId AS conceptId, node.term AS term, 
-               node.semanticTag AS semanticTag, score
-        ORDER BY score DESC
-        LIMIT 10
-        """
-        
-        with driver.session() as session:
-            for keyword in term_list:
-                try:
-                    matches = session.execute_read(
-                        lambda tx: tx.run(query, keyword=keyword.strip().lower()).data()
-                    )
-                    results_by_keyword[keyword] = [
-                        (r["conceptId"], r["term"], r.get("semanticTag", ""), r["score"]) 
-                        for r in matches
-                    ]
-                except Exception as e:
-                    logger.warning(f"SNOMED search failed for term '{keyword}': {str(e)}")
-                    results_by_keyword[keyword] = []
-                    
-        driver.close()
-        return results_by_keyword
-        
-    except Exception as e:
-        logger.error(f"SNOMED database connection failed: {str(e)}")
-        st.error(f"SNOMED search failed: {str(e)}")
-        return {term: [] for term in term_list}
-
-def generate_clinical_note_enhanced(
-    patient_transcript: str, 
-    patient_analysis: dict, 
-    doctor_transcript: str, 
-    doctor_snomed: dict,
-    patient_lang_info: dict,
-    doctor_lang_info: dict
-) -> str:
-    """
-    Enhanced clinical note generation with latest GPT-4o capabilities
-    """
-    try:
-        client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_CHAT_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_CHAT_API_KEY"),
-            api_version="2025-01-01-preview"
-        )
-
-        # Prepare enhanced context
-        patient_context = f"""
-Patient Communication:
-- Original Language: {patient_lang_info.get('detected_language', 'English')}
-- Transcript: {patient_transcript}
-- Diseases/Conditions: {', '.join(patient_analysis.get('diseases', []))}
-- Symptoms: {', '.join(patient_analysis.get('symptoms', []))}
-- Severity Assessment: {patient_analysis.get('severity', 'Not assessed')}
-- Urgency Level: {patient_analysis.get('urgency', 'Not assessed')}
-"""
-
-        doctor_context = f"""
-Doctor's Assessment:
-- Original Language: {doctor_lang_info.get('detected_language', 'English')}
-- Transcript: {doctor_transcript}
-"""
-
-        # Enhanced system prompt for clinical documentation
-        system_prompt = """You are an expert clinical documentation specialist with deep knowledge of medical terminology, clinical workflows, and healthcare standards.
-
-Create a comprehensive, structured clinical note that follows standard medical documentation practices. The note should be:
-- Clinically accurate and professionally formatted
-- Include relevant SNOMED CT codes where applicable
-- Follow SOAP (Subjective, Objective, Assessment, Plan) structure when appropriate
-- Be suitable for electronic health records (EHR)
-- Include severity and urgency assessments
-- Account for any language translation notes if applicable
-
-Format the output with clear headers and bullet points for readability."""
-
-        prompt = f"""
-Generate a detailed clinical note using the following information:
-
-{patient_context}
-
-{doctor_context}
-
-SNOMED CT Terminology References:
-{json.dumps(doctor_snomed, indent=2)}
-
-Please structure the clinical note with the following sections:
-1. Patient Presentation & Chief Complaint
-2. Clinical Findings & Symptoms
-3. Assessment & Diagnosis
-4. Treatment Plan & Recommendations
-5. Medications & Dosage (if prescribed)
-6. Follow-up Instructions
-7. Clinical Codes & References
-
-Include severity indicators and any urgent care recommendations based on the assessment.
-"""
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,  # Low temperature for clinical accuracy
-            max_tokens=2000
-        )
-        
-        clinical_note = response.choices[0].message.content.strip()
-        
-        # Add metadata footer
-        metadata = f"""
-
----
-**Documentation Metadata:**
-- Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-- Patient Language: {patient_lang_info.get('detected_language', 'English')}
-- Doctor Language: {doctor_lang_info.get('detected_language', 'English')}
-- AI Assistant: GPT-4o Clinical Documentation
-- Translation Applied: {'Yes' if patient_lang_info.get('translated', False) or doctor_lang_info.get('translated', False) else 'No'}
-"""
-        
-        return clinical_note + metadata
-        
-    except Exception as e:
-        logger.error(f"Clinical note generation failed: {str(e)}")
-        st.error(f"Clinical note generation failed: {str(e)}")
-        return "Clinical note generation failed. Please check your configuration."
-
-# --- MAIN APPLICATION ---
-
-# Set default user as user104 (always signed in)
-username = "user104"
-
-# Main Header with user info
-st.markdown(f"""
-    <div class="main-header">
-        <div class="welcome-section">
-            <h1 class="welcome-title">🎤 VoiceRx - AI Clinical Notes</h1>
-            <p class="welcome-subtitle">Multi-language voice recordings to structured clinical documentation</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-# Main container
-st.markdown('<div class="profile-container">', unsafe_allow_html=True)
-
-# Create two columns for patient and doctor sections
-col1, col2 = st.columns(2, gap="large")
-
-# --- PATIENT SIDE ---
-with col1:
-    with st.container():
-        st.markdown("""
-        <div class="recording-section">
-            <div class="section-header">
-                <div class="section-icon">👨‍🏫</div>
-                <div>
-                    <div class="section-title">Patient Portal</div>
-                    <div class="section-subtitle">Record your symptoms in any language</div>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
-        
-        # Audio input container
-        st.markdown("""
-        <div class="audio-container">
-            <h4 style="margin: 0 0 10px 0; color: #374151;">🎙️ Record symptoms in any language</h4>
-            <p style="margin: 0; color: #6b7280; font-size: 14px;">Speak naturally in your preferred language - we'll handle the translation automatically</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        patient_audio = st.audio_input("Record Patient Symptoms", key="patient_audio")
-
-        # Only process patient audio if it's new
-        if patient_audio and (not hasattr(st.session_state, 'patient_audio_processed') or 
-                            st.session_state.get('patient_audio_hash') != hash(patient_audio.getbuffer().tobytes())):
-            
-            # Mark this audio as being processed and store its hash
-            st.session_state.patient_audio_processed = True
-            st.session_state.patient_audio_hash = hash(patient_audio.getbuffer().tobytes())
-            
-            filepath = save_audio_file(patient_audio, username, "voice_recordings")
-            st.markdown(f'<div class="success-message">✅ Audio saved as <code>{os.path.basename(filepath)}</code></div>', unsafe_allow_html=True)
-
-            # Step indicators
-            st.markdown("""
-            <div class="step-indicator">
-                <div class="step-dot active"></div>
-                <div class="step-line active"></div>
-                <div class="step-dot"></div>
-                <div class="step-line"></div>
-                <div class="step-dot"></div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Step 1: Enhanced Transcription with Language Detection
-            st.markdown('<div class="processing-message">🔄 Converting speech to text with language detection...</div>', unsafe_allow_html=True)
-            
-            with st.spinner("Transcribing and translating audio..."):
-                transcription_result = transcribe_audio_multilingual(filepath)
-                st.session_state.patient_transcription = transcription_result
-            
-            # Display language detection and transcription results
-            lang_name = transcription_result['detected_language'].title()
-            if transcription_result['translated']:
-                st.markdown(f'<span class="language-badge">🌐 Detected: {lang_name} → Translated to English</span>', unsafe_allow_html=True)
-                
-                if transcription_result['original_text'] != transcription_result['english_text']:
-                    st.markdown("**📝 Original Transcript:**")
-                    st.markdown(f'<div class="content-box transcript-box" style="border-left-color: #f59e0b;">{transcription_result["original_text"]}</div>', unsafe_allow_html=True)
-                
-                st.markdown("**📝 English Translation:**")
-                st.markdown(f'<div class="content-box transcript-box">{transcription_result["english_text"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<span class="language-badge">🇺🇸 Detected: English</span>', unsafe_allow_html=True)
-                st.markdown("**📝 Patient Transcript:**")
-                st.markdown(f'<div class="content-box transcript-box">{transcription_result["english_text"]}</div>', unsafe_allow_html=True)
-
-            # Step 2: Enhanced Disease and Symptom Analysis
-            st.markdown("""
-            <div class="step-indicator">
-                <div class="step-dot completed"></div>
-                <div class="step-line active"></div>
-                <div class="step-dot active"></div>
-                <div class="step-line active"></div>
-                <div class="step-dot"></div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown('<div class="processing-message">🔍 Advanced analysis of symptoms and medical conditions...</div>', unsafe_allow_html=True)
-            
-            with st.spinner("Extracting medical terms with AI analysis..."):
-                medical_analysis = extract_diseases_enhanced(transcription_result['english_text'])
-                st.session_state.patient_analysis = medical_analysis
-
-            # Display enhanced medical analysis
-            col_diseases, col_symptoms = st.columns(2)
-            
-            with col_diseases:
-                st.markdown("**🏥 Medical Conditions:**")
-                if medical_analysis['diseases']:
-                    diseases_html = '<div class="content-box diseases-box">'
-                    for disease in medical_analysis['diseases']:
-                        diseases_html += f'<span class="disease-tag">{disease.title()}</span>'
-                    diseases_html += '</div>'
-                    st.markdown(diseases_html, unsafe_allow_html=True)
-                else:
-                    st.markdown('<div class="content-box" style="border-left-color: #6b7280;"><em>No specific conditions identified</em></div>', unsafe_allow_html=True)
-            
-            with col_symptoms:
-                st.markdown("**🩺 Symptoms Reported:**")
-                if medical_analysis['symptoms']:
-                    symptoms_html = '<div class="content-box" style="border-left-color: #f59e0b; background: #fffbeb;">'
-                    for symptom in medical_analysis['symptoms']:
-                        symptoms_html += f'<span class="disease-tag" style="background: linear-gradient(135deg, #f59e0b, #d97706);">{symptom.title()}</span>'
-                    symptoms_html += '</div>'
-                    st.markdown(symptoms_html, unsafe_allow_html=True)
-                else:
-                    st.markdown('<div class="content-box" style="border-left-color: #6b7280;"><em>No specific symptoms identified</em></div>', unsafe_allow_html=True)
-
-            # Display severity and urgency assessment
-            severity_color = {
-                'mild': '#10b981', 'moderate': '#f59e0b', 
-                'severe': '#ef4444', 'critical': '#dc2626'
-            }.get(medical_analysis.get('severity', 'unknown'), '#6b7280')
-            
-            urgency_color = {
-                'low': '#10b981', 'medium': '#f59e0b', 
-                'high': '#ef4444', 'emergency': '#dc2626'
-            }.get(medical_analysis.get('urgency', 'unknown'), '#6b7280')
-
-            col_sev, col_urg = st.columns(2)
-            with col_sev:
-                st.markdown(f"""
-                <div class="content-box" style="border-left-color: {severity_color};">
-                    <strong>⚕️ Severity:</strong> <span style="color: {severity_color}; font-weight: 600;">{medical_analysis.get('severity', 'Unknown').title()}</span>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col_urg:
-                st.markdown(f"""
-                <div class="content-box" style="border-left-color: {urgency_color};">
-                    <strong>🚨 Urgency:</strong> <span style="color: {urgency_color}; font-weight: 600;">{medical_analysis.get('urgency', 'Unknown').title()}</span>
-                </div>
-                """, unsafe_allow_html=True)
-
-            # Step 3: Enhanced SNOMED Matching
-            st.markdown("""
-            <div class="step-indicator">
-                <div class="step-dot completed"></div>
-                <div class="step-line active"></div>
-                <div class="step-dot completed"></div>
-                <div class="step-line active"></div>
-                <div class="step-dot active"></div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown('<div class="processing-message">🔬 Matching SNOMED CT medical terminology...</div>', unsafe_allow_html=True)
-            
-            with st.spinner("Searching comprehensive medical database..."):
-                # Combine all terms for SNOMED search
-                all_terms = medical_analysis['diseases'] + medical_analysis['symptoms']
-                patient_snomed = search_snomed_terms(all_terms) if all_terms else {}
-                st.session_state.patient_snomed = patient_snomed
-
-            # Display Enhanced SNOMED results
-            if patient_snomed:
-                st.markdown("""
-                <div class="snomed-container">
-                    <div class="snomed-header">📚 SNOMED CT Medical Terminology Matches</div>
-                    <div class="snomed-content">
-                """, unsafe_allow_html=True)
-                
-                for term, matches in patient_snomed.items():
-                    if matches:  # Only show terms with matches
-                        st.markdown(f'<div class="snomed-term"><div class="snomed-term-title">🔍 {term.title()}</div>', unsafe_allow_html=True)
-                        for cid, label, semantic_tag, score in matches[:5]:  # Show top 3 matches
-                            confidence = "High" if score > 0.8 else "Medium" if score > 0.5 else "Low"
-                            st.markdown(f"""
-                            <div class="snomed-match">
-                                <span>
-                                    <span class="concept-id">{cid}</span> - {label}
-                                </span>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.markdown('</div></div>', unsafe_allow_html=True)
-            else:
-                st.markdown("""
-                <div class="content-box" style="border-left-color: #6b7280;">
-                    <em>No SNOMED CT matches found or no specific medical terms identified</em>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            st.markdown('<div class="success-message">✅ Patient analysis completed successfully</div>', unsafe_allow_html=True)
-
-        # Display previously processed patient data if it exists
-        elif hasattr(st.session_state, 'patient_transcription'):
-            transcription_result = st.session_state.patient_transcription
-            lang_name = transcription_result['detected_language'].title()
-            
-            if transcription_result['translated']:
-                st.markdown(f'<span class="language-badge">🌐 Detected: {lang_name} → Translated to English</span>', unsafe_allow_html=True)
-                
-                if transcription_result['original_text'] != transcription_result['english_text']:
-                    st.markdown("**📝 Original Transcript:**")
-                    st.markdown(f'<div class="content-box transcript-box" style="border-left-color: #f59e0b;">{transcription_result["original_text"]}</div>', unsafe_allow_html=True)
-                
-                st.markdown("**📝 English Translation:**")
-                st.markdown(f'<div class="content-box transcript-box">{transcription_result["english_text"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<span class="language-badge">🇺🇸 Detected: English</span>', unsafe_allow_html=True)
-                st.markdown("**📝 Patient Transcript:**")
-                st.markdown(f'<div class="content-box transcript-box">{transcription_result["english_text"]}</div>', unsafe_allow_html=True)
-            
-            if hasattr(st.session_state, 'patient_analysis'):
-                medical_analysis = st.session_state.patient_analysis
-                
-                # Display medical analysis
-                col_diseases, col_symptoms = st.columns(2)
-                
-                with col_diseases:
-                    st.markdown("**🏥 Medical Conditions:**")
-                    if medical_analysis['diseases']:
-                        diseases_html = '<div class="content-box diseases-box">'
-                        for disease in medical_analysis['diseases']:
-                            diseases_html += f'<span class="disease-tag">{disease.title()}</span>'
-                        diseases_html += '</div>'
-                        st.markdown(diseases_html, unsafe_allow_html=True)
-                
-                with col_symptoms:
-                    st.markdown("**🩺 Symptoms Reported:**")
-                    if medical_analysis['symptoms']:
-                        symptoms_html = '<div class="content-box" style="border-left-color: #f59e0b; background: #fffbeb;">'
-                        for symptom in medical_analysis['symptoms']:
-                            symptoms_html += f'<span class="disease-tag" style="background: linear-gradient(135deg, #f59e0b, #d97706);">{symptom.title()}</span>'
-                        symptoms_html += '</div>'
-                        st.markdown(symptoms_html, unsafe_allow_html=True)
-                
-                # Show severity and urgency
-                severity_color = {
-                    'mild': '#10b981', 'moderate': '#f59e0b', 
-                    'severe': '#ef4444', 'critical': '#dc2626'
-                }.get(medical_analysis.get('severity', 'unknown'), '#6b7280')
-                
-                urgency_color = {
-                    'low': '#10b981', 'medium': '#f59e0b', 
-                    'high': '#ef4444', 'emergency': '#dc2626'
-                }.get(medical_analysis.get('urgency', 'unknown'), '#6b7280')
-
-                col_sev, col_urg = st.columns(2)
-                with col_sev:
-                    st.markdown(f"""
-                    <div class="content-box" style="border-left-color: {severity_color};">
-                        <strong>⚕️ Severity:</strong> <span style="color: {severity_color}; font-weight: 600;">{medical_analysis.get('severity', 'Unknown').title()}</span>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                with col_urg:
-                    st.markdown(f"""
-                    <div class="content-box" style="border-left-color: {urgency_color};">
-                        <strong>🚨 Urgency:</strong> <span style="color: {urgency_color}; font-weight: 600;">{medical_analysis.get('urgency', 'Unknown').title()}</span>
-                    </div>
-                    """, unsafe_allow_html=True)
-            
-            if hasattr(st.session_state, 'patient_snomed') and st.session_state.patient_snomed:
-                st.markdown("""
-                <div class="snomed-container">
-                    <div class="snomed-header">📚 SNOMED CT Medical Terminology Matches</div>
-                    <div class="snomed-content">
-                """, unsafe_allow_html=True)
-                
-                for term, matches in st.session_state.patient_snomed.items():
-                    if matches:
-                        st.markdown(f'<div class="snomed-term"><div class="snomed-term-title">🔍 {term.title()}</div>', unsafe_allow_html=True)
-                        for match_data in matches[:5]:
-                            if len(match_data) >= 4:
-                                cid, label, semantic_tag, score = match_data
-                                confidence = "High" if score > 0.8 else "Medium" if score > 0.5 else "Low"
-                                st.markdown(f"""
-                                <div class="snomed-match">
-                                    <span>
-                                        <span class="concept-id">{cid}</span> - {label}
-                                    </span>
-                                </div>
-                                """, unsafe_allow_html=True)
-                            else:
-                                # Fallback for old format
-                                cid, label = match_data[:2]
-                                st.markdown(f'<div class="snomed-match"><span class="concept-id">{cid}</span><span>{label}</span></div>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.markdown('</div></div>', unsafe_allow_html=True)
-                st.markdown('<div class="success-message">✅ Patient analysis completed successfully</div>', unsafe_allow_html=True)
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-# --- DOCTOR SIDE ---
-with col2:
-    with st.container():
-        st.markdown("""
-        <div class="recording-section">
-            <div class="section-header">
-                <div class="section-icon">👨‍⚕️</div>
-                <div>
-                    <div class="section-title">Doctor Portal</div>
-                    <div class="section-subtitle">Record diagnosis in any language</div>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
-        
-        # Audio input container
-        st.markdown("""
-        <div class="audio-container">
-            <h4 style="margin: 0 0 10px 0; color: #374151;">🎙️ Record diagnosis & prescription</h4>
-            <p style="margin: 0; color: #6b7280; font-size: 14px;">Provide medical assessment in your preferred language - automatic translation included</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        doctor_audio = st.audio_input("Record Doctor Notes", key="doctor_audio")
-
-        # Only process doctor audio if it's new
-        if doctor_audio and (not hasattr(st.session_state, 'doctor_audio_processed') or 
-                            st.session_state.get('doctor_audio_hash') != hash(doctor_audio.getbuffer().tobytes())):
-            
-            # Mark this audio as being processed and store its hash
-            st.session_state.doctor_audio_processed = True
-            st.session_state.doctor_audio_hash = hash(doctor_audio.getbuffer().tobytes())
-            
-            filepath = save_audio_file(doctor_audio, username + "_doctor", "doctors_recordings")
-            st.markdown(f'<div class="success-message">✅ Doctor audio saved as <code>{os.path.basename(filepath)}</code></div>', unsafe_allow_html=True)
-
-            # Enhanced Transcription for Doctor
-            st.markdown('<div class="processing-message">🔄 Converting doctor notes to text with language detection...</div>', unsafe_allow_html=True)
-            with st.spinner("Transcribing and translating doctor's assessment..."):
-                doctor_transcription = transcribe_audio_multilingual(filepath)
-                st.session_state.doctor_transcription = doctor_transcription
-
-            # Display doctor language detection and transcription
-            lang_name = doctor_transcription['detected_language'].title()
-            if doctor_transcription['translated']:
-                st.markdown(f'<span class="language-badge">🌐 Detected: {lang_name} → Translated to English</span>', unsafe_allow_html=True)
-                
-                if doctor_transcription['original_text'] != doctor_transcription['english_text']:
-                    st.markdown("**📝 Original Assessment:**")
-                    st.markdown(f'<div class="content-box transcript-box" style="border-left-color: #f59e0b;">{doctor_transcription["original_text"]}</div>', unsafe_allow_html=True)
-                
-                st.markdown("**📝 English Translation:**")
-                st.markdown(f'<div class="content-box transcript-box">{doctor_transcription["english_text"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<span class="language-badge">🇺🇸 Detected: English</span>', unsafe_allow_html=True)
-                st.markdown("**📝 Doctor's Assessment:**")
-                st.markdown(f'<div class="content-box transcript-box">{doctor_transcription["english_text"]}</div>', unsafe_allow_html=True)
-
-            # SNOMED Matching for treatments
-            st.markdown('<div class="processing-message">🔬 Processing treatment terminology...</div>', unsafe_allow_html=True)
-            with st.spinner("Analyzing treatment codes..."):
-                # Extract treatment terms from doctor's transcript
-                treatment_terms = [doctor_transcription['english_text']]
-                doctor_snomed = search_snomed_terms(treatment_terms)
-                st.session_state.doctor_snomed = doctor_snomed
-
-            # Generate Enhanced Clinical Note
-            if hasattr(st.session_state, 'patient_transcription'):
-                st.markdown('<div class="processing-message">📋 Generating comprehensive clinical note with AI...</div>', unsafe_allow_html=True)
-                with st.spinner("Creating enhanced clinical documentation..."):
-                    note = generate_clinical_note_enhanced(
-                        st.session_state.patient_transcription['english_text'],
-                        st.session_state.patient_analysis,
-                        st.session_state.doctor_transcription['english_text'],
-                        st.session_state.doctor_snomed,
-                        st.session_state.patient_transcription,
-                        st.session_state.doctor_transcription
-                    )
-                    st.session_state.clinical_note = note
-                
-                # Display enhanced clinical note
-                st.markdown("""
-                <div class="clinical-note-container">
-                    <div class="clinical-note-header">
-                        <div class="clinical-note-title">📋 Enhanced Clinical Documentation</div>
-                    </div>
-                    <div class="clinical-note-content">
-                """, unsafe_allow_html=True)
-                
-                st.markdown(note)
-                
-                st.markdown("""
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown('<div class="success-message">✅ Enhanced clinical note generated successfully</div>', unsafe_allow_html=True)
-            else:
-                st.markdown("""
-                <div class="content-box" style="border-left-color: #f59e0b; background: #fffbeb;">
-                    <p style="margin: 0; color: #92400e;">ℹ️ Please complete patient recording first to generate the comprehensive clinical note.</p>
-                </div>
-                """, unsafe_allow_html=True)
-
-        # Display previously processed doctor data if it exists
-        elif hasattr(st.session_state, 'doctor_transcription'):
-            doctor_transcription = st.session_state.doctor_transcription
-            lang_name = doctor_transcription['detected_language'].title()
-            
-            if doctor_transcription['translated']:
-                st.markdown(f'<span class="language-badge">🌐 Detected: {lang_name} → Translated to English</span>', unsafe_allow_html=True)
-                
-                if doctor_transcription['original_text'] != doctor_transcription['english_text']:
-                    st.markdown("**📝 Original Assessment:**")
-                    st.markdown(f'<div class="content-box transcript-box" style="border-left-color: #f59e0b;">{doctor_transcription["original_text"]}</div>', unsafe_allow_html=True)
-                
-                st.markdown("**📝 English Translation:**")
-                st.markdown(f'<div class="content-box transcript-box">{doctor_transcription["english_text"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<span class="language-badge">🇺🇸 Detected: English</span>', unsafe_allow_html=True)
-                st.markdown("**📝 Doctor's Assessment:**")
-                st.markdown(f'<div class="content-box transcript-box">{doctor_transcription["english_text"]}</div>', unsafe_allow_html=True)
-            
-            # Show clinical note if it exists
-            if hasattr(st.session_state, 'clinical_note'):
-                st.markdown("""
-                <div class="clinical-note-container">
-                    <div class="clinical-note-header">
-                        <div class="clinical-note-title">📋 Enhanced Clinical Documentation</div>
-                    </div>
-                    <div class="clinical-note-content">
-                """, unsafe_allow_html=True)
-                
-                st.markdown(st.session_state.clinical_note)
-                
-                st.markdown("""
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown('<div class="success-message">✅ Enhanced clinical note generated successfully</div>', unsafe_allow_html=True)
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-st.markdown('</div>', unsafe_allow_html=True)
-
-# Enhanced Footer with new features
-st.markdown("""
-<div style="text-align: center; margin-top: 40px; padding: 30px; background: white; border-radius: 16px; box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
-    <h4 style="margin: 0 0 10px 0; color: #374151;">🏥 VoiceRx </h4>
-    <p style="margin: 0 0 10px 0; color: #6b7280; font-size: 14px;">AI-Powered Multi-Language Healthcare Documentation</p>
-    <p style="margin: 5px 0 0 0; color: #9ca3af; font-size: 12px;">Powered by Azure OpenAI GPT-4o & Advanced Medical Terminology</p>
-</div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+import time
+
+# Taken before the imports below, so the first run of a new server process includes their cost
+rerun_started = time.perf_counter()
+
+import streamlit as st
+import os
+from datetime import datetime
+from typing import Optional
+import hashlib
+import html
+import importlib.util
+import logging
+import queue
+import uuid
+
+import metrics
+import ui_render
+from processing import (
+    extract_diseases_enhanced,
+    prewarm_connections,
+    store_transcription,
+    warm_up_snomed_cache
+)
+from pipeline import start_stage, patient_job, doctor_job, note_job
+from jobs import JobQueue
+from result_cache import audio_fingerprint
+from consult_store import CONSULT_FIELDS, ConsultStore
+from audio_store import get_audio_store
+
+# Optional: live capture needs streamlit-webrtc and numpy; imported in live_capture on first use
+LIVE_CAPTURE_AVAILABLE = all(importlib.util.find_spec(name) for name in ("streamlit_webrtc", "numpy"))
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STYLESHEET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "voicerx.css")
+
+# --- Config ---
+st.set_page_config(
+    page_title="VoiceRx",
+    page_icon="🏥",
+    layout="wide",
+    initial_sidebar_state="collapsed"
+)
+
+@st.cache_resource
+def prepare_process() -> float:
+    """
+    One-time setup per server process: load .env and create the recording
+    folders. Returns the time the first run started, for time-to-first-render.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    os.makedirs("voice_recordings", exist_ok=True)
+    os.makedirs("doctors_recordings", exist_ok=True)
+    return rerun_started
+
+first_run_started = prepare_process()
+
+@st.cache_resource
+def start_warm_up():
+    """
+    Open the Azure and Neo4j connections, then preload common SNOMED terms,
+    once per server process and off the render path. The SDKs are imported
+    here rather than by the first consult.
+    """
+    def warm_up():
+        prewarm_connections()
+        warm_up_snomed_cache()
+    return start_stage(warm_up)
+
+start_warm_up()
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Background workers for patient and doctor recordings, shared by every session"""
+    job_queue = JobQueue.from_env({
+        'patient': patient_job,
+        # Queues the note job, which runs once the patient job has finished
+        'doctor': lambda payload, progress: doctor_job(payload, progress, submit_job=job_queue.submit),
+        'note': note_job
+    })
+    job_queue.start()
+    return job_queue
+
+@st.cache_resource
+def get_consult_store() -> ConsultStore:
+    """Persistent consult history, shared by every session; written by a background thread"""
+    return ConsultStore.from_env()
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Prometheus /metrics endpoint on VOICERX_METRICS_PORT, once per server process"""
+    port = int(os.getenv("VOICERX_METRICS_PORT", "0"))
+    if not port:
+        return None
+    logger.info(f"Serving Prometheus metrics on port {port}")
+    return metrics.serve_prometheus(port)
+
+start_metrics_endpoint()
+
+def static_css_served() -> bool:
+    """Whether app/static/ serves .css as text/css (older servers send text/plain, which browsers ignore)"""
+    if not st.get_option("server.enableStaticServing"):
+        return False
+    try:
+        from streamlit.web.server.app_static_file_handler import SAFE_APP_STATIC_FILE_EXTENSIONS
+    except ImportError:
+        return True
+    return ".css" in SAFE_APP_STATIC_FILE_EXTENSIONS
+
+@st.cache_resource
+def stylesheet_tag() -> str:
+    """
+    Link to static/voicerx.css, which the browser fetches once and caches
+    (versioned by content hash). Where static serving is off (see
+    .streamlit/config.toml) or can't serve CSS, the stylesheet is inlined.
+    """
+    with open(STYLESHEET, encoding="utf-8") as f:
+        css = f.read()
+    if not static_css_served():
+        return f"<style>{css}</style>"
+    version = hashlib.sha256(css.encode()).hexdigest()[:12]
+    return f'<link rel="stylesheet" href="app/static/voicerx.css?v={version}">'
+
+# Custom CSS matching ABHA profile style
+st.markdown(stylesheet_tag(), unsafe_allow_html=True)
+
+# --- Helper Functions ---
+def upload_fingerprint(audio_file, role: str) -> str:
+    """
+    SHA-256 of an uploaded recording, computed once per upload.
+    Reruns with the same upload (same file_id) reuse the stored digest
+    instead of hashing the whole buffer again.
+    """
+    file_id = getattr(audio_file, 'file_id', None)
+    stored = st.session_state.get(f'{role}_audio_fingerprint')
+    if file_id is not None and stored and stored[0] == file_id:
+        return stored[1]
+    fingerprint = audio_fingerprint(audio_file.getbuffer())
+    st.session_state[f'{role}_audio_fingerprint'] = (file_id, fingerprint)
+    return fingerprint
+
+def save_audio_file(audio_file, username: str, folder: str, fingerprint: Optional[str] = None) -> str:
+    """
+    Hand an uploaded recording to the audio store, which keeps it in memory
+    for transcription and writes it compressed in the background.
+    Returns the path it is stored under.
+    """
+    # Same recording already stored in this session (e.g. rerun after a reconnect)
+    saved = st.session_state.setdefault('saved_audio_files', {})
+    if fingerprint and fingerprint in saved and get_audio_store().exists(saved[fingerprint]):
+        return saved[fingerprint]
+
+    filepath = get_audio_store().put(audio_file.getvalue(), username, folder, fingerprint)
+    if fingerprint:
+        saved[fingerprint] = filepath
+    return filepath
+
+class LiveRecording:
+    """A finished live capture, exposing the parts of st.audio_input's UploadedFile the app uses"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.file_id = f"live-{audio_fingerprint(data)}"
+
+    def getvalue(self) -> bytes:
+        return self.data
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self.data)
+
+def live_capture(role: str, speaker: str) -> Optional[LiveRecording]:
+    """
+    Stream microphone audio to an IncrementalTranscriber and show the partial
+    transcript while recording. Returns the recording once capture stops.
+    """
+    from streamlit_webrtc import WebRtcMode, webrtc_streamer
+    from live_transcription import IncrementalTranscriber, pcm_to_float
+
+    ctx = webrtc_streamer(
+        key=f"{role}_live",
+        mode=WebRtcMode.SENDONLY,
+        audio_receiver_size=1024,
+        media_stream_constraints={"audio": True, "video": False}
+    )
+    session_key = f"{role}_live_transcriber"
+    if ctx.state.playing and ctx.audio_receiver:
+        transcriber = st.session_state.get(session_key)
+        if transcriber is None:
+            # Start disease extraction on the settled part of the transcript while the speaker talks;
+            # the patient job joins the latest one when the final transcript matches it
+            transcriber = IncrementalTranscriber(on_stable=lambda text: start_stage(extract_diseases_enhanced, text))
+            st.session_state[session_key] = transcriber
+        placeholder = st.empty()
+        while ctx.state.playing:
+            try:
+                frames = ctx.audio_receiver.get_frames(timeout=1)
+            except queue.Empty:
+                # Still redraw below: each Streamlit call lets a stop or rerun end this loop
+                frames = []
+            for frame in frames:
+                transcriber.feed(pcm_to_float(frame.to_ndarray(), len(frame.layout.channels)), frame.sample_rate)
+            placeholder.markdown(
+                f'<div class="content-box transcript-box">{html.escape(transcriber.stable_text)} '
+                f'<span style="color: #9ca3af;">{html.escape(transcriber.unstable_text)}</span></div>',
+                unsafe_allow_html=True
+            )
+        return None
+
+    transcriber = st.session_state.pop(session_key, None)
+    if transcriber is not None:
+        try:
+            with st.spinner("Finishing transcript..."):
+                result = transcriber.finish()
+        except Exception as e:
+            # The recording is still processed, transcribed like an upload
+            logger.error(f"Live transcript could not be finished: {str(e)}")
+            st.warning("The live transcript could not be finished; the recording will be transcribed in full.")
+            result = None
+        recording = LiveRecording(transcriber.wav_bytes())
+        if result is not None:
+            store_transcription(recording.getvalue(), result, speaker=speaker)
+        st.session_state[f"{role}_live_recording"] = (recording, result)
+    stored = st.session_state.get(f"{role}_live_recording")
+    return stored[0] if stored else None
+
+JOB_STAGE_MESSAGES = {
+    'patient_transcription': '🔄 Converting speech to text with language detection...',
+    'patient_analysis': '🔍 Advanced analysis of symptoms and medical conditions...',
+    'patient_snomed': '🔬 Matching SNOMED CT medical terminology...',
+    'doctor_transcription': '🔄 Converting doctor notes to text with language detection...',
+    'doctor_snomed': '🔬 Processing treatment terminology...',
+    'doctor_waiting': '⏳ Waiting for the patient analysis...',
+    'clinical_note': '📋 Generating comprehensive clinical note with AI...',
+}
+
+@st.fragment(run_every=0.5)
+def show_job_progress(role: str):
+    """
+    Poll the role's background job without rerunning the whole page. Once it
+    finishes, its result is copied into session state and the app reruns. A
+    doctor job hands over to the note job it queued (note_job_id).
+    """
+    job = get_job_queue().get(st.session_state[f'{role}_job_id'])
+    if job is None or job['status'] in ('succeeded', 'failed'):
+        if job is not None and job['status'] == 'succeeded':
+            next_job_id = job['result'].pop('note_job_id', None)
+            st.session_state.update(job['result'])
+            save_consult()
+            if next_job_id:
+                st.session_state[f'{role}_job_id'] = next_job_id
+                st.rerun()
+        else:
+            st.session_state[f'{role}_job_error'] = job['error'] if job else "job not found"
+        del st.session_state[f'{role}_job_id']
+        st.rerun()
+
+    progress = job['progress']
+    if job['status'] == 'queued' and job['after']:
+        stage = 'doctor_waiting'
+    else:
+        stage = progress.get('stage', 'clinical_note' if job['kind'] == 'note' else f'{role}_transcription')
+    st.markdown(f'<div class="processing-message">{JOB_STAGE_MESSAGES[stage]}</div>', unsafe_allow_html=True)
+    if job['error']:
+        st.caption(f"Retrying after an error (attempt {job['attempts']}): {job['error']}")
+
+    if progress.get('clinical_note'):
+        # Partial note, as GPT-4o streams it into the job
+        st.markdown(progress['clinical_note'])
+
+def save_consult():
+    """Queue the session's consult for the consult store and link the page URL to it"""
+    consult_id = st.session_state.setdefault('consult_id', uuid.uuid4().hex)
+    get_consult_store().save({
+        'consult_id': consult_id,
+        'user': username,
+        'patient': st.session_state.get('patient_id') or None,
+        **{field: st.session_state.get(field) for field in CONSULT_FIELDS}
+    })
+    st.query_params['consult'] = consult_id
+
+def restore_consult(consult_id: str) -> bool:
+    """Load a stored consult into session state, replacing the current one; call before the portals render"""
+    consult = get_consult_store().load(consult_id)
+    if consult is None or consult['user'] != username:
+        return False
+    for field in CONSULT_FIELDS + ('patient_trace', 'doctor_trace', 'note_trace', 'patient_job_error', 'doctor_job_error',
+                                   'patient_job_id', 'doctor_job_id'):
+        st.session_state.pop(field, None)
+    st.session_state.update({field: consult[field] for field in CONSULT_FIELDS if consult.get(field) is not None})
+    st.session_state.consult_id = consult_id
+    st.session_state.patient_id = consult['patient'] or ""
+    st.query_params['consult'] = consult_id
+    return True
+
+def show_consult_metrics():
+    """Per-consult latency and cost summary from the patient and doctor job traces"""
+    traces = [st.session_state[key] for key in ('patient_trace', 'doctor_trace', 'note_trace') if key in st.session_state]
+    if not traces:
+        return
+    counters = {}
+    for trace in traces:
+        for name, value in trace['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    hits = sum(value for name, value in counters.items() if name.endswith('.hit'))
+    misses = sum(value for name, value in counters.items() if name.endswith('.miss'))
+
+    with st.expander("⏱️ Consult performance"):
+        col_time, col_audio, col_tokens, col_cost, col_cache = st.columns(5)
+        col_time.metric("Processing time", f"{sum(t['seconds'] for t in traces):.1f}s")
+        col_audio.metric("Audio", f"{counters.get('audio.seconds', 0):.0f}s",
+                         f"{counters.get('audio.bytes_uploaded', 0) / 1024:.0f} KB uploaded", delta_color="off")
+        col_tokens.metric("Tokens", f"{counters.get('tokens.prompt', 0) + counters.get('tokens.completion', 0):.0f}",
+                          f"{counters.get('tokens.completion', 0):.0f} completion", delta_color="off")
+        col_cost.metric("Estimated cost",
+                        f"${counters.get('cost.whisper_usd', 0) + counters.get('cost.chat_usd', 0):.4f}")
+        col_cache.metric("Cache hits", f"{hits:.0f}/{hits + misses:.0f}")
+        st.dataframe(
+            [
+                {
+                    'recording': trace['consult_id'],
+                    'span': f"{'  ' if span['parent'] not in (None, 'consult') else ''}{span['name']}",
+                    'start (s)': span['start'],
+                    'seconds': span['seconds'],
+                    'details': ", ".join(f"{k}={v}" for k, v in span['attributes'].items() if v is not None)
+                }
+                for trace in traces for span in trace['spans'] if span['name'] != 'consult'
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
+# --- MAIN APPLICATION ---
+
+# Set default user as user104 (always signed in)
+username = "user104"
+
+# Main Header with user info
+st.markdown(f"""
+    <div class="main-header">
+        <div class="welcome-section">
+            <h1 class="welcome-title">🎤 VoiceRx - AI Clinical Notes</h1>
+            <p class="welcome-subtitle">Multi-language voice recordings to structured clinical documentation</p>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+# Main container
+st.markdown('<div class="profile-container">', unsafe_allow_html=True)
+
+# Open the consult picked in the history, or the one linked from the URL (e.g. after a reload)
+if 'open_consult' in st.session_state:
+    restore_consult(st.session_state.pop('open_consult'))
+elif 'consult' in st.query_params and 'consult_id' not in st.session_state:
+    if not restore_consult(st.query_params['consult']):
+        del st.query_params['consult']
+
+# --- PATIENT SIDE ---
+@st.fragment
+def patient_portal():
+    """Patient recording and results; interacting with it reruns only this fragment"""
+    with st.container(), metrics.span("ui.patient_portal"):
+        st.markdown("""
+        <div class="recording-section">
+            <div class="section-header">
+                <div class="section-icon">👨‍🏫</div>
+                <div>
+                    <div class="section-title">Patient Portal</div>
+                    <div class="section-subtitle">Record your symptoms in any language</div>
+                </div>
+            </div>
+        """, unsafe_allow_html=True)
+        
+        # Audio input container
+        st.markdown("""
+        <div class="audio-container">
+            <h4 style="margin: 0 0 10px 0; color: #374151;">🎙️ Record symptoms in any language</h4>
+            <p style="margin: 0; color: #6b7280; font-size: 14px;">Speak naturally in your preferred language - we'll handle the translation automatically</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.text_input("Patient ID", key="patient_id", placeholder="Optional - used to find this consult later")
+
+        live_mode = LIVE_CAPTURE_AVAILABLE and st.toggle(
+            "Live transcription", key="patient_live_mode",
+            help="Transcribe while the patient is speaking"
+        )
+        if live_mode:
+            patient_audio = live_capture('patient', username)
+        else:
+            patient_audio = st.audio_input("Record Patient Symptoms", key="patient_audio")
+
+        patient_fingerprint = upload_fingerprint(patient_audio, 'patient') if patient_audio else None
+
+        # Only process patient audio if it's new
+        if patient_audio and (not hasattr(st.session_state, 'patient_audio_processed') or 
+                            st.session_state.get('patient_audio_hash') != patient_fingerprint):
+            
+            # Mark this audio as being processed and store its hash
+            st.session_state.patient_audio_processed = True
+            st.session_state.patient_audio_hash = patient_fingerprint
+            
+            filepath = save_audio_file(patient_audio, username, "voice_recordings", patient_fingerprint)
+            st.markdown(f'<div class="success-message">✅ Audio saved as <code>{os.path.basename(filepath)}</code></div>', unsafe_allow_html=True)
+
+            # Process in the background; the job's result lands in session state
+            payload = {'filepath': filepath, 'speaker': username, 'audio_sha256': patient_fingerprint}
+            live_recording = st.session_state.get('patient_live_recording')
+            if live_recording and live_recording[0] is patient_audio and live_recording[1] is not None:
+                payload['transcription'] = live_recording[1]
+            # A new patient recording starts a new consult
+            for key in ('patient_transcription', 'patient_analysis', 'patient_snomed', 'patient_trace', 'patient_job_error',
+                        'consult_id'):
+                st.session_state.pop(key, None)
+            st.session_state.patient_job_id = get_job_queue().submit('patient', payload)
+
+        if st.session_state.get('patient_job_id'):
+            show_job_progress('patient')
+
+        elif st.session_state.get('patient_job_error'):
+            st.error(f"Patient analysis failed: {st.session_state.patient_job_error}")
+
+        # Display previously processed patient data if it exists
+        elif hasattr(st.session_state, 'patient_transcription'):
+            st.markdown(ui_render.transcript_html(st.session_state.patient_transcription, 'patient'), unsafe_allow_html=True)
+            if hasattr(st.session_state, 'patient_analysis'):
+                st.markdown(ui_render.analysis_html(st.session_state.patient_analysis), unsafe_allow_html=True)
+            st.markdown(ui_render.snomed_html(st.session_state.get('patient_snomed') or {}), unsafe_allow_html=True)
+            st.markdown('<div class="success-message">✅ Patient analysis completed successfully</div>', unsafe_allow_html=True)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+# --- DOCTOR SIDE ---
+@st.fragment
+def doctor_portal():
+    """Doctor recording and clinical note; interacting with it reruns only this fragment"""
+    with st.container(), metrics.span("ui.doctor_portal"):
+        st.markdown("""
+        <div class="recording-section">
+            <div class="section-header">
+                <div class="section-icon">👨‍⚕️</div>
+                <div>
+                    <div class="section-title">Doctor Portal</div>
+                    <div class="section-subtitle">Record diagnosis in any language</div>
+                </div>
+            </div>
+        """, unsafe_allow_html=True)
+        
+        # Audio input container
+        st.markdown("""
+        <div class="audio-container">
+            <h4 style="margin: 0 0 10px 0; color: #374151;">🎙️ Record diagnosis & prescription</h4>
+            <p style="margin: 0; color: #6b7280; font-size: 14px;">Provide medical assessment in your preferred language - automatic translation included</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        doctor_audio = st.audio_input("Record Doctor Notes", key="doctor_audio")
+
+        doctor_fingerprint = upload_fingerprint(doctor_audio, 'doctor') if doctor_audio else None
+
+        # Only process doctor audio if it's new
+        if doctor_audio and (not hasattr(st.session_state, 'doctor_audio_processed') or 
+                            st.session_state.get('doctor_audio_hash') != doctor_fingerprint):
+            
+            # Mark this audio as being processed and store its hash
+            st.session_state.doctor_audio_processed = True
+            st.session_state.doctor_audio_hash = doctor_fingerprint
+            
+            filepath = save_audio_file(doctor_audio, username + "_doctor", "doctors_recordings", doctor_fingerprint)
+            st.markdown(f'<div class="success-message">✅ Doctor audio saved as <code>{os.path.basename(filepath)}</code></div>', unsafe_allow_html=True)
+
+            # The note needs the patient results: pass them, or the patient job to wait for before the note
+            payload = {'filepath': filepath, 'speaker': username + "_doctor", 'audio_sha256': doctor_fingerprint}
+            if st.session_state.get('patient_job_id'):
+                payload['patient_job'] = st.session_state.patient_job_id
+            if hasattr(st.session_state, 'patient_transcription'):
+                payload['patient'] = {
+                    'patient_transcription': st.session_state.patient_transcription,
+                    'patient_analysis': st.session_state.patient_analysis
+                }
+            for key in ('doctor_transcription', 'doctor_phrases', 'doctor_snomed', 'clinical_note', 'doctor_trace',
+                        'note_trace', 'doctor_job_error'):
+                st.session_state.pop(key, None)
+            st.session_state.doctor_job_id = get_job_queue().submit('doctor', payload)
+
+        if st.session_state.get('doctor_job_id'):
+            show_job_progress('doctor')
+
+        elif st.session_state.get('doctor_job_error'):
+            st.error(f"Doctor note processing failed: {st.session_state.doctor_job_error}")
+
+        # Display previously processed doctor data if it exists
+        elif hasattr(st.session_state, 'doctor_transcription'):
+            st.markdown(ui_render.transcript_html(st.session_state.doctor_transcription, 'doctor'), unsafe_allow_html=True)
+
+            # Show clinical note if it exists
+            if hasattr(st.session_state, 'clinical_note'):
+                st.markdown("""
+                <div class="clinical-note-container">
+                    <div class="clinical-note-header">
+                        <div class="clinical-note-title">📋 Enhanced Clinical Documentation</div>
+                    </div>
+                    <div class="clinical-note-content">
+                """, unsafe_allow_html=True)
+                
+                st.markdown(st.session_state.clinical_note)
+                
+                st.markdown("""
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                st.markdown('<div class="success-message">✅ Enhanced clinical note generated successfully</div>', unsafe_allow_html=True)
+            else:
+                st.markdown("""
+                <div class="content-box" style="border-left-color: #f59e0b; background: #fffbeb;">
+                    <p style="margin: 0; color: #92400e;">ℹ️ Please complete patient recording first to generate the comprehensive clinical note.</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+# Create two columns for patient and doctor sections
+col1, col2 = st.columns(2, gap="large")
+with col1:
+    patient_portal()
+with col2:
+    doctor_portal()
+
+st.markdown('</div>', unsafe_allow_html=True)
+
+show_consult_metrics()
+
+HISTORY_PERIODS = {'Last 7 days': 7, 'Last 30 days': 30, 'This month': None, 'All time': 0}
+
+@st.fragment
+def consult_history():
+    """Search this user's stored consults by text, SNOMED CT concept ID, patient and period"""
+    with st.expander("🗂️ Consult history"):
+        col_text, col_concept, col_patient, col_period = st.columns([3, 2, 2, 2])
+        text = col_text.text_input("Search transcripts and notes", key="history_text")
+        concept_id = col_concept.text_input("SNOMED CT concept ID", key="history_concept", placeholder="e.g. 25064002")
+        patient = col_patient.text_input("Patient ID", key="history_patient")
+        period = col_period.selectbox("Period", list(HISTORY_PERIODS), index=1, key="history_period")
+
+        now = datetime.now()
+        days = HISTORY_PERIODS[period]
+        if days is None:
+            since = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+        else:
+            since = now.timestamp() - days * 86400 if days else None
+
+        started = time.perf_counter()
+        consults = get_consult_store().search(
+            text=text.strip() or None, concept_id=concept_id.strip() or None, user=username,
+            patient=patient.strip() or None, since=since, limit=20
+        )
+        st.caption(f"{len(consults)} consults ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        for consult in consults:
+            col_when, col_summary, col_open = st.columns([2, 7, 1])
+            col_when.markdown(f"**{datetime.fromtimestamp(consult['created']):%d %b %Y %H:%M}**  \n"
+                              f"{consult['patient'] or 'No patient ID'}")
+            col_summary.markdown(consult['snippet'] or "_No transcript_")
+            if col_open.button("Open", key=f"open_{consult['consult_id']}"):
+                st.session_state.open_consult = consult['consult_id']
+                st.rerun(scope="app")
+
+consult_history()
+
+# Enhanced Footer with new features
+st.markdown("""
+<div style="text-align: center; margin-top: 40px; padding: 30px; background: white; border-radius: 16px; box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
+    <h4 style="margin: 0 0 10px 0; color: #374151;">🏥 VoiceRx </h4>
+    <p style="margin: 0 0 10px 0; color: #6b7280; font-size: 14px;">AI-Powered Multi-Language Healthcare Documentation</p>
+    <p style="margin: 5px 0 0 0; color: #9ca3af; font-size: 12px;">Powered by Azure OpenAI GPT-4o & Advanced Medical Terminology</p>
+</div>
+""", unsafe_allow_html=True)
+
+rerun_seconds = time.perf_counter() - rerun_started
+metrics.observe("ui.rerun.seconds", rerun_seconds)
+if rerun_started == first_run_started:
+    metrics.observe("ui.first_render.seconds", rerun_seconds)
+    logger.info(f"First render of this server process took {rerun_seconds:.2f}s")